@@ -0,0 +1,227 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import storage
+from binning import TIME_BIN, TIME_BINS, TIME_START, YearHistogram
+from sketch import SketchSet
+
+# Finishers are grouped by these columns; a column missing from a year groups as missing
+KEYS = ['year', 'gender', 'nationality', 'age_class']
+
+# Quantiles of the finish time kept per group, and the names of their columns
+QUANTILES = [0.25, 0.5, 0.75]
+QUANTILE_COLUMNS = ['time_q25', 'time_median', 'time_q75']
+
+
+def cache_dir(dataset: str) -> str:
+    """
+    Directory the aggregates of a dataset are cached in, next to the dataset itself.
+    """
+    return os.path.normpath(dataset) + '_aggregates'
+
+
+def summary_path(dataset: str, year: int) -> str:
+    return os.path.join(cache_dir(dataset), f'summary-{year}.parquet')
+
+
+def histogram_path(dataset: str, year: int) -> str:
+    return os.path.join(cache_dir(dataset), f'histogram-{year}.parquet')
+
+
+def sketches_path(dataset: str, year: int) -> str:
+    return os.path.join(cache_dir(dataset), f'sketches-{year}.parquet')
+
+
+def summarize(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Aggregate finishers per (year, gender, nationality, age class) in one grouped pass.
+
+    Rows are assigned a group number once and sorted once by (group, finish
+    time); counts, sums, extremes and quantiles of every group are then read
+    off the sorted array with bincount and index arithmetic, and the finish
+    time histogram per (year, gender) comes from the same arrays.
+
+    Args:
+        df (pd.DataFrame): Results with a 'time_full' column in seconds
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Summary with one row per group, and the non-empty
+            histogram bins as (year, gender, bin_start, finishers) rows
+    """
+    keys = pd.DataFrame({key: df[key].astype('string') if key in df.columns else pd.NA
+                         for key in KEYS if key != 'year'}, index=df.index, dtype='string')
+    keys.insert(0, 'year', df['year'].astype('Int16'))
+    grouped = keys.groupby(KEYS, dropna=False, sort=True)
+    group = grouped.ngroup().to_numpy()
+    summary = grouped.size().rename('finishers').reset_index()
+    n_groups = len(summary)
+
+    seconds = pd.to_numeric(df['time_full'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    timed = seconds > 0
+    order = np.lexsort((seconds[timed], group[timed]))
+    sorted_group = group[timed][order]
+    sorted_seconds = seconds[timed][order]
+
+    count = np.bincount(sorted_group, minlength=n_groups)
+    start = np.cumsum(count) - count
+    has_time = count > 0
+    spread = np.maximum(count - 1, 0)
+    summary['timed'] = count
+    summary['time_sum'] = np.bincount(sorted_group, weights=sorted_seconds, minlength=n_groups)
+    summary['time_mean'] = np.where(has_time, summary['time_sum'] / np.maximum(count, 1), np.nan)
+    summary['time_min'] = pick(sorted_seconds, start, has_time)
+    summary['time_max'] = pick(sorted_seconds, start + spread, has_time)
+    for q, column in zip(QUANTILES, QUANTILE_COLUMNS):
+        # Linear interpolation between the closest ranks, as np.quantile does
+        position = start + q * spread
+        lo = np.floor(position).astype(np.int64)
+        below = pick(sorted_seconds, lo, has_time)
+        above = pick(sorted_seconds, np.ceil(position).astype(np.int64), has_time)
+        summary[column] = below + (position - lo) * (above - below)
+
+    year_gender = summary[['year', 'gender']].iloc[sorted_group]
+    histogram = YearHistogram(summary['year'].dropna().astype(int))
+    # Finishers without a gender still count towards the per-year totals, under ''
+    histogram.add(year_gender['year'].to_numpy(), year_gender['gender'].fillna('').to_numpy(), sorted_seconds)
+    return summary, histogram_rows(histogram)
+
+
+def pick(values: np.ndarray, index: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    values[index] where valid, NaN elsewhere (where index may point past the end).
+    """
+    result = np.full(len(index), np.nan)
+    result[valid] = values[index[valid]]
+    return result
+
+
+def histogram_rows(histogram: YearHistogram) -> pd.DataFrame:
+    """
+    Non-empty bins of a histogram as a long (year, gender, bin_start, finishers) table.
+    """
+    frames = []
+    for gender, counts in histogram.counts.items():
+        year_index, bin_index = np.nonzero(counts)
+        frames.append(pd.DataFrame({
+            'year': histogram.years[year_index].astype(np.int16),
+            'gender': pd.array([gender] * len(year_index), dtype='string'),
+            'bin_start': (histogram.start + histogram.width * bin_index).astype(np.int32),
+            'finishers': counts[year_index, bin_index],
+        }))
+    if not frames:
+        return pd.DataFrame({'year': pd.array([], dtype='int16'), 'gender': pd.array([], dtype='string'),
+                             'bin_start': pd.array([], dtype='int32'), 'finishers': pd.array([], dtype='int64')})
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_table(df: pd.DataFrame, path: str):
+    tmp_path = path + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def build_year(year: int, dataset: str) -> List[str]:
+    """
+    Aggregate one year partition of the dataset into the cache.
+
+    Returns:
+        List[str]: Cache files written
+    """
+    os.makedirs(cache_dir(dataset), exist_ok=True)
+    df = storage.load(dataset, columns=KEYS + ['time_full'], years=[year])
+    if 'time_full' not in df.columns:
+        df['time_full'] = pd.array([pd.NA] * len(df), dtype='Int32')
+    summary, histogram = summarize(df)
+    sketches = SketchSet()
+    missing = [None] * len(df)
+    sketches.add('berlin', df['year'], df['gender'] if 'gender' in df.columns else missing,
+                 df['age_class'] if 'age_class' in df.columns else missing, df['time_full'])
+    paths = cached_paths(dataset, year)
+    write_table(summary, paths[0])
+    write_table(histogram, paths[1])
+    sketches.save(paths[2] + '.tmp')
+    os.replace(paths[2] + '.tmp', paths[2])
+    return paths
+
+
+def cached_paths(dataset: str, year: int) -> List[str]:
+    return [summary_path(dataset, year), histogram_path(dataset, year), sketches_path(dataset, year)]
+
+
+def build_stage(year: int, paths: List[str], dataset: str) -> List[str]:
+    """
+    berlin_pipeline stage: aggregate the year partition the 'dataset' stage just wrote.
+    """
+    return build_year(year, dataset)
+
+
+def stale_years(dataset: str) -> List[int]:
+    """
+    Years whose cache is missing or older than their partition, e.g. after prepare_berliin.py rewrote the dataset.
+    """
+    stale = []
+    for year in storage.stored_years(dataset):
+        directory = storage.partition_dir(dataset, year)
+        newest = max((os.path.getmtime(os.path.join(directory, name)) for name in os.listdir(directory)), default=0)
+        if not all(os.path.exists(path) and os.path.getmtime(path) >= newest for path in cached_paths(dataset, year)):
+            stale.append(year)
+    return stale
+
+
+def update(dataset: str) -> List[int]:
+    """
+    Rebuild the cache of every stale year and drop the cache of years no longer in the dataset.
+
+    Returns:
+        List[int]: Years rebuilt
+    """
+    stale = stale_years(dataset)
+    for year in stale:
+        build_year(year, dataset)
+    years = set(storage.stored_years(dataset))
+    directory = cache_dir(dataset)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            year = name.rsplit('-', 1)[-1].split('.')[0]
+            if year.isdigit() and int(year) not in years:
+                os.remove(os.path.join(directory, name))
+    return stale
+
+
+def load_summary(dataset: str, years: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    Cached per-group summary of the given years (default all), one row per (year, gender, nationality, age class).
+    """
+    years = storage.stored_years(dataset) if years is None else years
+    frames = [pd.read_parquet(summary_path(dataset, year)) for year in years]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=KEYS)
+
+
+def load_histogram(dataset: str, years: Optional[List[int]] = None) -> YearHistogram:
+    """
+    Cached finish time histograms of the given years (default all) per year and gender.
+    """
+    years = storage.stored_years(dataset) if years is None else years
+    histogram = YearHistogram(years, TIME_START, TIME_BIN, TIME_BINS)
+    for year in years:
+        rows = pd.read_parquet(histogram_path(dataset, year))
+        row = np.searchsorted(histogram.years, rows['year'].to_numpy())
+        time_bin = (rows['bin_start'].to_numpy() - histogram.start) // histogram.width
+        for gender, index in rows.groupby('gender').indices.items():
+            counts = histogram.counts.setdefault(gender, np.zeros((len(histogram.years), histogram.bins),
+                                                                  dtype=np.int64))
+            np.add.at(counts, (row[index], time_bin[index]), rows['finishers'].to_numpy()[index])
+    return histogram
+
+
+def load_sketches(dataset: str, years: Optional[List[int]] = None) -> SketchSet:
+    """
+    Cached finish time sketches of the given years (default all) per (year, gender, age class).
+    """
+    years = storage.stored_years(dataset) if years is None else years
+    return SketchSet.load(sketches_path(dataset, year) for year in years)
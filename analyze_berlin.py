@@ -1,8 +1,22 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
+from matplotlib.colors import LogNorm
+
+import aggregates
+import regression
+import storage
+from binning import box_stats
+from sketch import SketchSet
+
+# Typed dataset written by prepare_berliin.py / berlin_pipeline.py
+data_path = "results/cleaned_marathon_data"  # Replace with your actual dataset directory
+
+# Where --binned writes its charts
+plot_dir = "results/plots"
 
 
 def get_top_100_runners(df):
@@ -19,19 +33,21 @@ def get_top_100_runners(df):
     return top_100_runners
 
 
-# Load the dataset with semicolon delimiters
-file_path = "results/cleaned_marathon_data.csv"  # Replace with your actual file path
-df = pd.read_csv(file_path, sep=";")
-
-# Convert times from seconds to minutes for visualization if already in seconds
-if 'time_full' in df.columns:
-    df['time_full_minutes'] = df['time_full'] / 60
+def finish(output_dir, name):
+    """
+    Show the current chart, or save it to <output_dir>/<name>.png when rendering to files.
+    """
+    if output_dir is None:
+        plt.show()
+    else:
+        plt.savefig(os.path.join(output_dir, f"{name}.png"), dpi=120, bbox_inches="tight")
+        plt.close()
 
-# df = get_top_100_runners(df)
 
-# Example Analysis: Average finishing time by gender
-if 'gender' in df.columns:
-    avg_time_by_gender = df.groupby("gender")["time_full_minutes"].mean()
+def plot_gender_means(summary, output_dir=None):
+    # Example Analysis: Average finishing time by gender, from the cached per-group sums
+    totals = summary.groupby("gender")[["time_sum", "timed"]].sum()
+    avg_time_by_gender = totals["time_sum"] / totals["timed"] / 60
 
     plt.figure(figsize=(8, 5))
     avg_time_by_gender.plot(kind="bar", color=["blue", "orange"], alpha=0.7)
@@ -39,10 +55,11 @@ if 'gender' in df.columns:
     plt.ylabel("Finish Time (Minutes)")
     plt.xlabel("Gender")
     plt.xticks(rotation=0)
-    plt.show()
+    finish(output_dir, "gender_means")
 
-# Example Analysis: Finishing time trends over the years (scatter plot without connecting dots)
-if 'year' in df.columns and 'time_full_minutes' in df.columns:
+
+def plot_time_trends(df, output_dir=None):
+    # Example Analysis: Finishing time trends over the years (scatter plot without connecting dots)
     plt.figure(figsize=(8, 5))
     for gender in df["gender"].unique():
         gender_data = df[df["gender"] == gender]
@@ -53,13 +70,38 @@ if 'year' in df.columns and 'time_full_minutes' in df.columns:
     plt.xlabel("Year")
     plt.legend()
     plt.grid(alpha=0.3)
-    plt.show()
-
-
-# Example Analysis: Nationality distribution among top runners (filtering low counts)
-if 'nationality' in df.columns:
+    finish(output_dir, "time_trends")
+
+
+def plot_time_density(histogram, output_dir=None):
+    """
+    Binned version of plot_time_trends(): finishers per year and minute of finish time, one panel per gender.
+    """
+    if not histogram.counts:
+        print("No finish times to plot.")
+        return
+    groups = sorted(histogram.counts, key=str)
+    year_edges = np.append(histogram.years, histogram.years[-1] + 1) - 0.5
+    minute_edges = histogram.edges / 60
+    vmax = max(counts.max() for counts in histogram.counts.values())
+
+    fig, axes = plt.subplots(1, len(groups), figsize=(6 * len(groups), 5), sharey=True, squeeze=False)
+    for ax, gender in zip(axes[0], groups):
+        counts = np.ma.masked_equal(histogram.counts[gender].T, 0)
+        mesh = ax.pcolormesh(year_edges, minute_edges, counts, norm=LogNorm(vmin=1, vmax=vmax), cmap="viridis")
+        ax.set_title(f"Gender: {gender or 'unknown'}")
+        ax.set_xlabel("Year")
+        ax.grid(alpha=0.3)
+    axes[0][0].set_ylabel("Finish Time (Minutes)")
+    fig.colorbar(mesh, ax=axes[0].tolist(), label="Finishers")
+    fig.suptitle("Finishing Time Trends Over the Years")
+    finish(output_dir, "time_trends")
+
+
+def plot_nationalities(summary, output_dir=None):
+    # Example Analysis: Nationality distribution among top runners (filtering low counts)
     # Filter out nationalities with 20 or fewer occurrences
-    nationality_counts = df["nationality"].value_counts()
+    nationality_counts = summary.groupby("nationality")["finishers"].sum().sort_values(ascending=False)
     filtered_counts = nationality_counts[nationality_counts > 10_000]
 
     plt.figure(figsize=(8, 5))
@@ -68,12 +110,11 @@ if 'nationality' in df.columns:
     plt.ylabel("Count")
     plt.xlabel("Nationality")
     plt.xticks(rotation=0)
-    plt.show()
-else:
-    print("The 'nationality' column is not available in the dataset.")
+    finish(output_dir, "nationalities")
 
-# Example Analysis: Average finish time over the years as a box plot
-if 'year' in df.columns and 'time_full_minutes' in df.columns:
+
+def plot_time_boxes(df, output_dir=None):
+    # Example Analysis: Average finish time over the years as a box plot
     plt.figure(figsize=(10, 6))
     df.boxplot(column='time_full_minutes', by='year', grid=False, notch=True)
     plt.title("Finish Time Distribution Over the Years")
@@ -81,47 +122,134 @@ if 'year' in df.columns and 'time_full_minutes' in df.columns:
     plt.ylabel("Finish Time (Minutes)")
     plt.xlabel("Year")
     plt.xticks(rotation=45)
-    plt.show()
-else:
-    print("The required columns 'year' and 'time_full_minutes' are not available in the dataset.")
-
-
-required_columns = ['time_full', 'split_5k', 'split_10k', 'split_15k', 'split_20k']
-if all(col in df.columns for col in required_columns):
-    # Drop rows with missing values in the required columns
-    df_cleaned = df[required_columns].dropna()
-
-    # Define features (X) and target (y)
-    X = df_cleaned[['split_5k', 'split_10k', 'split_15k', 'split_20k']]
-    y = df_cleaned['time_full']
-
-    # Split the data into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    # Create and train the linear regression model
-    model = LinearRegression()
-    model.fit(X_train, y_train)
-
-    # Make predictions on the test set
-    y_pred = model.predict(X_test)
+    finish(output_dir, "time_boxes")
+
+
+def plot_binned_time_boxes(histogram, output_dir=None):
+    """
+    Binned version of plot_time_boxes(): notched boxes drawn from the per-year histograms.
+    """
+    stats = box_stats(histogram.total(), histogram.edges / 60, histogram.years.tolist())
+    if not stats:
+        print("No finish times to plot.")
+        return
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.bxp(stats, shownotches=True, showfliers=False)
+    ax.set_title("Finish Time Distribution Over the Years")
+    ax.set_ylabel("Finish Time (Minutes)")
+    ax.set_xlabel("Year")
+    ax.tick_params(axis="x", labelrotation=45)
+    finish(output_dir, "time_boxes")
+
+
+def plot_city_trends(sketches, output_dir=None):
+    """
+    Median and interquartile band of the finish time per city and year, merged from quantile sketches.
+    """
+    plt.figure(figsize=(10, 6))
+    for city in sorted({key[0] for key in sketches.keys()}):
+        years = sorted({key[1] for key in sketches.keys() if key[0] == city})
+        q1, med, q3 = np.array([sketches.query(city=city, year=year).quantiles([0.25, 0.5, 0.75])
+                                for year in years]).T / 60
+        line, = plt.plot(years, med, marker="o", label=city.capitalize())
+        plt.fill_between(years, q1, q3, color=line.get_color(), alpha=0.2)
+    plt.title("Finish Time Distribution Over the Years by City")
+    plt.ylabel("Finish Time (Minutes)")
+    plt.xlabel("Year")
+    plt.legend()
+    plt.grid(alpha=0.3)
+    finish(output_dir, "city_trends")
 
-    # Evaluate the model
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
 
-    # Display the results
-    print("Linear Regression Results:")
-    print(f"Mean Squared Error (MSE): {mse:.2f}")
-    print(f"R-squared (R2 Score): {r2:.2f}")
+def plot_regression(data_path, output_dir=None, binned=False):
+    # Fit the finish time on the first splits in one streaming pass, then chart the test rows in a second
+    result = regression.fit_streaming(regression.dataset_batches(data_path))
+    if not result.train.count:
+        print("Required columns for linear regression are not available in the dataset.")
+        return
+    regression.report(result)
 
     # Visualize actual vs predicted times
+    pairs = regression.test_predictions(regression.dataset_batches(data_path), result.model)
     plt.figure(figsize=(8, 5))
-    plt.scatter(y_test, y_pred, alpha=0.7)
-    plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
+    if binned:
+        counts, edges = regression.prediction_histogram(pairs)
+        plt.pcolormesh(edges, edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap="viridis")
+        plt.colorbar(label="Finishers")
+        low, high = edges[0], edges[-1]
+    else:
+        y_test, y_pred = (np.concatenate(values) for values in zip(*pairs))
+        plt.scatter(y_test, y_pred, alpha=0.7)
+        low, high = y_test.min(), y_test.max()
+    plt.plot([low, high], [low, high], 'r--', lw=2)
     plt.title("Actual vs Predicted Finish Times")
     plt.xlabel("Actual Finish Time (seconds)")
     plt.ylabel("Predicted Finish Time (seconds)")
     plt.grid(alpha=0.3)
-    plt.show()
-else:
-    print("Required columns for linear regression are not available in the dataset.")
+    finish(output_dir, "regression")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charts and a regression on the Berlin results")
+    parser.add_argument("--data", default=data_path, help="Dataset directory")
+    parser.add_argument("--binned", action="store_true",
+                        help="Draw the per-finisher charts from histograms and save all charts to files")
+    parser.add_argument("--output", default=plot_dir, help="Directory for the charts of --binned")
+    parser.add_argument("--sketches", nargs="+", default=[], metavar="FILE",
+                        help="Sketch files of other races (see sketch.py build) to compare with Berlin")
+    args = parser.parse_args()
+
+    output_dir = None
+    if args.binned:
+        plt.switch_backend("Agg")
+        os.makedirs(args.output, exist_ok=True)
+        output_dir = args.output
+
+    # Summary charts read the per-year aggregate cache; only years changed since the last run are rescanned
+    aggregates.update(args.data)
+    summary = aggregates.load_summary(args.data)
+    has_times = summary["timed"].sum() > 0
+
+    # Only the per-finisher charts still load raw columns from the typed dataset
+    df = None
+    if has_times and not args.binned:
+        df = storage.load(args.data, columns=['year', 'gender', 'time_full'])
+
+        # Convert times from seconds to minutes for visualization if already in seconds
+        df['time_full_minutes'] = df['time_full'].astype('float64') / 60
+
+    # df = get_top_100_runners(df)
+
+    if summary["gender"].notna().any():
+        plot_gender_means(summary, output_dir)
+
+    histogram = aggregates.load_histogram(args.data) if args.binned else None
+    if has_times:
+        if args.binned:
+            plot_time_density(histogram, output_dir)
+        elif 'gender' in df.columns:
+            plot_time_trends(df, output_dir)
+
+    if summary["nationality"].notna().any():
+        plot_nationalities(summary, output_dir)
+    else:
+        print("The 'nationality' column is not available in the dataset.")
+
+    if has_times:
+        if args.binned:
+            plot_binned_time_boxes(histogram, output_dir)
+        else:
+            plot_time_boxes(df, output_dir)
+    else:
+        print("The required columns 'year' and 'time_full_minutes' are not available in the dataset.")
+
+    if args.sketches:
+        sketches = aggregates.load_sketches(args.data)
+        sketches.merge(SketchSet.load(args.sketches))
+        plot_city_trends(sketches, output_dir)
+
+    plot_regression(args.data, output_dir, binned=args.binned)
+
+
+if __name__ == "__main__":
+    main()
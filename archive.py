@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fetcher import FetchRequest
+
+
+def request_key(request: FetchRequest) -> str:
+    """
+    Stable key of a request: method, URL and sorted params/form data.
+
+    Args:
+        request (FetchRequest): Request to key
+
+    Returns:
+        str: Hex SHA-256 of the canonical request
+    """
+    canonical = json.dumps([
+        request.method.upper(),
+        request.url,
+        sorted((str(k), str(v)) for k, v in (request.params or {}).items()),
+        sorted((str(k), str(v)) for k, v in (request.data or {}).items()),
+    ])
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class PageArchive:
+    """
+    Compressed, content-addressed on-disk archive of fetched responses.
+
+    Bodies are gzip-compressed and stored once per content digest under
+    `root/objects`; a SQLite index maps each request key to its body, the tags
+    it was fetched with (source, year, page, ...) and when it was last used.
+    When the compressed size exceeds `max_bytes` the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, root: str = "archive", max_bytes: int = 2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                method TEXT NOT NULL,
+                url TEXT NOT NULL,
+                params TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+        """)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest + ".gz")
+
+    def put(self, request: FetchRequest, body: str, tags: Optional[Dict[str, Any]] = None):
+        """
+        Store a response body for a request, replacing any earlier one.
+
+        Args:
+            request (FetchRequest): Request the body was fetched with
+            body (str): Response body
+            tags (dict, optional): Metadata used to select entries for replay
+        """
+        raw = body.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(raw, compresslevel=6))
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        key = request_key(request)
+        params = json.dumps({"params": request.params, "data": request.data}, default=str)
+        with self.lock, self.db:
+            replaced = self.db.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR IGNORE INTO objects VALUES (?, ?)", (digest, os.path.getsize(path)))
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, digest, request.method.upper(), request.url, params,
+                             json.dumps(tags or {}, sort_keys=True), now, now))
+            if replaced is not None and replaced[0] != digest:
+                self.release(replaced[0])
+            self.evict()
+
+    def get(self, request: FetchRequest) -> Optional[str]:
+        """
+        Look up the archived body of a request.
+
+        Args:
+            request (FetchRequest): Request to look up
+
+        Returns:
+            Optional[str]: The archived body, or None if it is not archived
+        """
+        key = request_key(request)
+        with self.lock:
+            row = self.db.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.db:
+                self.db.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+        return read_object(self.object_path(row[0]))
+
+    def entries(self, **filters) -> List[Tuple[Dict[str, Any], str]]:
+        """
+        List archived entries whose tags match all given filters.
+
+        Args:
+            **filters: Tag values to match, e.g. source="boston", year=2024
+
+        Returns:
+            List[Tuple[dict, str]]: (tags, object path) per matching entry
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT tags, digest FROM entries").fetchall()
+        matches = []
+        for tags_json, digest in rows:
+            tags = json.loads(tags_json)
+            if all(tags.get(name) == value for name, value in filters.items()):
+                matches.append((tags, self.object_path(digest)))
+        return matches
+
+    def evict(self):
+        """
+        Drop least recently used entries until the archive fits in max_bytes.
+        Must be called with the lock held inside a transaction.
+        """
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Bodies no entry refers to any more, e.g. left behind by an older version that did not release them
+        for (digest,) in self.db.execute("SELECT digest FROM objects WHERE digest NOT IN "
+                                         "(SELECT digest FROM entries)").fetchall():
+            total -= self.release(digest)
+        while total > self.max_bytes:
+            row = self.db.execute("SELECT key, digest FROM entries ORDER BY used LIMIT 1").fetchone()
+            if row is None:
+                break
+            key, digest = row
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= self.release(digest)
+
+    def release(self, digest: str) -> int:
+        """
+        Delete a body once no entry refers to it.
+        Must be called with the lock held inside a transaction.
+
+        Returns:
+            int: Compressed bytes freed
+        """
+        if self.db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None:
+            return 0
+        row = self.db.execute("SELECT size FROM objects WHERE digest = ?", (digest,)).fetchone()
+        self.db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        try:
+            os.remove(self.object_path(digest))
+        except FileNotFoundError:
+            pass
+        return row[0] if row is not None else 0
+
+    def close(self):
+        self.db.close()
+
+
+def read_object(path: str) -> str:
+    with open(path, "rb") as f:
+        return gzip.decompress(f.read()).decode("utf-8")
+
+
+def _parse_archived(job: Tuple[Callable[[str, Dict[str, Any]], Any], Dict[str, Any], str]) -> Any:
+    parse, tags, path = job
+    return parse(read_object(path), tags)
+
+
+def replay(archive: PageArchive, parse: Callable[[str, Dict[str, Any]], Any],
+           order_by: Sequence[str] = (), workers: Optional[int] = None,
+           **filters) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """
+    Re-run a parser over archived pages in parallel, without touching the network.
+
+    Args:
+        archive (PageArchive): Archive to read from
+        parse (Callable): Module-level function called as parse(body, tags)
+        order_by (Sequence[str], optional): Tag names to sort the entries by
+        workers (int, optional): Number of parser processes. Defaults to the core count.
+        **filters: Tag values selecting the entries to replay
+
+    Returns:
+        Iterator[Tuple[dict, Any]]: (tags, parse result) per entry, in order
+    """
+    entries = archive.entries(**filters)
+    entries.sort(key=lambda entry: tuple(entry[0].get(name) for name in order_by))
+    jobs = [(parse, tags, path) for tags, path in entries]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (tags, _), result in zip(entries, executor.map(_parse_archived, jobs, chunksize=4)):
+            yield tags, result
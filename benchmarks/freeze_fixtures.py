@@ -0,0 +1,124 @@
+"""
+Freeze real result pages from the raw page archive into benchmarks/fixtures for benchmarks.parse.
+
+For each fixture this takes the first archived page of its site that has at
+least the wanted number of runners (or the largest one if none has), trims
+it to that many runners, and records where it came from in
+fixtures/SOURCES.json, with "origin": "archive". Only rerun this when a site's markup changes, and
+save a new baseline with benchmarks.parse afterwards: the fixtures are what
+the baseline measured.
+
+Run from the repository root, with an archive filled by a normal crawl:
+
+    python -m benchmarks.freeze_fixtures [--archive archive]
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from lxml import etree
+
+from archive import PageArchive, read_object
+from parsers import BOSTON_ENTRY_CLASSES
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SOURCES_PATH = os.path.join(FIXTURE_DIR, "SOURCES.json")
+
+
+def has_class(cls: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {cls} ")'
+
+
+class Fixture(NamedTuple):
+    """
+    One frozen page.
+
+    Args:
+        name (str): File name in FIXTURE_DIR
+        source (str): `source` tag of the archived pages to take it from
+        entries (str): XPath of one element per runner; those past `rows` are removed
+        rows (int): Runners to keep
+    """
+    name: str
+    source: str
+    entries: str
+    rows: int
+
+
+FIXTURES = (
+    Fixture("boston_1000.html", "boston",
+            '//li[' + ' or '.join(f'normalize-space(@class)="{cls}"' for cls in BOSTON_ENTRY_CLASSES) + ']', 1000),
+    Fixture("marathonguide_100.html", "marathonguide",
+            f'(//table[{has_class("colordataTable")}])[1]/tr[position() > 1]', 100),
+    Fixture("chicago_list_1000.html", "chicago",
+            f'//*[{has_class("list-group-item")}][.//*[{has_class("type-fullname")}]//a]', 1000),
+)
+
+PARSER = etree.HTMLParser(encoding="utf-8")
+
+
+def entries(fixture: Fixture, html: str) -> Tuple[Optional[etree._Element], List[etree._Element]]:
+    root = etree.fromstring(html.encode("utf-8"), PARSER)
+    return root, (root.xpath(fixture.entries) if root is not None else [])
+
+
+def freeze(fixture: Fixture, archive: PageArchive) -> Optional[Dict]:
+    """
+    Pick and trim the page of a fixture.
+
+    Returns:
+        Optional[Dict]: tags, runners on the archived page and the trimmed HTML; None if nothing is archived
+    """
+    best = None
+    for tags, path in sorted(archive.entries(source=fixture.source),
+                             key=lambda entry: json.dumps(entry[0], sort_keys=True)):
+        html = read_object(path)
+        root, found = entries(fixture, html)
+        if best is None or len(found) > len(best[2]):
+            best = (tags, root, found)
+        if len(found) >= fixture.rows:
+            break
+    if best is None or not best[2]:
+        return None
+
+    tags, root, found = best
+    for entry in found[fixture.rows:]:
+        entry.getparent().remove(entry)
+    html = etree.tostring(root, method="html", encoding="unicode", doctype="<!DOCTYPE html>")
+    return {"origin": "archive", "tags": tags, "archived_rows": len(found), "rows": min(len(found), fixture.rows),
+            "html": html}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Freeze archived result pages as parser benchmark fixtures")
+    parser.add_argument("--archive", default="archive", help="Directory of the raw page archive")
+    parser.add_argument("--output", default=FIXTURE_DIR, help="Fixture directory")
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    os.makedirs(args.output, exist_ok=True)
+    sources_path = os.path.join(args.output, os.path.basename(SOURCES_PATH))
+    sources = {}
+    if os.path.exists(sources_path):
+        with open(sources_path, encoding="utf-8") as f:
+            sources = json.load(f)
+
+    for fixture in FIXTURES:
+        frozen = freeze(fixture, archive)
+        if frozen is None:
+            print(f"No archived {fixture.source} pages with results; {fixture.name} left as it is")
+            continue
+        path = os.path.join(args.output, fixture.name)
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(frozen.pop("html"))
+        sources[fixture.name] = frozen
+        print(f"Wrote {path}: {frozen['rows']} of {frozen['archived_rows']} runners of {frozen['tags']}")
+
+    with open(sources_path, "w", encoding="utf-8") as f:
+        json.dump(sources, f, indent=1, sort_keys=True)
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
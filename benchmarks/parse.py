@@ -0,0 +1,217 @@
+"""
+Speed and memory of every results parser on the real pages frozen in benchmarks/fixtures.
+
+For each parser this reports rows per second (fastest of repeated parses,
+which is the least disturbed by other load on the machine),
+the peak memory traced during one parse, and the number of memory blocks
+the parsed rows keep alive. For a site with several backends it also
+reports how many times faster lxml parses than html.parser in the same run.
+
+With --check it compares against the stored baseline and exits non-zero if
+a parser got slower or heavier than the tolerance allows. The speedup of
+lxml over html.parser is compared on any machine. Throughput and memory
+depend on the hardware and library versions, so they are only compared
+with a baseline saved on the same machine (see machine()).
+
+Fixtures come from benchmarks.freeze_fixtures; fixtures/SOURCES.json says
+where each one came from. Run from the repository root:
+
+    python -m benchmarks.parse [--repeat 20] [--check] [--save-baseline]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from lxml import etree
+
+import boston
+import marathonguide
+from benchmarks.freeze_fixtures import FIXTURE_DIR, SOURCES_PATH
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_parse.json")
+
+
+class Case(NamedTuple):
+    """
+    One parser on one fixture.
+
+    Args:
+        name (str): Key of the case in the baseline
+        fixture (str): File name in FIXTURE_DIR
+        parse (Callable[[str], Any]): Parses the page and returns its rows
+    """
+    name: str
+    fixture: str
+    parse: Callable[[str], Any]
+
+
+def cases() -> List[Case]:
+    found = [
+        Case("boston/lxml", "boston_1000.html", lambda html: boston.parse_race_results(html, 2024, "lxml")),
+        Case("boston/html.parser", "boston_1000.html",
+             lambda html: boston.parse_race_results(html, 2024, "html.parser")),
+        Case("marathonguide/lxml", "marathonguide_100.html",
+             lambda html: marathonguide.parse_race_results(html, 2024, "lxml")),
+        Case("marathonguide/html.parser", "marathonguide_100.html",
+             lambda html: marathonguide.parse_race_results(html, 2024, "html.parser")),
+    ]
+    try:
+        import githubChicago
+    except ImportError as e:
+        print(f"Skipping githubChicago.parse_page: {e}")
+    else:
+        found.append(Case("chicago-list/pyquery", "chicago_list_1000.html",
+                          lambda html: githubChicago.parse_page(html, githubChicago.BASE_URL, "man")))
+    return found
+
+
+def measure(case: Case, html: str, repeat: int) -> Dict[str, float]:
+    """
+    Time `repeat` parses after a warm-up, then trace the memory of one more.
+
+    Returns:
+        Dict[str, float]: rows, rows_per_sec, peak_kib and blocks
+    """
+    rows = len(case.parse(html))
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        case.parse(html)
+        times[i] = time.perf_counter() - start
+
+    gc.collect()
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        result = case.parse(html)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        blocks = sys.getallocatedblocks() - blocks
+        del result
+    finally:
+        gc.enable()
+    return {"rows": rows, "rows_per_sec": rows / float(times.min()), "peak_kib": peak / 1024, "blocks": blocks}
+
+
+def machine() -> Dict[str, Any]:
+    """
+    What absolute timings and memory depend on: host, CPU, OS, Python and lxml.
+    """
+    return {"node": platform.node(), "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "system": platform.platform(), "python": platform.python_version(),
+            "lxml": etree.__version__}
+
+
+def speedups(results: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Throughput of lxml over html.parser per site, for the sites both were run on.
+    """
+    return {name.split("/")[0]: result["rows_per_sec"] / results[name.replace("/lxml", "/html.parser")]["rows_per_sec"]
+            for name, result in results.items()
+            if name.endswith("/lxml") and name.replace("/lxml", "/html.parser") in results}
+
+
+def regressions(name: str, result: Dict[str, float], baseline: Dict[str, float], tolerance: float,
+                same_machine: bool) -> List[str]:
+    """
+    What got worse than the baseline by more than `tolerance` (a fraction).
+    """
+    found = []
+    if result["rows"] != baseline["rows"]:
+        found.append(f"{name}: parsed {result['rows']} rows, baseline {baseline['rows']}")
+    if not same_machine:
+        return found
+    if result["rows_per_sec"] < baseline["rows_per_sec"] * (1 - tolerance):
+        found.append(f"{name}: {result['rows_per_sec']:,.0f} rows/s, baseline {baseline['rows_per_sec']:,.0f}")
+    for metric in ("peak_kib", "blocks"):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            found.append(f"{name}: {metric} {result[metric]:,.0f}, baseline {baseline[metric]:,.0f}")
+    return found
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the results parsers on frozen pages")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed parses per parser")
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown or growth (default 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) or {}
+    base_cases = baseline.get("cases", {})
+    same_machine = baseline.get("machine") == machine()
+    if baseline and not same_machine:
+        print(f"Baseline {args.baseline} was saved on another machine: "
+              f"only row counts and lxml speedups are compared")
+    sources = load_baseline(SOURCES_PATH) or {}
+    reconstructed = sorted(name for name, source in sources.items() if source.get("origin") != "archive")
+    if reconstructed:
+        print(f"Not captured from the archive, see {SOURCES_PATH}: {', '.join(reconstructed)}")
+    results, found = {}, []
+    print(f"{'parser':<28} {'rows':>6} {'rows/s':>12} {'vs base':>8} {'peak KiB':>10} {'blocks':>9}")
+    for case in cases():
+        if args.only and args.only not in case.name:
+            continue
+        path = os.path.join(FIXTURE_DIR, case.fixture)
+        if not os.path.exists(path):
+            print(f"{case.name:<28} no fixture {case.fixture}; freeze one with python -m benchmarks.freeze_fixtures")
+            continue
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        result = results[case.name] = measure(case, html, args.repeat)
+        base = base_cases.get(case.name)
+        change = f"{result['rows_per_sec'] / base['rows_per_sec'] - 1:+.0%}" if base and same_machine else "-"
+        print(f"{case.name:<28} {result['rows']:>6} {result['rows_per_sec']:>12,.0f} {change:>8} "
+              f"{result['peak_kib']:>10,.0f} {result['blocks']:>9,}")
+        if base:
+            found += regressions(case.name, result, base, args.tolerance, same_machine)
+
+    base_speedups = baseline.get("speedups", {})
+    for site, speedup in speedups(results).items():
+        base = base_speedups.get(site)
+        print(f"{site + ' lxml speedup':<28} {speedup:>6.1f}x" + (f" (baseline {base:.1f}x)" if base else ""))
+        if base and speedup < base * (1 - args.tolerance):
+            found.append(f"{site}: lxml is {speedup:.1f}x as fast as html.parser, baseline {base:.1f}x")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, {
+            "machine": machine(),
+            # Cases measured on another machine are not comparable with these
+            "cases": {**(base_cases if same_machine else {}), **results},
+            "speedups": {**base_speedups, **speedups(results)},
+        })
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to store one")
+    for message in found:
+        print(f"REGRESSION {message}")
+    if args.check and found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
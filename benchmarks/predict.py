@@ -0,0 +1,82 @@
+"""
+Throughput of batch finish time prediction, as race-day tooling calls it.
+
+Run from the repository root:
+
+    python -m benchmarks.predict [--model results/finish_time_model.json] [--runners 50000]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from regression import FEATURES, MODEL_PATH, LinearModel
+
+# Kilometres of each feature split, for synthetic runners
+SPLIT_KM = np.array([5.0, 10.0, 15.0, 20.0])
+
+
+def live_splits(n: int, seed: int = 0) -> np.ndarray:
+    """
+    (n, 4) int32 split times of synthetic runners, 5% of them without a 20k split yet.
+    """
+    rng = np.random.default_rng(seed)
+    pace = rng.normal(340, 50, n)[:, None]
+    splits = (pace * SPLIT_KM + rng.normal(0, 30, (n, len(SPLIT_KM)))).astype(np.int32)
+    splits[rng.random(n) < 0.05, -1] = -1
+    return splits
+
+
+def time_calls(predict, repeat: int) -> np.ndarray:
+    """
+    Wall time of each of `repeat` calls, after one warm-up call.
+    """
+    predict()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        predict()
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def report(name: str, times: np.ndarray, runners: int):
+    p50, p99 = np.percentile(times, [50, 99]) * 1000
+    print(f"{name:<28} {runners / np.median(times):>14,.0f} runners/s   p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch finish time prediction")
+    parser.add_argument("--model", default=MODEL_PATH, help="Model saved by linear_regression.py --save-model")
+    parser.add_argument("--runners", type=int, default=50_000, help="Runners per call")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed calls per variant")
+    args = parser.parse_args()
+
+    if os.path.exists(args.model):
+        model = LinearModel.load(args.model)
+    else:
+        print(f"{args.model} not found, using a fixed example model")
+        model = LinearModel(-110.0, np.array([-3.06, -3.26, -0.59, 4.98]))
+
+    X = live_splits(args.runners)
+    out = np.empty(args.runners)
+    print(f"{args.runners:,} runners per call, {args.repeat} calls")
+    report("LinearModel.predict", time_calls(lambda: model.predict(X), args.repeat), args.runners)
+    report("LinearModel.predict(out=)", time_calls(lambda: model.predict(X, out=out), args.repeat), args.runners)
+
+    # Baseline: the same model behind sklearn and a DataFrame, as linear_regression.py used to score
+    try:
+        import pandas as pd
+        from sklearn.linear_model import LinearRegression
+    except ImportError:
+        return
+    sklearn_model = LinearRegression()
+    sklearn_model.coef_, sklearn_model.intercept_ = model.coef, model.intercept
+    sklearn_model.n_features_in_, sklearn_model.feature_names_in_ = len(FEATURES), np.array(FEATURES, dtype=object)
+    frame = pd.DataFrame(X, columns=FEATURES)
+    report("sklearn on a DataFrame", time_calls(lambda: sklearn_model.predict(frame), args.repeat), args.runners)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
 #!/usr/bin/env python
 
-from urllib.error import  URLError
-import urllib.request
-import urllib.parse
+import argparse
+import asyncio
 import json
-import time
 import csv
+import functools
 import hashlib
-import re, os, random, operator
+import os, random, operator
+import sys
+import time
+
+import numpy as np
+
+from archive import PageArchive, replay
+from fetcher import Fetcher, FetchRequest
+from identity import NAME_JUNK
+from metrics import REGISTRY
+from timeconv import hms_to_seconds
 
 years = {
     #'1974',
@@ -79,100 +88,167 @@ fieldnames=[
     "name",
 ]
 
-def makeQuery( year, page ):
+def makeRequest( year, page ):
     url = "http://www.bmw-berlin-marathon.com/files/addons/scc_events_data/ajax.results.php"
     params =  { 't': 'BM_{}'.format(year), 'ci': 'MAL', 'page': str(page) }
-    data = urllib.parse.urlencode( params )
-    return url + '?' + data
-
-def getData(year,page=1):
-
-    time.sleep( 5 )
-
-    query = makeQuery( year, page )
-    try:
-        response = urllib.request.urlopen( query )
-    except URLError as e:
-        data = { 'page': None, 'total': None, 'records': None, 'rows': None }
-        if hasattr(e, 'reason'):
-            print("We failed to reach a server.")
-            print("Reason: ", e.reason)
-        elif hasattr(e, 'code'):
-            print("The server couldn't fulfill the request.")
-            print("Error code: ", e.code)
-    except timeout:
-        print("Timed out")
-    else:
-        data = json.loads( response.read().decode('utf-8') )
-
-    return data
-
-def getMeta(year):
-    jData = getData(year)
-    return { 'currentPage': int(jData['page']), 'numOfPages': int(jData['total']), 'numOfEntries': int(jData['records']) }
-
-def cleanData(jData):
-
-    data = [ dict( zip( keys, entry['cell'] ) ) for entry in jData['rows'] ]
+    tags = { 'source': 'berlin', 'year': str(year), 'page': page }
+    return FetchRequest( url, params=params, tags=tags )
 
-    with open('abbreviations.csv') as abvs:
-        rows = csv.DictReader(abvs)
-        abbreviations = { row['Abbreviation']:row['ISO 3166-1 alpha-3'] for row in rows }
-
-    for row in data:
-
-        name = re.sub( r"[-.,_'!?0-9]+|\s+", '', ( row['forename'] + row['surname'] ).lower() )
-        nameHash = hashlib.sha1( name.encode() ).hexdigest()
-        row['name'] = nameHash
-
-        row['nationality'] = abbreviations.get( row['nationality'], row['nationality'] )
-        if not row['nationality']:
-            row['nationality'] = 'XXX'
+async def getData(fetcher,year,page=1):
 
-        ac = row['ageClass']
-        if ac in {'M','W'} or not ac:
-            ac = '0'
-        elif ac[0] in {'M','W'} and len(ac) > 1:
-            ac = ac[1:]
-        if ac == 'JA':
-            ac = 'U20'
-        if ac == 'H':
-            ac = '20'
-        row['ageClass'] = ac
+    # politeness is handled by the fetcher's per-host token bucket
+    body = await fetcher.fetch( makeRequest( year, page ) )
+    if not body:
+        return { 'page': None, 'total': None, 'records': None, 'rows': None }
 
-        netTime = datetime.datetime.strptime( row['netTime'], '%H:%M:%S' )
-        netTimeDelta = datetime.timedelta( hours=netTime.hour, minutes=netTime.minute, seconds=netTime.second )
-        row['netTime'] = netTimeDelta.seconds
+    return json.loads( body )
 
-        clockTime = datetime.datetime.strptime( row['clockTime'], '%H:%M:%S' )
-        clockTimeDelta = datetime.timedelta( hours=clockTime.hour, minutes=clockTime.minute, seconds=clockTime.second )
-        row['clockTime'] = clockTimeDelta.seconds
+async def getMeta(fetcher,year):
+    jData = await getData(fetcher,year)
+    if jData['rows'] is None:
+        return None
+    return { 'currentPage': int(jData['page']), 'numOfPages': int(jData['total']), 'numOfEntries': int(jData['records']) }
 
-        row['place'] = int( row['place'] )
+@functools.lru_cache( maxsize=None )
+def loadAbbreviations( path='abbreviations.csv' ):
+    with open( path ) as abvs:
+        rows = csv.DictReader(abvs)
+        return { row['Abbreviation']:row['ISO 3166-1 alpha-3'] for row in rows }
+
+@functools.lru_cache( maxsize=None )
+def normalizeAgeClass( ac ):
+    if ac in {'M','W'} or not ac:
+        ac = '0'
+    elif ac[0] in {'M','W'} and len(ac) > 1:
+        ac = ac[1:]
+    if ac == 'JA':
+        ac = 'U20'
+    if ac == 'H':
+        ac = '20'
+    return ac
+
+def mapUnique( values, mapping ):
+    # apply a per-value function once per distinct value instead of once per row
+    uniques, inverse = np.unique( values, return_inverse=True )
+    return np.array( [ mapping(u) for u in uniques ], dtype=str )[inverse]
+
+def hashNames( forenames, surnames ):
+    sha1, sub = hashlib.sha1, NAME_JUNK.sub
+    return np.array( [ sha1( sub( '', name ).encode() ).hexdigest() for name in np.char.lower( np.char.add( forenames, surnames ) ) ] )
+
+def cleanBatch(jData):
+    """
+    Clean one page of results into a typed columnar batch.
+
+    Returns a dict of equally long NumPy arrays, one per entry of fieldnames,
+    sorted by place: place, netTime and clockTime are int32 (times in
+    seconds, -1 if blank or unparseable), the other columns are strings.
+    """
+
+    # JSON nulls become blanks, not the string 'None'
+    cells = np.array( [ [ cell if cell is not None else '' for cell in entry['cell'] ] for entry in jData['rows'] ], dtype=str ).reshape( -1, len(keys) )
+    column = { key: cells[:, i] for i, key in enumerate(keys) }
+
+    abbreviations = loadAbbreviations()
+    nationality = mapUnique( column['nationality'], lambda nat: abbreviations.get( nat, nat ) or 'XXX' )
+
+    batch = {
+        'place': np.where( np.char.isdigit( column['place'] ), column['place'], '-1' ).astype( np.int32 ),
+        'netTime': hms_to_seconds( column['netTime'] ),
+        'clockTime': hms_to_seconds( column['clockTime'] ),
+        'yob': column['yob'],
+        'ageClass': mapUnique( column['ageClass'], normalizeAgeClass ),
+        'acPlace': column['acPlace'],
+        'sex': column['sex'],
+        'nationality': nationality,
+        'name': hashNames( column['forename'], column['surname'] ),
+    }
+
+    order = np.argsort( batch['place'], kind='stable' )
+    return { field: values[order] for field, values in batch.items() }
+
+def batchRows(batch):
+    return zip( *( batch[field].tolist() for field in fieldnames ) )
 
-        del row['forename']
-        del row['surname']
-        del row['team']
-        del row['id']
-        del row['bib']
+def cleanData(jData):
+    batch = cleanBatch(jData)
+    return [ dict( zip( fieldnames, row ) ) for row in batchRows(batch) ]
 
-    return sorted( data, key=lambda k: k['place'] )
+def cleanArchived(body,tags):
+    return cleanBatch( json.loads( body ) )
 
 def add2dataset(jData,year):
-    data = cleanData(jData)
+    start = time.perf_counter()
+    batch = cleanBatch(jData)
+    REGISTRY.record_parse( 'berlin', time.perf_counter() - start, len( batch['place'] ) )
+    writeDataset( batch, year )
+
+def writeDataset(batch,year):
+    start = time.perf_counter()
     with open('{}.csv'.format(year),'a') as dataset:
-        dictWriter = csv.DictWriter( dataset, fieldnames )
-        [ dictWriter.writerow(row) for row in data ]
+        csv.writer( dataset ).writerows( batchRows(batch) )
+    REGISTRY.record_write( 'csv', time.perf_counter() - start, len( batch['place'] ) )
+
+def startDataset(year):
+    with open('{}.csv'.format(year),'w') as empty:
+        csv.DictWriter( empty, fieldnames ).writeheader()
+
+def replayYear(archive,year):
+    print("Replaying archived data for year {}...".format(year))
+    startDataset(year)
+    for tags, data in replay( archive, cleanArchived, order_by=('page',), source='berlin', year=str(year) ):
+        print("...page {0}".format(tags['page']))
+        writeDataset( data, year )
+
+async def collectYear(fetcher,year):
+    # returns the pages that could not be fetched, None if not even the first one could
+    print("Collecting data for year {}...".format(year))
+    startDataset(year)
+    meta = await getMeta(fetcher,year)
+    if meta is None:
+        print("...could not fetch the first page for year {}, skipping the year".format(year))
+        return None
+    print("...there are officially {0} records for year {1}".format(meta['numOfEntries'], year))
+    pages = meta['numOfPages']
+    tasks = [ asyncio.ensure_future( getData(fetcher,year,page+1) ) for page in range(pages) ]
+    missing = []
+    for page, task in enumerate(tasks):
+        jData = await task
+        if jData['rows'] is None:
+            print("...page {0} of {1} could not be fetched, skipping it".format(page+1,pages))
+            missing.append(page+1)
+            continue
+        print("...page {0} of {1}".format(page+1,pages))
+        add2dataset( jData, year )
+    return missing
+
+async def collect(archive):
+    # returns the years with missing pages and what is missing: a list of pages, or None for the whole year
+    incomplete = {}
+    async with Fetcher( per_host=2, rate=0.5, burst=2, archive=archive, retries=3 ) as fetcher:
+        for year in sorted(years):
+            missing = await collectYear(fetcher,year)
+            if missing != []:
+                incomplete[year] = missing
+    return incomplete
 
 if __name__ == '__main__':
 
-    for year in years:
-        print("Collecting data for year {}...".format(year))
-        with open('{}.csv'.format(year),'w') as empty:
-            csv.DictWriter( empty, fieldnames ).writeheader()
-        meta = getMeta(year)
-        print("...there are officially {0} records for year {1}".format(meta['numOfEntries'], year))
-        pages = meta['numOfPages']
-        for page in range(pages):
-            print("...page {0} of {1}".format(page+1,pages))
-            add2dataset( getData(year,page+1), year )
\ No newline at end of file
+    parser = argparse.ArgumentParser( description='Collect Berlin Marathon results' )
+    parser.add_argument( '--archive', default='archive', help='Directory of the raw page archive' )
+    parser.add_argument( '--replay', action='store_true', help='Re-parse archived pages instead of fetching' )
+    parser.add_argument( '--metrics', help='Write crawl metrics here: JSON if it ends in .json, else a Prometheus textfile' )
+    parser.add_argument( '--metrics-interval', type=float, help='Also rewrite the metrics every this many seconds' )
+    args = parser.parse_args()
+
+    archive = PageArchive( args.archive )
+    with REGISTRY.reporting( args.metrics, args.metrics_interval ):
+        if args.replay:
+            for year in sorted(years):
+                replayYear(archive,year)
+        else:
+            incomplete = asyncio.run( collect(archive) )
+            if incomplete:
+                sys.exit( 'Incomplete years: ' + '; '.join(
+                    '{0} (all pages)'.format(year) if missing is None else '{0} (pages {1})'.format(year, ', '.join(map(str, missing)))
+                    for year, missing in incomplete.items() ) )
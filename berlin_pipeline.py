@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import os
+from itertools import groupby
+from typing import Callable, Dict, List, NamedTuple
+
+import pandas as pd
+
+import aggregates
+import storage
+from merge_berlin import CHUNK_SIZE, yearly_files
+from prepare_berliin import prepare_chunk
+
+# Yearly results-YYYY.csv files, as read by merge_berlin.py
+INPUT_DIR = "./external_data/Berlin/"
+
+# Typed dataset read by analyze_berlin.py and linear_regression.py
+DATASET = "results/cleaned_marathon_data"
+
+# Content hashes of every input and stage output of the last run
+MANIFEST = "results/berlin_pipeline.json"
+
+
+def manual_prep(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Hand-made cleanup between merge_berlin.py and prepare_berliin.py.
+
+    This step used to be done by hand on the merged CSV and is not part of the
+    repository; rows pass through unchanged. Put it here so it reruns for every
+    rebuilt year, and bump the version of the 'dataset' stage when it changes.
+    """
+    return df
+
+
+def build_partition(year: int, paths: List[str], dataset: str = DATASET, chunk_size: int = CHUNK_SIZE) -> List[str]:
+    """
+    Merge, prepare and store the yearly files of one year as the year's partition of the dataset.
+
+    Args:
+        year (int): Year of the files
+        paths (List[str]): results-YYYY*.csv files of the year, e.g. results-2018.csv and results-2018-fix.csv
+        dataset (str, optional): Dataset directory. Defaults to DATASET.
+        chunk_size (int, optional): Rows read at a time. Defaults to CHUNK_SIZE.
+
+    Returns:
+        List[str]: Files of the new partition
+    """
+    storage.clear(dataset, [year])
+    part = 0
+    for path in paths:
+        for chunk in pd.read_csv(path, dtype=str, chunksize=chunk_size):
+            chunk["year"] = year
+            storage.write(prepare_chunk(manual_prep(chunk)), dataset, part=part)
+            part += 1
+    directory = storage.partition_dir(dataset, year)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+
+class Stage(NamedTuple):
+    """
+    One per-year step of the pipeline.
+
+    Args:
+        name (str): Key of the stage in the manifest
+        version (int): Bump to rebuild every year after changing the stage's code
+        build (Callable[[int, List[str], str], List[str]]): Builds a year given the year, its
+            results-YYYY*.csv files and the dataset directory, and returns the files it wrote
+    """
+    name: str
+    version: int
+    build: Callable[[int, List[str], str], List[str]]
+
+
+STAGES = [Stage("dataset", 1, build_partition), Stage("aggregates", 3, aggregates.build_stage)]
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def outputs_hash(paths: List[str], hash_file: Callable[[str], str] = file_hash) -> str:
+    """
+    Combined hash of several files: the yearly files of a year, or a stage's outputs, which are the input of
+    the next stage.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        digest.update(hash_file(path).encode())
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    What every stage last built for every year, as content hashes.
+
+    For each year and stage the manifest records the stage version, the hash
+    of the stage's input and the hash of each file it wrote. A stage is up to
+    date for a year when all of them still match, so a new or edited yearly
+    file, a changed stage and a deleted or modified output each rebuild only
+    the years they affect.
+
+    Hashes are cached with the size and modification time of their file and
+    a file is only read again once either changes, so checking an unchanged
+    dataset costs a stat per file rather than a full read.
+    """
+
+    def __init__(self, path: str = MANIFEST):
+        self.path = path
+        self.years: Dict[str, Dict[str, Dict]] = {}
+        # path -> {"size", "mtime_ns", "hash"} of every file hashed so far
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.years = manifest["years"]
+            self.files = manifest.get("files", {})
+
+    def file_hash(self, path: str) -> str:
+        """
+        Content hash of a file, read from the cache while its size and modification time are unchanged.
+        """
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["hash"]
+        digest = file_hash(path)
+        self.files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+        return digest
+
+    def is_current(self, year: int, stage: Stage, input_hash: str) -> bool:
+        entry = self.years.get(str(year), {}).get(stage.name)
+        if not entry or entry["version"] != stage.version or entry["input"] != input_hash:
+            return False
+        return all(os.path.exists(path) and self.file_hash(path) == digest
+                   for path, digest in entry["outputs"].items())
+
+    def outputs(self, year: int, stage: Stage) -> List[str]:
+        return list(self.years[str(year)][stage.name]["outputs"])
+
+    def record(self, year: int, stage: Stage, input_hash: str, outputs: List[str]):
+        self.years.setdefault(str(year), {})[stage.name] = {
+            "version": stage.version,
+            "input": input_hash,
+            "outputs": {path: self.file_hash(path) for path in outputs},
+        }
+        self.save()
+
+    def forget(self, year: int):
+        self.years.pop(str(year), None)
+        self.save()
+
+    def prune(self):
+        """
+        Drop cached hashes of files that no longer exist, such as replaced partitions.
+        """
+        self.files = {path: entry for path, entry in self.files.items() if os.path.exists(path)}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"years": self.years, "files": self.files}, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def run(input_dir: str = INPUT_DIR, dataset: str = DATASET, manifest_path: str = MANIFEST,
+        force: bool = False) -> List[int]:
+    """
+    Bring every stage up to date for every year, rebuilding only what changed.
+
+    Years whose input file was removed are dropped from the dataset.
+
+    Args:
+        input_dir (str, optional): Directory of results-YYYY.csv files. Defaults to INPUT_DIR.
+        dataset (str, optional): Dataset directory. Defaults to DATASET.
+        manifest_path (str, optional): Manifest file. Defaults to MANIFEST.
+        force (bool, optional): Rebuild every year. Defaults to False.
+
+    Returns:
+        List[int]: Years that were rebuilt
+    """
+    manifest = Manifest(manifest_path)
+    # Every file of a year goes into its partition, e.g. results-2018.csv and results-2018-fix.csv
+    files = {year: [path for _, path in group] for year, group in groupby(yearly_files(input_dir), lambda f: f[0])}
+    rebuilt = []
+
+    for year, paths in files.items():
+        input_hash = outputs_hash(paths, manifest.file_hash)
+        for stage in STAGES:
+            if not force and manifest.is_current(year, stage, input_hash):
+                outputs = manifest.outputs(year, stage)
+            else:
+                print(f"{year}: building {stage.name}")
+                try:
+                    outputs = stage.build(year, paths, dataset)
+                except Exception as e:
+                    print(f"Error building {stage.name} for {year}: {e}")
+                    break
+                manifest.record(year, stage, input_hash, outputs)
+                if year not in rebuilt:
+                    rebuilt.append(year)
+            input_hash = outputs_hash(outputs, manifest.file_hash)
+
+    current = set(files)
+    for year in sorted(set(map(int, manifest.years)) | set(storage.stored_years(dataset))):
+        if year not in current:
+            print(f"{year}: input removed, dropping")
+            storage.clear(dataset, [year])
+            manifest.forget(year)
+    manifest.prune()
+    aggregates.update(dataset)
+
+    return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Berlin dataset from the yearly result files")
+    parser.add_argument("--input", default=INPUT_DIR, help="Directory of results-YYYY.csv files")
+    parser.add_argument("--dataset", default=DATASET, help="Output dataset directory")
+    parser.add_argument("--manifest", default=MANIFEST, help="Pipeline manifest file")
+    parser.add_argument("--force", action="store_true", help="Rebuild every year")
+    args = parser.parse_args()
+
+    rebuilt = run(args.input, args.dataset, args.manifest, args.force)
+    print(f"Rebuilt {len(rebuilt)} year(s)" + (f": {', '.join(map(str, rebuilt))}" if rebuilt else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Finish time bins in seconds: one minute wide from 1:00:00 to 9:00:00
+TIME_START = 3600
+TIME_BIN = 60
+TIME_BINS = 480
+
+
+class YearHistogram:
+    """
+    Finish time histograms per year and group (e.g. gender).
+
+    `counts[group]` is an (n_years, n_bins) int64 array of finishers per year
+    and time bin. Rows are binned with a single bincount over a combined
+    (group, year, bin) index, so adding a frame costs one vectorized pass,
+    and histograms of separate chunks or years simply add up. Everything a
+    chart needs (densities, quantiles, box statistics) is derived from the
+    counts, so rendering no longer depends on the number of finishers.
+    Times outside the binned range are clamped into the first or last bin.
+    """
+
+    def __init__(self, years: Iterable[int], start: int = TIME_START, width: int = TIME_BIN, bins: int = TIME_BINS):
+        self.years = np.array(sorted(set(years)), dtype=np.int64)
+        self.start = start
+        self.width = width
+        self.bins = bins
+        self.counts: Dict[Any, np.ndarray] = {}
+
+    @property
+    def edges(self) -> np.ndarray:
+        """
+        Bin edges in seconds, n_bins + 1 of them.
+        """
+        return self.start + self.width * np.arange(self.bins + 1)
+
+    def add(self, years: Sequence[int], groups: Sequence[Any], seconds: Sequence[Any]):
+        """
+        Count a batch of finishers.
+
+        Args:
+            years (Sequence[int]): Year of each finisher; years not given to the constructor are ignored
+            groups (Sequence[Any]): Group of each finisher; missing groups are ignored
+            seconds (Sequence[Any]): Finish time of each finisher in seconds; missing or non-positive times are ignored
+        """
+        seconds = pd.to_numeric(pd.Series(seconds), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        years = pd.to_numeric(pd.Series(years), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        codes, uniques = pd.factorize(pd.Series(groups), use_na_sentinel=True)
+
+        row = np.searchsorted(self.years, years)
+        known = row < len(self.years)
+        known[known] = self.years[row[known]] == years[known]
+        valid = known & (codes >= 0) & (seconds > 0)
+
+        time_bin = np.clip((seconds[valid] - self.start) // self.width, 0, self.bins - 1).astype(np.int64)
+        index = (codes[valid] * len(self.years) + row[valid]) * self.bins + time_bin
+        flat = np.bincount(index, minlength=len(uniques) * len(self.years) * self.bins)
+        for i, group in enumerate(uniques):
+            counts = flat[i * len(self.years) * self.bins:(i + 1) * len(self.years) * self.bins]
+            group_counts = self.counts.setdefault(group, np.zeros((len(self.years), self.bins), dtype=np.int64))
+            group_counts += counts.reshape(len(self.years), self.bins)
+
+    def total(self) -> np.ndarray:
+        """
+        Counts of all groups together, (n_years, n_bins).
+        """
+        total = np.zeros((len(self.years), self.bins), dtype=np.int64)
+        for counts in self.counts.values():
+            total += counts
+        return total
+
+
+def quantiles(counts: np.ndarray, edges: np.ndarray, q: Sequence[float]) -> np.ndarray:
+    """
+    Quantiles of binned data, interpolating linearly inside the bin each falls in.
+
+    Args:
+        counts (np.ndarray): (n_rows, n_bins) counts, one histogram per row
+        edges (np.ndarray): n_bins + 1 bin edges
+        q (Sequence[float]): Quantiles between 0 and 1
+
+    Returns:
+        np.ndarray: (n_rows, len(q)) quantiles, NaN for empty rows
+    """
+    q = np.asarray(q, dtype=np.float64)
+    result = np.full((len(counts), len(q)), np.nan)
+    for i, row in enumerate(counts):
+        cumulative = np.cumsum(row)
+        if not cumulative[-1]:
+            continue
+        target = q * cumulative[-1]
+        bin_index = np.minimum(np.searchsorted(cumulative, target, side='left'), len(row) - 1)
+        before = np.where(bin_index > 0, cumulative[bin_index - 1], 0)
+        inside = np.divide(target - before, row[bin_index], out=np.zeros_like(target), where=row[bin_index] > 0)
+        result[i] = edges[bin_index] + inside * (edges[bin_index + 1] - edges[bin_index])
+    return result
+
+
+def box_stats(counts: np.ndarray, edges: np.ndarray, labels: Sequence[Any], whis: float = 1.5) -> List[Dict[str, Any]]:
+    """
+    Box plot statistics of binned data in the form matplotlib's Axes.bxp() takes.
+
+    Whiskers reach the furthest bin within `whis` interquartile ranges of the
+    box, and the notch spans the median +/- 1.57 IQR / sqrt(n), as in
+    Axes.boxplot(notch=True). Outliers are not drawn.
+
+    Args:
+        counts (np.ndarray): (n_rows, n_bins) counts, one box per row
+        edges (np.ndarray): n_bins + 1 bin edges
+        labels (Sequence[Any]): Label of each row
+        whis (float, optional): Whisker reach in IQRs. Defaults to 1.5.
+
+    Returns:
+        List[Dict[str, Any]]: One dict per non-empty row
+    """
+    q1, med, q3 = quantiles(counts, edges, [0.25, 0.5, 0.75]).T
+    centers = (edges[:-1] + edges[1:]) / 2
+    stats = []
+    for i, row in enumerate(counts):
+        n = row.sum()
+        if not n:
+            continue
+        iqr = q3[i] - q1[i]
+        occupied = centers[row > 0]
+        inside = occupied[(occupied >= q1[i] - whis * iqr) & (occupied <= q3[i] + whis * iqr)]
+        notch = 1.57 * iqr / np.sqrt(n)
+        stats.append({
+            'label': labels[i],
+            'med': med[i], 'q1': q1[i], 'q3': q3[i],
+            'whislo': min(inside.min(), q1[i]) if len(inside) else q1[i],
+            'whishi': max(inside.max(), q3[i]) if len(inside) else q3[i],
+            'cilo': med[i] - notch, 'cihi': med[i] + notch,
+            'fliers': [],
+        })
+    return stats
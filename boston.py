@@ -1,88 +1,45 @@
+import argparse
+import asyncio
 import csv
-import requests
-import concurrent.futures
-from typing import List, Any
-from bs4 import BeautifulSoup
-
-def parse_race_results(html_content: str, year: int) -> List[List[str]]:
+import time
+from typing import List, Any, AsyncIterator, Callable, Dict, Tuple
+from lxml import etree
+
+from archive import PageArchive, replay
+from fetcher import Fetcher, FetchRequest
+from metrics import REGISTRY
+from parsers import DEFAULT_BACKEND, get_backend, text
+from pipeline import RequeuingJobs, backoff_delay, run_pipeline
+from records import BOSTON, ResultBatch, headers
+from sink import OrderedCsvSink
+
+# CSV columns of a parsed result row
+HEADERS = headers(BOSTON)
+
+def parse_race_results(html_content: str, year: int, backend: str = DEFAULT_BACKEND) -> ResultBatch:
     """
     Parse HTML content of race results page.
 
     Args:
         html_content (str): HTML content of the race results page
         year (int): Year of the race
+        backend (str, optional): Parser backend, 'lxml' or 'html.parser'. Defaults to 'lxml'.
 
     Returns:
-        List[List[str]]: Parsed results from the page
-    """
-    # Parse the HTML
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Find all list items with the specified class
-    race_entries = soup.find_all('li', class_=['list-active list-group-item row', 'list-group-item row'])
-
-    # Prepare results list
-    results = []
-
-    # Extract information from each entry
-    for entry in race_entries:
-        # Extract full name and location
-        name_elem = entry.find('h4', class_='list-field type-fullname')
-        full_name = name_elem.get_text(strip=True) if name_elem else 'N/A'
-
-        # Extract overall place
-        overall_place_elem = entry.find('div', class_='list-field type-place place-secondary hidden-xs numeric')
-        overall_place = overall_place_elem.get_text(strip=True) if overall_place_elem else 'N/A'
-
-        # Extract gender place
-        gender_place_elem = entry.find('div', class_='list-field type-place place-primary numeric')
-        gender_place = gender_place_elem.get_text(strip=True) if gender_place_elem else 'N/A'
-
-        # Extract BIB number with more robust method
-        bib_elem = entry.find('div', class_='list-field type-field', style='width: 45px')
-        bib_number = 'N/A'
-        if bib_elem:
-            bib_label = bib_elem.find('div', class_='visible-xs-block visible-sm-block list-label')
-            if bib_label:
-                # Try different methods to extract BIB number
-                bib_text = bib_label.find_next_sibling()
-                if bib_text:
-                    bib_number = bib_text.get_text(strip=True)
-                elif bib_label.next_sibling:
-                    bib_number = bib_label.next_sibling.strip()
-
-        # Extract finish times
-        finish_times = entry.find_all('div', class_='split list-field type-time')
-
-        # Remove 'HALF', 'Finish Net', 'Finish Gun' prefixes and clean up times
-        half_time = finish_times[0].get_text(strip=True).replace('HALF', '').strip() if finish_times else 'N/A'
-        finish_net_time = finish_times[1].get_text(strip=True).replace('Finish Net', '').strip() if len(finish_times) > 1 else 'N/A'
-        finish_gun_time = finish_times[2].get_text(strip=True).replace('Finish Gun', '').strip() if len(finish_times) > 2 else 'N/A'
-
-        # Append to results with year
-        results.append([
-            year,
-            full_name,
-            overall_place,
-            gender_place,
-            bib_number,
-            half_time,
-            finish_net_time,
-            finish_gun_time
-        ])
-
-    return results
-
-def fetch_race_results(year: int, page_number: int) -> str:
-    """
-    Send a POST request to fetch race results for a specific page and year.
+        ResultBatch: Parsed results from the page
+    """
+    return get_backend(backend).boston(html_content, year)
+
+def race_results_request(year: int, page_number: int) -> FetchRequest:
+    """
+    Build the POST request for race results of a specific page and year.
 
     Args:
         year (int): The year of the race
         page_number (int): The page number to fetch results for
 
     Returns:
-        str: HTML content of the race results page
+        FetchRequest: Request for the race results page
     """
     url = f"https://results.baa.org/{year}/"
 
@@ -102,154 +59,286 @@ def fetch_race_results(year: int, page_number: int) -> str:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
 
-    try:
-        response = requests.post(url, data=payload, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        return response.text
-    except requests.RequestException as e:
-        print(f"Error fetching page {page_number} for year {year}: {e}")
-        return ""
+    tags = {"source": "boston", "year": year, "page": page_number}
+
+    return FetchRequest(url, method="POST", data=payload, headers=headers, tags=tags)
+
+async def fetch_race_results(fetcher: Fetcher, year: int, page_number: int) -> str:
+    """
+    Fetch race results for a specific page and year.
+
+    Args:
+        fetcher (Fetcher): Shared fetcher
+        year (int): The year of the race
+        page_number (int): The page number to fetch results for
+
+    Returns:
+        str: HTML content of the race results page
+    """
+    return await fetcher.fetch(race_results_request(year, page_number))
 
-def determine_max_pages(year: int) -> int:
+# The first pagination list of a results page
+PAGINATION = etree.XPath('(//ul[contains(concat(" ", normalize-space(@class), " "), " pagination ")])[1]')
+
+def parse_max_pages(first_page_html: str) -> int:
     """
-    Determine the maximum number of pages for a given year by making an initial request.
+    Determine the maximum number of pages for a year from its first results page.
+
+    This runs on the event loop, so the page is parsed with lxml and only
+    the pagination is looked at; runners are only searched for when there is none.
 
     Args:
-        year (int): The year to check
+        first_page_html (str): HTML content of the year's first results page
 
     Returns:
         int: Maximum number of pages (or a large default if cannot be determined)
     """
     try:
-        # First page to determine if results exist and max pages
-        first_page_html = fetch_race_results(year, 1)
-
-        if not first_page_html:
+        lxml_backend = get_backend('lxml')
+        root = lxml_backend.parse(first_page_html)
+        if root is None:
             return 0
 
-        soup = BeautifulSoup(first_page_html, 'html.parser')
-
         # Look for pagination elements
-        pagination = soup.find('ul', class_='pagination')
-
+        pagination = PAGINATION(root)
         if not pagination:
             # If no pagination, check if there are results at all
-            race_entries = soup.find_all('li', class_=['list-active list-group-item row', 'list-group-item row'])
-            return 1 if race_entries else 0
+            return 1 if lxml_backend.boston_entries(root) else 0
 
         # Find the last page number in pagination
-        page_links = pagination.find_all('a')
+        page_links = list(pagination[0].iter('a'))
         if page_links:
             # Get the second to last link (last is usually 'next')
             last_page_link = page_links[-2] if len(page_links) > 1 else page_links[-1]
-            max_pages = int(last_page_link.get_text(strip=True))
+            max_pages = int(text(last_page_link))
             return max_pages
 
         return 100  # Fallback large number if can't determine
 
     except Exception as e:
-        print(f"Error determining max pages for {year}: {e}")
+        print(f"Error determining max pages: {e}")
         return 100  # Safe fallback
 
-def scrape_race_results(start_year: int = 2010, end_year: int = 2024) -> List[Any]:
+async def discover_page_jobs(fetcher: Fetcher, years: List[int], first_pages: Dict[Tuple[int, int], str],
+                             on_discovered: Callable[[int, int], None], failed_years: List[int],
+                             retries: int = 3) -> AsyncIterator[Tuple[int, int]]:
     """
-    Scrape race results across multiple years and pages using concurrent requests.
+    Discover the pagination of all years concurrently and yield page jobs as soon as each year is known.
+
+    The first page of every year is fetched once: it is used to find the
+    page count and is then kept in `first_pages` to be parsed as a result page.
+    A first page that cannot be fetched is tried again with jittered backoff,
+    up to `retries` times; if it still fails the year is skipped and added to
+    `failed_years` rather than taken to have no results.
 
     Args:
-        start_year (int, optional): First year to start scraping. Defaults to 2010.
-        end_year (int, optional): Last year to scrape. Defaults to 2024.
+        fetcher (Fetcher): Shared fetcher
+        years (List[int]): Years to discover
+        first_pages (Dict[Tuple[int, int], str]): Receives the already fetched first page per (year, 1) job
+        on_discovered (Callable[[int, int], None]): Called with (year, max_pages) once a year is discovered
+        failed_years (List[int]): Receives the years whose first page could not be fetched
+        retries (int, optional): Times a failed first page is fetched again. Defaults to 3.
 
     Returns:
-        List[Any]: Parsed results from all pages
+        AsyncIterator[Tuple[int, int]]: (year, page) jobs
     """
-    all_results = []
-
-    # Create a list to track scraping jobs
-    scraping_jobs = []
+    async def discover(year: int) -> Tuple[int, str]:
+        for attempt in range(retries + 1):
+            first_page_html = await fetch_race_results(fetcher, year, 1)
+            if first_page_html or attempt == retries:
+                return year, first_page_html
+            print(f"First page of {year} failed, retrying")
+            REGISTRY.inc('scrape_requeued_total')
+            await asyncio.sleep(backoff_delay(attempt))
+
+    for task in asyncio.as_completed([discover(year) for year in years]):
+        year, first_page_html = await task
+        if not first_page_html:
+            print(f"Giving up on year {year}: its first page could not be fetched")
+            failed_years.append(year)
+            on_discovered(year, 0)
+            continue
 
-    # Discover pages for each year
-    for year in range(start_year, end_year + 1):
-        max_pages = determine_max_pages(year)
+        max_pages = parse_max_pages(first_page_html)
         print(f"Year {year}: {max_pages} pages detected")
+        on_discovered(year, max_pages)
 
         if max_pages == 0:
             print(f"No results found for year {year}")
             continue
 
-        # Add scraping jobs for this year
-        scraping_jobs.extend([(year, page) for page in range(1, max_pages + 1)])
+        first_pages[(year, 1)] = first_page_html
+        for page in range(1, max_pages + 1):
+            yield year, page
 
-    # Use ThreadPoolExecutor for concurrent requests
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        # Create futures for each scraping job
-        futures = [executor.submit(fetch_and_parse_page, year, page) for year, page in scraping_jobs]
+async def scrape_race_results(fetcher: Fetcher, output_file: str, start_year: int = 2010, end_year: int = 2024,
+                              page_retries: int = 3) -> int:
+    """
+    Scrape race results across multiple years and pages using concurrent requests.
 
-        # Process results as they complete
-        for future in concurrent.futures.as_completed(futures):
-            page_results = future.result()
-            if page_results:
-                all_results.extend(page_results)
+    Page jobs start flowing as soon as the first year's page count is known,
+    while the remaining years are still being discovered. Rows are streamed
+    to the output file as pages finish, in (year, page) order. A page whose
+    fetch fails is put back in the queue with jittered backoff, up to
+    `page_retries` times, before it is given up on; so is the first page
+    of a year during discovery. Years that could still not be discovered
+    are reported at the end.
 
-        return all_results
+    Args:
+        fetcher (Fetcher): Shared fetcher
+        output_file (str): Path to output CSV file
+        start_year (int, optional): First year to start scraping. Defaults to 2010.
+        end_year (int, optional): Last year to scrape. Defaults to 2024.
+        page_retries (int, optional): Times a failed page is requeued. Defaults to 3.
+
+    Returns:
+        int: Number of results written
+    """
+    years = list(range(start_year, end_year + 1))
+    sink = OrderedCsvSink(output_file, HEADERS, years)
 
-def fetch_and_parse_page(year: int, page: int) -> List[Any]:
+    # First pages fetched during discovery, reused instead of downloading them again
+    first_pages: Dict[Tuple[int, int], str] = {}
+
+    async def fetch_job(job: Tuple[int, int]) -> str:
+        html_content = first_pages.pop(job, None)
+        if html_content is not None:
+            return html_content
+        return await fetch_race_results(fetcher, *job)
+
+    failed_years: List[int] = []
+    scraping_jobs = RequeuingJobs(discover_page_jobs(fetcher, years, first_pages, sink.set_page_count, failed_years,
+                                                     retries=page_retries),
+                                  retries=page_retries)
+
+    try:
+        # Fetch on the event loop and parse in a process pool, as results complete
+        pages = run_pipeline(scraping_jobs, fetch_job, parse_page_job, io_workers=fetcher.per_host)
+        async for (year, page), page_results in pages:
+            if scraping_jobs.resolve((year, page), page_results is not None):
+                print(f"Page {page} of {year} failed, requeued")
+                continue
+            if page_results is None:
+                print(f"Giving up on page {page} of {year}")
+            sink.add(year, page, page_results)
+    finally:
+        total = sink.close()
+
+    if failed_years:
+        print(f"Warning: no results written for {', '.join(map(str, sorted(failed_years)))}: "
+              f"their first page could not be fetched")
+    return total
+
+def parse_page_job(job: Tuple[int, int], html_content: str) -> ResultBatch:
     """
-    Fetch and parse results for a specific year and page.
+    Parse a fetched page of a (year, page) job; runs in a parser process.
 
     Args:
-        year (int): Year of the race
-        page (int): Page number to fetch
+        job (Tuple[int, int]): Year and page number of the page
+        html_content (str): HTML content of the page
+
+    Returns:
+        ResultBatch: Parsed results for this page
+    """
+    return parse_race_results(html_content, job[0])
+
+def parse_archived_page(html_content: str, tags: Dict[str, Any]) -> ResultBatch:
+    """
+    Parse an archived results page using the tags it was recorded with.
+
+    Args:
+        html_content (str): HTML content of the archived page
+        tags (Dict[str, Any]): Tags of the archive entry
 
     Returns:
-        List[Any]: Parsed results for this page
+        ResultBatch: Parsed results for this page
     """
-    html_content = fetch_race_results(year, page)
-    if html_content:
-        return parse_race_results(html_content, year)
-    return []
+    return parse_race_results(html_content, tags["year"])
+
+def replay_race_results(archive: PageArchive, start_year: int = 2010, end_year: int = 2024) -> ResultBatch:
+    """
+    Re-parse archived pages offline instead of scraping the site again.
+
+    Args:
+        archive (PageArchive): Archive of previously fetched pages
+        start_year (int, optional): First year to replay. Defaults to 2010.
+        end_year (int, optional): Last year to replay. Defaults to 2024.
+
+    Returns:
+        ResultBatch: Parsed results from all archived pages
+    """
+    all_results = ResultBatch(BOSTON)
+    for tags, page_results in replay(archive, parse_archived_page, order_by=("year", "page"), source="boston"):
+        if start_year <= tags["year"] <= end_year:
+            all_results.extend(page_results)
+    return all_results
 
 def save_to_csv(results, output_file):
     """
     Save results to a CSV file.
 
     Args:
-        results (List[List[str]]): Race results to save
+        results (ResultBatch): Race results to save
         output_file (str): Path to output CSV file
     """
-    # Define headers
-    headers = [
-        'Year',
-        'Full Name',
-        'Overall Place',
-        'Gender Place',
-        'BIB Number',
-        'Half Marathon Time',
-        'Finish Net Time',
-        'Finish Gun Time'
-    ]
-
     # Write to CSV
+    start = time.perf_counter()
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(headers)
+        csvwriter.writerow(HEADERS)
         csvwriter.writerows(results)
+    REGISTRY.record_write('csv', time.perf_counter() - start, len(results))
 
     print(f"Results saved to {output_file}")
 
+async def run(archive: PageArchive, output_file: str) -> int:
+    """
+    Scrape all years with a single shared fetcher.
+
+    The number of requests in flight adapts to how the site responds, from 4
+    up to 32. With the site taking a second or more per page, 32 requests in
+    flight stay under the rate limit, so the adaptive limit sets the pace and
+    the rate limit only caps bursts.
+
+    Failed pages are retried by the pipeline with backoff (see
+    scrape_race_results), so the fetcher does not retry them as well.
+    """
+    async with Fetcher(per_host=32, min_per_host=4, rate=40.0, burst=32, archive=archive, retries=0,
+                       adaptive=True) as fetcher:
+        return await scrape_race_results(fetcher, output_file, start_year=2010, end_year=2024)
+
 def main():
     """
     Main function to execute the race results scraping.
     """
+    parser = argparse.ArgumentParser(description="Scrape Boston Marathon results")
+    parser.add_argument("--archive", default="archive", help="Directory of the raw page archive")
+    parser.add_argument("--replay", action="store_true", help="Re-parse archived pages instead of fetching")
+    parser.add_argument("--metrics", help="Write crawl metrics here: JSON if it ends in .json, else a Prometheus textfile")
+    parser.add_argument("--metrics-interval", type=float, help="Also rewrite the metrics every this many seconds")
+    args = parser.parse_args()
+
+    output_file = "all_years_results_boston_2024.csv"
+
     try:
-        # Scrape results from 2010 to 2024
-        results = scrape_race_results(start_year=2010, end_year=2024)
-        print(f"Total results scraped: {len(results)}")
+        archive = PageArchive(args.archive)
+
+        with REGISTRY.reporting(args.metrics, args.metrics_interval):
+            if args.replay:
+                results = replay_race_results(archive, start_year=2010, end_year=2024)
+                print(f"Total results scraped: {len(results)}")
 
-        # Save results to CSV
-        save_to_csv(results, "all_years_results_boston_2024.csv")
+                # Save results to CSV
+                save_to_csv(results, output_file)
+            else:
+                # Scrape results from 2010 to 2024, streaming them to the CSV
+                total = asyncio.run(run(archive, output_file))
+                print(f"Total results scraped: {total}")
+                print(f"Results saved to {output_file}")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import csv
+import json
+import os
+import time
+from typing import Any, List, Optional
+
+from metrics import REGISTRY
+
+
+class CrawlCheckpoint:
+    """
+    Resumable progress of a range crawl for one (race_id, year).
+
+    A JSON manifest records which result ranges (by their `begin` offset) are
+    complete and, once a short page is seen, where the race ends. Parsed rows
+    are appended to a partial CSV as each range arrives, tagged with their
+    range, so a restarted crawl only fetches the ranges that are still missing.
+    """
+
+    def __init__(self, directory: str, race_id: Any, year: int):
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, f"{race_id}_{year}.json")
+        self.partial_path = os.path.join(directory, f"{race_id}_{year}.partial.csv")
+        self.completed = set()
+        self.end: Optional[int] = None
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.completed = set(manifest['completed'])
+            self.end = manifest['end']
+        self.compact()
+
+    def is_done(self, begin: int) -> bool:
+        """
+        Check whether the range starting at `begin` needs no fetching.
+
+        Args:
+            begin (int): Starting result number of the range
+
+        Returns:
+            bool: True if the range is complete or past the end of the race
+        """
+        return begin in self.completed or (self.end is not None and begin >= self.end)
+
+    def record(self, begin: int, rows: List[List[Any]]):
+        """
+        Durably append the rows of a completed range, then mark it complete.
+
+        Args:
+            begin (int): Starting result number of the range
+            rows (List[List[Any]]): Parsed rows of the range
+        """
+        start = time.perf_counter()
+        with open(self.partial_path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows([begin] + list(row) for row in rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.add(begin)
+        self.save()
+        REGISTRY.record_write('checkpoint', time.perf_counter() - start, len(rows))
+
+    def mark_end(self, begin: int):
+        """
+        Record that the race has no results from `begin` onwards.
+
+        Args:
+            begin (int): Starting result number of the first range past the end
+        """
+        self.end = begin if self.end is None else min(self.end, begin)
+        self.save()
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'completed': sorted(self.completed), 'end': self.end}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def compact(self):
+        """
+        Drop partial rows of ranges the manifest does not list as complete.
+
+        Such rows are left behind by a crash between appending a range and
+        saving the manifest; the range is refetched, so they would duplicate it.
+        """
+        if not os.path.exists(self.partial_path):
+            return
+        with open(self.partial_path, newline='', encoding='utf-8') as f:
+            tagged = list(csv.reader(f))
+        kept = [row for row in tagged if row and row[0].isdigit() and int(row[0]) in self.completed]
+        if len(kept) == len(tagged):
+            return
+        tmp_path = self.partial_path + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(kept)
+        os.replace(tmp_path, self.partial_path)
+
+    def rows(self) -> List[List[str]]:
+        """
+        Read back all checkpointed rows in range order.
+
+        Returns:
+            List[List[str]]: Parsed rows without the range tag
+        """
+        if not os.path.exists(self.partial_path):
+            return []
+        with open(self.partial_path, newline='', encoding='utf-8') as f:
+            tagged = [(int(row[0]), row[1:]) for row in csv.reader(f)]
+        tagged.sort(key=lambda item: item[0])
+        return [row for _, row in tagged]
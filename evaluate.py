@@ -0,0 +1,232 @@
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import regression
+from splits import SplitTable
+
+# Columns of the shared feature matrix; city is an index into the list of cities
+COLUMNS = ['city', 'year', 'fold'] + regression.FEATURES + [regression.TARGET]
+CITY, YEAR, FOLD = 0, 1, 2
+FEATURES = slice(3, 3 + len(regression.FEATURES))
+TARGET = len(COLUMNS) - 1
+
+# Marathon distance over the distance of the last feature split (20k)
+MARATHON_FROM_20K = 42.195 / 20
+
+
+class Predictor(NamedTuple):
+    """
+    A way of predicting the finish time from the four splits.
+
+    Args:
+        fit (Callable[[np.ndarray, np.ndarray], np.ndarray]): Parameters learned from training splits and finish times
+        predict (Callable[[np.ndarray, np.ndarray], np.ndarray]): Finish times from parameters and splits
+    """
+    fit: Callable[[np.ndarray, np.ndarray], np.ndarray]
+    predict: Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def fit_linear(X: np.ndarray, y: np.ndarray) -> np.ndarray:
+    gram = regression.GramMatrix(X.shape[1])
+    gram.add(X, y)
+    model = gram.fit()
+    return np.concatenate([[model.intercept], model.coef])
+
+
+def predict_linear(params: np.ndarray, X: np.ndarray) -> np.ndarray:
+    return params[0] + X @ params[1:]
+
+
+def no_fit(X: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return np.empty(0)
+
+
+PREDICTORS: Dict[str, Predictor] = {
+    # Least squares on all four splits, as linear_regression.py
+    'linear': Predictor(fit_linear, predict_linear),
+    # Least squares on the 20k split alone
+    'linear_20k': Predictor(lambda X, y: fit_linear(X[:, -1:], y), lambda p, X: predict_linear(p, X[:, -1:])),
+    # Keep the 20k pace to the finish
+    'even_pace': Predictor(no_fit, lambda p, X: X[:, -1] * MARATHON_FROM_20K),
+    # Riegel's endurance formula T2 = T1 * (D2 / D1) ** 1.06 from the 20k split
+    'riegel': Predictor(no_fit, lambda p, X: X[:, -1] * MARATHON_FROM_20K ** 1.06),
+}
+
+
+class Task(NamedTuple):
+    predictor: str
+    city: Optional[int]
+    scheme: str
+    fold: int
+
+
+# Feature matrix of a worker process, attached once by attach()
+_shared: Optional[shared_memory.SharedMemory] = None
+_matrix: Optional[np.ndarray] = None
+
+
+def attach(name: str, shape: Tuple[int, int]):
+    """
+    Process pool initializer: map the parent's feature matrix instead of receiving a pickled copy per task.
+    """
+    global _shared, _matrix
+    _shared = shared_memory.SharedMemory(name=name)
+    _matrix = np.ndarray(shape, dtype=np.float64, buffer=_shared.buf)
+
+
+def run_task(task: Task) -> Dict[str, float]:
+    """
+    Fit one predictor on one fold's training rows and score it on the held-out rows.
+    """
+    matrix = _matrix
+    rows = np.ones(len(matrix), dtype=bool) if task.city is None else matrix[:, CITY] == task.city
+    column = FOLD if task.scheme == 'kfold' else YEAR
+    held_out = matrix[:, column] == task.fold
+    train, test = matrix[rows & ~held_out], matrix[rows & held_out]
+
+    predictor = PREDICTORS[task.predictor]
+    params = predictor.fit(train[:, FEATURES], train[:, TARGET])
+    residual = predictor.predict(params, test[:, FEATURES]) - test[:, TARGET]
+    y = test[:, TARGET]
+    sst = ((y - y.mean()) ** 2).sum()
+    return {
+        'predictor': task.predictor, 'city': task.city, 'scheme': task.scheme, 'fold': task.fold,
+        'train_rows': len(train), 'test_rows': len(test),
+        'mse': float((residual ** 2).mean()), 'mae': float(np.abs(residual).mean()),
+        'r2': float(1 - (residual ** 2).sum() / sst) if sst > 0 else np.nan,
+    }
+
+
+def build_matrix(datasets: Sequence[Tuple[str, Sequence[regression.Batch]]], k: int,
+                 seed: int = 42) -> Tuple[np.ndarray, List[str]]:
+    """
+    Stack the finishers of every city into one feature matrix with a random k-fold assignment.
+
+    Args:
+        datasets (Sequence[Tuple[str, Sequence[regression.Batch]]]): (city, batches) per city
+        k (int): Number of folds
+        seed (int, optional): Seed of the fold assignment. Defaults to 42.
+
+    Returns:
+        Tuple[np.ndarray, List[str]]: (n, len(COLUMNS)) float64 matrix and the city names its city column indexes
+    """
+    cities, blocks = [], []
+    for city, batches in datasets:
+        if city not in cities:
+            cities.append(city)
+        for year, X, y in batches:
+            block = np.empty((len(y), len(COLUMNS)))
+            block[:, CITY] = cities.index(city)
+            block[:, YEAR] = year
+            block[:, FEATURES] = X
+            block[:, TARGET] = y
+            blocks.append(block)
+    matrix = np.concatenate(blocks) if blocks else np.empty((0, len(COLUMNS)))
+    matrix[:, FOLD] = np.random.default_rng(seed).permutation(len(matrix)) % k
+    return matrix, cities
+
+
+def tasks_for(matrix: np.ndarray, cities: List[str], predictors: Sequence[str], k: int) -> List[Task]:
+    """
+    Every fold of k-fold and leave-one-year-out validation, per city and for all cities pooled.
+    """
+    tasks = []
+    scopes = [None] + list(range(len(cities))) if len(cities) > 1 else [0]
+    for city in scopes:
+        rows = matrix if city is None else matrix[matrix[:, CITY] == city]
+        years = np.unique(rows[:, YEAR]).astype(int)
+        for predictor in predictors:
+            tasks += [Task(predictor, city, 'kfold', fold) for fold in range(k)]
+            if len(years) > 1:
+                tasks += [Task(predictor, city, 'year', int(year)) for year in years]
+    return tasks
+
+
+def evaluate(matrix: np.ndarray, cities: List[str], predictors: Sequence[str] = tuple(PREDICTORS), k: int = 5,
+             workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Cross-validate predictors on every fold in parallel.
+
+    The matrix is copied once into shared memory; worker processes map it
+    read-only, so tasks carry only a few integers each way.
+
+    Args:
+        matrix (np.ndarray): Feature matrix from build_matrix()
+        cities (List[str]): City names of the matrix
+        predictors (Sequence[str], optional): Names in PREDICTORS. Defaults to all.
+        k (int, optional): Number of folds the matrix was built with. Defaults to 5.
+        workers (int, optional): Worker processes. Defaults to one per core.
+
+    Returns:
+        pd.DataFrame: One row per (predictor, city, scheme, fold) with its error metrics
+    """
+    tasks = tasks_for(matrix, cities, predictors, k)
+    shared = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shared.buf)[:] = matrix
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=attach, initargs=(shared.name, matrix.shape)) as executor:
+            results = list(executor.map(run_task, tasks, chunksize=max(1, len(tasks) // 64)))
+    finally:
+        shared.close()
+        shared.unlink()
+    folds = pd.DataFrame(results)
+    folds['city'] = ['all' if task.city is None else cities[task.city] for task in tasks]
+    return folds
+
+
+def summarize(folds: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean and spread of the fold metrics per (city, scheme, predictor), weighting folds by their test rows.
+    """
+    def weighted(group: pd.DataFrame) -> pd.Series:
+        weights = group['test_rows']
+        return pd.Series({
+            'folds': len(group),
+            'mse': np.average(group['mse'], weights=weights),
+            'mse_std': group['mse'].std(),
+            'mae': np.average(group['mae'], weights=weights),
+            'r2': group['r2'].mean(),
+        })
+    folds = folds[folds['test_rows'] > 0]
+    return folds.groupby(['city', 'scheme', 'predictor'])[['test_rows', 'mse', 'mae', 'r2']].apply(weighted) \
+        .astype({'folds': int})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate finish time predictors across years and cities")
+    parser.add_argument("--data", default="results/cleaned_marathon_data",
+                        help="Berlin dataset directory")
+    parser.add_argument("--splits", nargs=3, action="append", default=[], metavar=("NPZ", "YEAR", "CITY"),
+                        help="A githubChicago.py --splits-file, its year and city")
+    parser.add_argument("--predictors", nargs="+", default=list(PREDICTORS), choices=list(PREDICTORS))
+    parser.add_argument("-k", type=int, default=5, help="Number of folds")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--output", help="Also write the per-fold results to this CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    datasets = [("berlin", regression.dataset_batches(args.data))]
+    datasets += [(city, regression.split_table_batches(SplitTable.load(path), int(year)))
+                 for path, year, city in args.splits]
+    matrix, cities = build_matrix(datasets, args.k)
+    print(f"{len(matrix):,} finishers from {', '.join(cities)} loaded in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    folds = evaluate(matrix, cities, args.predictors, args.k, args.workers)
+    print(f"{len(folds)} folds evaluated in {time.perf_counter() - start:.1f}s")
+    with pd.option_context('display.max_rows', None, 'display.width', 120, 'display.float_format', '{:,.3f}'.format):
+        print(summarize(folds))
+    if args.output:
+        folds.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
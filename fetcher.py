@@ -0,0 +1,263 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import REGISTRY
+
+
+class FetchRequest(NamedTuple):
+    """
+    A single HTTP request to be issued by the Fetcher.
+
+    Args:
+        url (str): Target URL
+        method (str): HTTP method, "GET" or "POST"
+        params (dict): Query string parameters
+        data (dict): Form body for POST requests
+        headers (dict): Extra request headers
+        tags (dict): Metadata stored alongside the archived response (source, year, page, ...)
+    """
+    url: str
+    method: str = "GET"
+    params: Optional[Dict[str, Any]] = None
+    data: Optional[Dict[str, Any]] = None
+    headers: Optional[Dict[str, str]] = None
+    tags: Optional[Dict[str, Any]] = None
+
+
+class TokenBucket:
+    """
+    Token-bucket politeness limiter.
+
+    Allows bursts of up to `capacity` requests and then refills at `rate`
+    tokens per second, so the long-run request rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ConcurrencyLimit:
+    """
+    Cap on the requests in flight to one host, optionally adapted AIMD-style.
+
+    A fixed limit behaves like a semaphore. An adaptive one starts at
+    `initial` and, while responses keep succeeding at a healthy latency (no
+    more than `latency_factor` times the best smoothed latency seen), grows
+    by 1/limit per success, about one more request per round of `limit`
+    requests. A 429, a 5xx, a connection error or a timeout multiplies it by
+    `decrease`; other failures, such as a 404, say nothing about the load
+    and leave it as it is. Only failures of requests sent after the last cut count, so
+    one burst of failures cuts the limit once. The limit always stays
+    between `minimum` and `maximum`.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None, adaptive: bool = False,
+                 latency_factor: float = 2.0, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.adaptive = adaptive
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.in_flight = 0
+        self.smoothed: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.last_cut = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot.
+
+        Returns:
+            float: time.monotonic() when the slot was taken, to pass to release()
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, sent: float, latency: float, overloaded: bool, succeeded: bool = True):
+        """
+        Free a slot and adapt the limit to how the request went.
+
+        Args:
+            sent (float): Value acquire() returned
+            latency (float): Seconds the request took
+            overloaded (bool): Whether it failed in a way that suggests too much load
+            succeeded (bool, optional): Whether it got a successful response. Defaults to True.
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                if overloaded:
+                    if sent > self.last_cut:
+                        self.limit = max(self.minimum, self.limit * self.decrease)
+                        self.last_cut = time.monotonic()
+                elif succeeded:
+                    self.smoothed = latency if self.smoothed is None else 0.8 * self.smoothed + 0.2 * latency
+                    # The baseline follows improvements at once and slower responses only slowly
+                    self.baseline = self.smoothed if self.baseline is None or self.smoothed < self.baseline \
+                        else self.baseline + 0.01 * (self.smoothed - self.baseline)
+                    if self.smoothed <= self.latency_factor * self.baseline:
+                        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class Fetcher:
+    """
+    Asyncio HTTP client shared by all scrapers.
+
+    Connections are pooled and kept alive across requests. Every host gets its
+    own concurrency cap and its own token bucket, so a crawl runs as fast as
+    the site allows without opening more than `per_host` sockets to it.
+    With `adaptive`, the cap of each host starts at `min_per_host` and is
+    adjusted between `min_per_host` and `per_host` as responses come back
+    (see ConcurrencyLimit). Failed requests (connection errors, timeouts,
+    429 and 5xx responses) are retried up to `retries` times with jittered
+    exponential backoff starting at `backoff` seconds. Latency, waiting
+    time, bytes, statuses, retries and the concurrency cap are recorded per
+    host in metrics.REGISTRY. If an archive (see archive.PageArchive) is
+    given, every successful response is recorded so it can later be
+    re-parsed offline.
+
+    Usage:
+        async with Fetcher(per_host=4, rate=2.0) as fetcher:
+            html = await fetcher.fetch(FetchRequest("https://example.com/"))
+    """
+
+    def __init__(self, per_host: int = 4, rate: float = 2.0, burst: int = 4,
+                 timeout: float = 30.0, headers: Optional[Dict[str, str]] = None, archive=None,
+                 retries: int = 0, backoff: float = 1.0, adaptive: bool = False, min_per_host: int = 1):
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = headers or {}
+        self.archive = archive
+        self.retries = retries
+        self.backoff = backoff
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.limits: Dict[str, ConcurrencyLimit] = defaultdict(
+            lambda: ConcurrencyLimit(min_per_host, minimum=min_per_host, maximum=per_host, adaptive=True)
+            if adaptive else ConcurrencyLimit(per_host))
+        self.buckets: Dict[str, TokenBucket] = defaultdict(lambda: TokenBucket(self.rate, self.burst))
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.per_host, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def fetch(self, request: FetchRequest) -> str:
+        """
+        Issue one request, respecting the per-host limits.
+
+        Args:
+            request (FetchRequest): Request to send
+
+        Returns:
+            str: Response body, or an empty string if the request failed
+        """
+        host = urlsplit(request.url).netloc
+        limit = self.limits[host]
+        for attempt in range(self.retries + 1):
+            queued = time.perf_counter()
+            slot = await limit.acquire()
+            latency, overloaded, succeeded = 0.0, False, False
+            try:
+                await self.buckets[host].acquire()
+                sent = time.perf_counter()
+                REGISTRY.observe('scrape_fetch_wait_seconds', sent - queued, host=host)
+                status = 'error'
+                try:
+                    async with self.session.request(request.method, request.url, params=request.params,
+                                                    data=request.data, headers=request.headers) as response:
+                        status = response.status
+                        response.raise_for_status()
+                        size = len(await response.read())
+                        body = await response.text()
+                    succeeded = True
+                    break
+                except aiohttp.ClientResponseError as e:
+                    error = e
+                    # Other client errors will not go away by asking again
+                    retryable = overloaded = e.status == 429 or e.status >= 500
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                    retryable = overloaded = True
+                finally:
+                    latency = time.perf_counter() - sent
+                    REGISTRY.observe('scrape_fetch_seconds', latency, host=host)
+                    REGISTRY.inc('scrape_fetch_requests_total', host=host, status=status)
+            finally:
+                await limit.release(slot, latency, overloaded, succeeded)
+                REGISTRY.set('scrape_fetch_concurrency_limit', int(limit.limit), host=host)
+
+            if not retryable or attempt == self.retries:
+                REGISTRY.inc('scrape_fetch_failures_total', host=host)
+                print(f"Error fetching {request.url} {request.params or request.data or ''}: {error}")
+                return ""
+            REGISTRY.inc('scrape_fetch_retries_total', host=host)
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        REGISTRY.inc('scrape_fetch_bytes_total', size, host=host)
+        REGISTRY.observe('scrape_fetch_response_bytes', size, host=host)
+
+        if self.archive is not None:
+            await asyncio.to_thread(self.archive.put, request, body, request.tags)
+        return body
+
+    async def fetch_many(self, requests: Iterable[FetchRequest]) -> List[str]:
+        """
+        Fetch several requests concurrently.
+
+        Args:
+            requests (Iterable[FetchRequest]): Requests to send
+
+        Returns:
+            List[str]: Response bodies in the same order as the requests
+        """
+        return await asyncio.gather(*(self.fetch(request) for request in requests))
+
+
+def fetch_all(requests: Iterable[FetchRequest], **fetcher_options) -> List[str]:
+    """
+    Blocking helper that fetches a batch of requests with a fresh Fetcher.
+
+    Args:
+        requests (Iterable[FetchRequest]): Requests to send
+        **fetcher_options: Passed through to Fetcher
+
+    Returns:
+        List[str]: Response bodies in the same order as the requests
+    """
+    async def run():
+        async with Fetcher(**fetcher_options) as fetcher:
+            return await fetcher.fetch_many(requests)
+
+    return asyncio.run(run())
@@ -1,40 +1,56 @@
-import requests
+import argparse
+import asyncio
+import csv
+import time
 from pyquery import PyQuery as pq
 import pandas as pd
 import re
 import tqdm
 
+from archive import PageArchive, replay
+from fetcher import Fetcher, FetchRequest, fetch_all
+from metrics import REGISTRY
+from pipeline import run_pipeline
+from records import CHICAGO, ResultBatch, headers
+from splits import SplitTable
+
 BASE_URL = "https://results.chicagomarathon.com/2021/"
 PATH = "?page={page}&event=MAR&lang=EN_CAP&num_results=1000&pid=list&search%5Bsex%5D={sex}&search%5Bage_class%5D=%25"
 
 
-def parse_page(base_url, path, gender):
-    resp = requests.get(base_url + path)
-    d = pq(resp.content)
+def parse_page(content, base_url, gender):
+    all_runners_parsed = ResultBatch(CHICAGO)
+    if not content:
+        return all_runners_parsed
+    d = pq(content)
     # find first name field and navigate up to overarching row
     all_runners = d(".list-field.type-fullname a").closest(".list-group-item .row")
-    all_runners_parsed = []
     for runner in all_runners.items():
         #     print(runner)
         name_country = runner.find(".type-fullname a").text()
         idp = re.search("(?<=idp=)[A-Z0-9_.-]*(?=&)", runner.find(".type-fullname a").attr['href']).group(0)
         details_url = base_url + "?content=detail&idp=" + idp
-        data = {
-            "name": name_country[:-6],
-            "gender": gender,
-            "country": name_country[-4:-1],
-            "age_class": runner.find(".type-age_class").text().split("\n")[1],
-            "half_time": runner.find(".type-time").eq(0).text().split("\n")[1],
-            "finish_time": runner.find(".type-time").eq(1).text().split("\n")[1],
-            "details_url": details_url,
-        }
-        all_runners_parsed.append(data)
+        # in CHICAGO field order; bib and city_state are filled in from the detail page
+        all_runners_parsed.append((
+            name_country[:-6],
+            gender,
+            name_country[-4:-1],
+            runner.find(".type-age_class").text().split("\n")[1],
+            runner.find(".type-time").eq(0).text().split("\n")[1],
+            runner.find(".type-time").eq(1).text().split("\n")[1],
+            details_url,
+            "",
+            "",
+        ))
 
     return all_runners_parsed
 
 
 def get_details(details_url):
-    x = pq(details_url)
+    return parse_details(pq(details_url))
+
+
+def parse_details(x):
     splits = {
         "start": {
             "time_of_day": x.find(".f-starttime_net.last").text(),
@@ -89,10 +105,140 @@ def get_details(details_url):
     }
 
 
-all_runners = []
+LIST_PAGES = [(page, "M", "man") for page in range(1, 16)] + [(page, "W", "woman") for page in range(1, 13)]
+
+
+def parse_detail_job(index, content):
+    # runs in a parser process of the pipeline; returns integer seconds rather than nested dicts
+    details = parse_details(pq(content))
+    table = SplitTable.from_details([details])
+    return details["bib"], details["city_state"], table.elapsed[0], table.time_of_day[0]
+
+
+async def fetch_details(all_runners, archive, concurrency=8, rate=5.0, retries=3):
+    """
+    Fetch every runner's detail page concurrently and merge bib and city_state into the runner.
+
+    Detail pages are fetched with bounded concurrency, rate limiting and
+    retries, and parsed in a process pool while further pages download.
+    The splits go into a SplitTable whose row i belongs to all_runners[i]
+    and is keyed by that runner's details URL.
+    """
+    splits = SplitTable.empty(len(all_runners), keys=all_runners.column("details_url"))
+    progress = tqdm.tqdm(total=len(all_runners), unit="page")
+    fetched = 0
+    start = time.monotonic()
+
+    async with Fetcher(per_host=concurrency, rate=rate, burst=concurrency, archive=archive, retries=retries) as fetcher:
+        def fetch(index):
+            details_url = all_runners[index]["details_url"]
+            return fetcher.fetch(FetchRequest(details_url, tags={"source": "chicago-detail", "url": details_url}))
+
+        async for index, details in run_pipeline(range(len(all_runners)), fetch, parse_detail_job,
+                                                 io_workers=concurrency):
+            if details is not None:
+                bib, city_state, elapsed, time_of_day = details
+                all_runners[index].update(bib=bib, city_state=city_state)
+                splits.set_row(index, elapsed, time_of_day)
+                fetched += 1
+            progress.update(1)
+
+    progress.close()
+    elapsed = time.monotonic() - start
+    print(f"Fetched {fetched} of {len(all_runners)} detail pages in {elapsed:.1f}s "
+          f"({fetched / max(elapsed, 1e-9):.1f} pages/sec)")
+    return splits
+
+
+def parse_archived_page(content, tags):
+    return parse_page(content, BASE_URL, tags["gender"])
+
+
+def parse_archived_detail(content, tags):
+    return parse_detail_job(tags["url"], content)
+
+
+def replay_details(all_runners, archive):
+    """
+    Fill in bib, city_state and splits from archived detail pages instead of fetching them.
+
+    Runners whose detail page was never archived keep empty fields and missing splits.
+    """
+    splits = SplitTable.empty(len(all_runners), keys=all_runners.column("details_url"))
+    rows = {details_url: index for index, details_url in enumerate(all_runners.column("details_url"))}
+    replayed = 0
+
+    for tags, (bib, city_state, elapsed, time_of_day) in replay(archive, parse_archived_detail,
+                                                                source="chicago-detail"):
+        index = rows.get(tags["url"])
+        if index is None:
+            continue
+        all_runners[index].update(bib=bib, city_state=city_state)
+        splits.set_row(index, elapsed, time_of_day)
+        replayed += 1
+
+    print(f"Replayed {replayed} of {len(all_runners)} detail pages")
+    return splits
+
+
+def scrape_list_pages(archive):
+    contents = fetch_all(
+        [FetchRequest(BASE_URL + PATH.format(page=page, sex=sex),
+                      tags={"source": "chicago", "page": page, "sex": sex, "gender": gender})
+         for page, sex, gender in LIST_PAGES],
+        per_host=4, rate=2.0, burst=4, archive=archive,
+    )
+
+    all_runners = ResultBatch(CHICAGO)
+    for (page, sex, gender), content in tqdm.tqdm(zip(LIST_PAGES, contents), total=len(LIST_PAGES)):
+        all_runners.extend(REGISTRY.parse("chicago_list", parse_page, content, BASE_URL, gender))
+    return all_runners
+
+
+def replay_list_pages(archive):
+    all_runners = ResultBatch(CHICAGO)
+    # "man" sorts before "woman", matching the crawl order
+    for _, runners in replay(archive, parse_archived_page, order_by=("gender", "page"), source="chicago"):
+        all_runners.extend(runners)
+    return all_runners
+
+
+def save_runners(all_runners, output_file):
+    """
+    Save the runner list, with bib and city_state if details were fetched, to a CSV file.
+    """
+    start = time.perf_counter()
+    with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(headers(CHICAGO))
+        csvwriter.writerows(all_runners)
+    REGISTRY.record_write("csv", time.perf_counter() - start, len(all_runners))
+    print(f"Runners saved to {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Chicago Marathon results")
+    parser.add_argument("--archive", default="archive", help="Directory of the raw page archive")
+    parser.add_argument("--replay", action="store_true", help="Re-parse archived pages instead of fetching")
+    parser.add_argument("--details", action="store_true", help="Also fetch every runner's detail page with splits")
+    parser.add_argument("--detail-concurrency", type=int, default=8, help="Detail pages fetched in parallel")
+    parser.add_argument("--detail-rate", type=float, default=5.0, help="Detail pages requested per second")
+    parser.add_argument("--runners-file", default="chicago_runners_2021.csv", help="Where to save the runner list")
+    parser.add_argument("--splits-file", default="chicago_splits_2021.npz", help="Where to save the split table")
+    parser.add_argument("--metrics", help="Write crawl metrics here: JSON if it ends in .json, else a Prometheus textfile")
+    parser.add_argument("--metrics-interval", type=float, help="Also rewrite the metrics every this many seconds")
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    with REGISTRY.reporting(args.metrics, args.metrics_interval):
+        all_runners = replay_list_pages(archive) if args.replay else scrape_list_pages(archive)
 
-for page in tqdm.tqdm(range(1, 16)):
-    all_runners += parse_page(BASE_URL, PATH.format(page=page, sex="M"), gender="man")
+        if args.details and args.replay:
+            splits = replay_details(all_runners, archive)
+        elif args.details:
+            splits = asyncio.run(fetch_details(all_runners, archive, concurrency=args.detail_concurrency,
+                                               rate=args.detail_rate))
+            with REGISTRY.timer("scrape_write_seconds", writer="splits"):
+                splits.save(args.splits_file)
 
-for page in tqdm.tqdm(range(1, 13)):
-    all_runners += parse_page(BASE_URL, PATH.format(page=page, sex="W"), gender="woman")
+        save_runners(all_runners, args.runners_file)
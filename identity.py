@@ -0,0 +1,307 @@
+import argparse
+import csv
+import hashlib
+import re
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from timeconv import parse_hms
+
+# Characters dropped from names before hashing; shared with berlin.py so hashes match
+NAME_JUNK = re.compile(r"[-.,_'!?0-9]+|\s+")
+# Trailing parenthesized groups such as a country "(USA)" or a sex/age "(M)" / "(F32)"
+NAME_SUFFIX = re.compile(r"(\s*\([^)]*\))+\s*$")
+AGE_RANGE = re.compile(r"(\d+)\s*-\s*(\d+)")
+AGE_FROM = re.compile(r"(\d+)")
+
+
+class Appearance(NamedTuple):
+    """
+    One finish of one runner, as linked into the identity index.
+
+    Args:
+        source (str): Race and dataset the row comes from ('berlin', 'boston', 'marathonguide-chicago', ...)
+        year (int): Year of the race
+        name_hash (str): Normalized name hash, see name_hash()
+        yob_lo (int): Earliest possible year of birth, or None if unknown
+        yob_hi (int): Latest possible year of birth, or None if unknown
+        place (int): Overall place, or None
+        finish_time (int): Finish time in seconds, or None
+    """
+    source: str
+    year: int
+    name_hash: str
+    yob_lo: Optional[int]
+    yob_hi: Optional[int]
+    place: Optional[int]
+    finish_time: Optional[int]
+
+
+def name_hash(forename: str, surname: str) -> str:
+    """
+    Hash a name the way berlin.py does: lowercase forename + surname without punctuation, digits or spaces.
+    """
+    return hashlib.sha1(NAME_JUNK.sub('', (forename + surname).lower()).encode()).hexdigest()
+
+
+def full_name_hash(full_name: str) -> str:
+    """
+    Hash a clear-text name such as "Doe, Jane (USA)", "Doe, Jane (F)" or "Jane Doe".
+
+    The same runner hashes the same in every source, so MarathonGuide and Boston rows link to berlin.py rows:
+
+    >>> full_name_hash("García, Kofi (M)") == full_name_hash("García, Kofi (USA)") == name_hash("Kofi", "García")
+    True
+    """
+    full_name = NAME_SUFFIX.sub('', full_name)
+    if ',' in full_name:
+        surname, forename = full_name.split(',', 1)
+        return name_hash(forename, surname)
+    return name_hash(full_name, '')
+
+
+def birth_years(year: int, division: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Possible years of birth given an age division such as "M40-44", "40-44" or "M60".
+
+    Args:
+        year (int): Year of the race
+        division (str): Age division
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: (earliest, latest) year of birth; None where unbounded
+    """
+    match = AGE_RANGE.search(division or '')
+    if match:
+        lo, hi = int(match.group(1)), int(match.group(2))
+        return year - hi - 1, year - lo
+    match = AGE_FROM.search(division or '')
+    if match:
+        return None, year - int(match.group(1))
+    return None, None
+
+
+def as_int(value: str) -> Optional[int]:
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def as_seconds(value: str) -> Optional[int]:
+    seconds = parse_hms(value)
+    return seconds if seconds >= 0 else None
+
+
+def berlin_appearances(path: str, year: int) -> Iterator[Appearance]:
+    """
+    Appearances from a berlin.py year file (already hashed names, exact year of birth).
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yob = as_int(row['yob'])
+            yield Appearance('berlin', year, row['name'], yob, yob, as_int(row['place']), as_int(row['netTime']))
+
+
+def marathonguide_appearances(path: str, race: str) -> Iterator[Appearance]:
+    """
+    Appearances from a chicago.py / berlin2.py results file of the given race ('chicago', 'berlin', ...).
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            year = int(row['Year'])
+            lo, hi = birth_years(year, row['Division'])
+            yield Appearance(f'marathonguide-{race}', year, full_name_hash(row['Full Name']), lo, hi,
+                             as_int(row['Overall Place']), as_seconds(row['Finish Time']))
+
+
+def boston_appearances(path: str) -> Iterator[Appearance]:
+    """
+    Appearances from a boston.py results file (no age information).
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield Appearance('boston', int(row['Year']), full_name_hash(row['Full Name']), None, None,
+                             as_int(row['Overall Place']), as_seconds(row['Finish Net Time']))
+
+
+class IdentityIndex:
+    """
+    Persistent index linking finishes of the same runner across years and races.
+
+    Runners are blocked on their normalized name hash and told apart by their
+    possible years of birth: an appearance joins the runner with the same hash
+    whose birth-year window overlaps its own, narrowing that window, or starts
+    a new runner. An appearance without an age (Boston) only joins a runner
+    if that is the only runner with its name hash. Linking is a hash lookup
+    per row, so building the index is linear in the number of rows. The
+    index lives in SQLite with indexes on name hash and runner id, so lookups
+    and repeat-finisher queries stay fast on millions of rows.
+    """
+
+    def __init__(self, path: str = 'runners.sqlite'):
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS runners (
+                id INTEGER PRIMARY KEY,
+                name_hash TEXT NOT NULL,
+                yob_lo INTEGER,
+                yob_hi INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS appearances (
+                runner_id INTEGER NOT NULL REFERENCES runners (id),
+                source TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                place INTEGER,
+                finish_time INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS runners_name_hash ON runners (name_hash);
+            CREATE INDEX IF NOT EXISTS appearances_runner ON appearances (runner_id);
+        """)
+
+    def link(self, appearances: Iterable[Appearance], batch_size: int = 100_000) -> int:
+        """
+        Link appearances to runners, creating runners as needed.
+
+        Args:
+            appearances (Iterable[Appearance]): Rows to link
+            batch_size (int, optional): Rows per SQLite write. Defaults to 100_000.
+
+        Returns:
+            int: Number of appearances linked
+        """
+        # name hash -> [[runner id, yob_lo, yob_hi], ...]; almost always a single runner
+        blocks: Dict[str, List[List[Optional[int]]]] = defaultdict(list)
+        for runner_id, hash_, lo, hi in self.db.execute("SELECT id, name_hash, yob_lo, yob_hi FROM runners"):
+            blocks[hash_].append([runner_id, lo, hi])
+        # A runner finishes a given race at most once; same-name runners in one race are different people
+        raced: Dict[int, set] = defaultdict(set)
+        for runner_id, source, year in self.db.execute("SELECT runner_id, source, year FROM appearances"):
+            raced[runner_id].add((source, year))
+        next_id = (self.db.execute("SELECT MAX(id) FROM runners").fetchone()[0] or 0) + 1
+        changed = {}
+        pending = []
+        count = 0
+
+        for appearance in appearances:
+            race = (appearance.source, appearance.year)
+            runner = None
+            candidates = blocks[appearance.name_hash]
+            if appearance.yob_lo is None and appearance.yob_hi is None and len(candidates) > 1:
+                # Without an age there is nothing to tell namesakes apart by
+                candidates = []
+            for candidate in candidates:
+                if race in raced[candidate[0]]:
+                    continue
+                lo, hi = overlap(candidate[1], candidate[2], appearance.yob_lo, appearance.yob_hi)
+                if lo is None or hi is None or lo <= hi:
+                    runner = candidate
+                    runner[1], runner[2] = lo, hi
+                    break
+            if runner is None:
+                runner = [next_id, appearance.yob_lo, appearance.yob_hi]
+                next_id += 1
+                blocks[appearance.name_hash].append(runner)
+            raced[runner[0]].add(race)
+            changed[runner[0]] = (runner[0], appearance.name_hash, runner[1], runner[2])
+
+            pending.append((runner[0], appearance.source, appearance.year, appearance.place, appearance.finish_time))
+            count += 1
+            if len(pending) >= batch_size:
+                self.write(changed, pending)
+
+        self.write(changed, pending)
+        return count
+
+    def write(self, changed: Dict[int, Tuple], pending: List[Tuple]):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO runners VALUES (?, ?, ?, ?)", changed.values())
+            self.db.executemany("INSERT INTO appearances VALUES (?, ?, ?, ?, ?)", pending)
+        changed.clear()
+        pending.clear()
+
+    def find(self, full_name: str) -> List[Tuple[int, Optional[int], Optional[int]]]:
+        """
+        Runners whose name matches a clear-text name.
+
+        Returns:
+            List[Tuple[int, Optional[int], Optional[int]]]: (runner id, yob_lo, yob_hi)
+        """
+        return self.db.execute("SELECT id, yob_lo, yob_hi FROM runners WHERE name_hash = ?",
+                               (full_name_hash(full_name),)).fetchall()
+
+    def races(self, runner_id: int) -> List[Tuple[str, int, Optional[int], Optional[int]]]:
+        """
+        All races of a runner.
+
+        Returns:
+            List[Tuple[str, int, Optional[int], Optional[int]]]: (source, year, place, finish time) by year
+        """
+        return self.db.execute("SELECT source, year, place, finish_time FROM appearances "
+                               "WHERE runner_id = ? ORDER BY year", (runner_id,)).fetchall()
+
+    def repeat_finishers(self, min_races: int = 2) -> List[Tuple[int, int]]:
+        """
+        Runners with at least `min_races` finishes.
+
+        Returns:
+            List[Tuple[int, int]]: (runner id, number of finishes), most finishes first
+        """
+        return self.db.execute("SELECT runner_id, COUNT(*) AS n FROM appearances GROUP BY runner_id "
+                               "HAVING n >= ? ORDER BY n DESC", (min_races,)).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def overlap(lo_a: Optional[int], hi_a: Optional[int],
+            lo_b: Optional[int], hi_b: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Intersection of two birth-year windows, where None means unbounded.
+    """
+    lo = lo_a if lo_b is None else lo_b if lo_a is None else max(lo_a, lo_b)
+    hi = hi_a if hi_b is None else hi_b if hi_a is None else min(hi_a, hi_b)
+    return lo, hi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Link runners across years and races")
+    parser.add_argument("--db", default="runners.sqlite", help="Identity index database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("link", help="Link result files into the index")
+    build.add_argument("--berlin", nargs=2, action="append", default=[], metavar=("CSV", "YEAR"),
+                       help="berlin.py year file and its year")
+    build.add_argument("--boston", action="append", default=[], metavar="CSV", help="boston.py results file")
+    build.add_argument("--marathonguide", nargs=2, action="append", default=[], metavar=("CSV", "RACE"),
+                       help="chicago.py / berlin2.py results file and its race, e.g. chicago")
+
+    runner = sub.add_parser("runner", help="Show all races of a runner")
+    runner.add_argument("name", help='Name, e.g. "Doe, Jane" or "Jane Doe"')
+
+    repeat = sub.add_parser("repeat", help="List repeat finishers")
+    repeat.add_argument("--min-races", type=int, default=2)
+
+    args = parser.parse_args()
+    index = IdentityIndex(args.db)
+
+    if args.command == "link":
+        for path, year in args.berlin:
+            print(f"{path}: {index.link(berlin_appearances(path, int(year)))} finishes linked")
+        for path in args.boston:
+            print(f"{path}: {index.link(boston_appearances(path))} finishes linked")
+        for path, race in args.marathonguide:
+            print(f"{path}: {index.link(marathonguide_appearances(path, race))} finishes linked")
+    elif args.command == "runner":
+        for runner_id, lo, hi in index.find(args.name):
+            print(f"Runner {runner_id} (born {lo or '?'}-{hi or '?'}):")
+            for source, year, place, finish_time in index.races(runner_id):
+                print(f"  {year} {source}: place {place}, {finish_time} s")
+    else:
+        for runner_id, n in index.repeat_finishers(args.min_races):
+            print(f"Runner {runner_id}: {n} finishes")
+
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,30 @@
+import argparse
+import itertools
+
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
-import pandas as pd
+import numpy as np
+
+import regression
+import storage
+from splits import SplitTable
+
+data_path = "results/cleaned_marathon_data"  # Replace with your actual dataset directory
 
-file_path = "results/cleaned_marathon_data.csv"  # Replace with your actual file path
-df = pd.read_csv(file_path, sep=";")
 
-# Ensure we have the required data columns for regression
-required_columns = ['time_full', 'split_5k', 'split_10k', 'split_15k', 'split_20k']
-if all(col in df.columns for col in required_columns):
+def fit_in_memory(data_path, model_path=None):
+    # Ensure we have the required data columns for regression
+    required_columns = ['time_full', 'split_5k', 'split_10k', 'split_15k', 'split_20k']
+    df = storage.load(data_path, columns=required_columns)
+    if not all(col in df.columns for col in required_columns):
+        print("Required columns for linear regression are not available in the dataset.")
+        return
+
     # Drop rows with missing values in the required columns
-    df_cleaned = df[required_columns].dropna()
+    df_cleaned = df[required_columns].dropna().astype('float64')
 
     # Define features (X) and target (y)
     X = df_cleaned[['split_5k', 'split_10k', 'split_15k', 'split_20k']]
@@ -35,6 +49,11 @@ if all(col in df.columns for col in required_columns):
     print(f"Mean Squared Error (MSE): {mse:.2f}")
     print(f"R-squared (R2 Score): {r2:.2f}")
 
+    if model_path:
+        regression.LinearModel(float(model.intercept_), model.coef_.astype(np.float64)).save(
+            model_path, train_rows=len(y_train), test_mse=mse, test_r2=r2)
+        print(f"Model saved to {model_path}")
+
     # Visualize actual vs predicted times
     plt.figure(figsize=(8, 5))
     plt.scatter(y_test, y_pred, alpha=0.7)
@@ -44,5 +63,64 @@ if all(col in df.columns for col in required_columns):
     plt.ylabel("Predicted Finish Time (seconds)")
     plt.grid(alpha=0.3)
     plt.show()
-else:
-    print("Required columns for linear regression are not available in the dataset.")
+
+
+def fit_chunked(batches, by_year=False, model_path=None):
+    """
+    Fit from the sufficient statistics of a stream of batches, then chart the test rows in a second streaming pass.
+
+    Args:
+        batches (Callable[[], Iterable[regression.Batch]]): Returns a fresh iterator over the same batches
+        by_year (bool, optional): Print a per-year breakdown. Defaults to False.
+        model_path (str, optional): Save the fitted model here for regression.LinearModel.load()
+    """
+    result = regression.fit_streaming(batches(), by_year=by_year)
+    if not result.train.count:
+        print("No finishers with all split times in the dataset.")
+        return
+    regression.report(result)
+    if model_path:
+        mse, r2 = result.test.metrics(result.model)
+        result.model.save(model_path, train_rows=result.train.count, test_mse=mse, test_r2=r2)
+        print(f"Model saved to {model_path}")
+
+    # Visualize actual vs predicted times
+    counts, edges = regression.prediction_histogram(regression.test_predictions(batches(), result.model))
+    plt.figure(figsize=(8, 5))
+    plt.pcolormesh(edges, edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap="viridis")
+    plt.colorbar(label="Finishers")
+    plt.plot([edges[0], edges[-1]], [edges[0], edges[-1]], 'r--', lw=2)
+    plt.title("Actual vs Predicted Finish Times")
+    plt.xlabel("Actual Finish Time (seconds)")
+    plt.ylabel("Predicted Finish Time (seconds)")
+    plt.grid(alpha=0.3)
+    plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict the finish time from the first four splits")
+    parser.add_argument("--data", default=data_path, help="Dataset directory")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Stream the data and fit from accumulated statistics in constant memory")
+    parser.add_argument("--by-year", action="store_true", help="With --chunked, add a per-year breakdown")
+    parser.add_argument("--splits", nargs=2, action="append", default=[], metavar=("NPZ", "YEAR"),
+                        help="With --chunked, also train on a githubChicago.py --splits-file of the given year")
+    parser.add_argument("--batch-size", type=int, default=1 << 17, help="Rows per streamed batch")
+    parser.add_argument("--save-model", nargs="?", const=regression.MODEL_PATH, metavar="JSON",
+                        help=f"Save the fitted model (default {regression.MODEL_PATH})")
+    args = parser.parse_args()
+
+    if not args.chunked:
+        fit_in_memory(args.data, args.save_model)
+        return
+
+    def batches():
+        streams = [regression.dataset_batches(args.data, batch_size=args.batch_size)]
+        streams += [regression.split_table_batches(SplitTable.load(path), int(year)) for path, year in args.splits]
+        return itertools.chain(*streams)
+
+    fit_chunked(batches, by_year=args.by_year, model_path=args.save_model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Marathon Guide results ranges, shared by chicago.py and berlin2.py: requests, crawling, replay and CSV output.
+"""
+import asyncio
+import csv
+import time
+from functools import partial
+from typing import Any, Dict, Tuple
+
+from archive import PageArchive, replay
+from checkpoint import CrawlCheckpoint
+from fetcher import Fetcher, FetchRequest
+from metrics import REGISTRY
+from parsers import DEFAULT_BACKEND, get_backend
+from records import MARATHONGUIDE, ResultBatch, headers
+
+def parse_race_results(html_content: str, year: int, backend: str = DEFAULT_BACKEND) -> ResultBatch:
+    """
+    Parse HTML content of race results page from Marathon Guide.
+
+    Args:
+        html_content (str): HTML content of the race results page
+        year (int): Year of the race
+        backend (str, optional): Parser backend, 'lxml' or 'html.parser'. Defaults to 'lxml'.
+
+    Returns:
+        ResultBatch: Parsed results from the page
+    """
+    return get_backend(backend).marathonguide(html_content, year)
+
+def race_results_request(race_id: str, begin: int, end: int, max: int) -> FetchRequest:
+    """
+    Build the GET request for race results of a specific range.
+
+    Args:
+        race_id (str): Race identifier from Marathon Guide
+        begin (int): Starting result number
+        end (int): Ending result number
+        max (int): Total number of results of the race
+
+    Returns:
+        FetchRequest: Request for the race results page
+    """
+    url = "https://www.marathonguide.com/results/browse.cfm"
+    #https://www.marathonguide.com/results/browse.cfm?RL=1&MIDD=16100425&Gen=B&Begin=1&End=100&Max=36553
+    params = {
+        'RL': '1',
+        'MIDD': race_id,
+        'Gen': 'B',
+        'Begin': begin,
+        'End': end,
+        'Max': max
+    }
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:132.0) Gecko/20100101 Firefox/132.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,/;q=0.8',
+        'Accept-Language': 'en-GB,en;q=0.5',
+        'Referer': f'https://www.marathonguide.com/results/browse.cfm?RL=1&MIDD={race_id}&Gen=B&Begin=1&End=100&Max={max}'
+    }
+
+    tags = {'source': 'marathonguide', 'race_id': str(race_id), 'begin': begin}
+
+    return FetchRequest(url, params=params, headers=headers, tags=tags)
+
+async def fetch_race_results(fetcher: Fetcher, race_id: str, begin: int, end: int, max: int) -> str:
+    """
+    Fetch race results for a specific range.
+
+    Args:
+        fetcher (Fetcher): Shared fetcher
+        race_id (str): Race identifier from Marathon Guide
+        begin (int): Starting result number
+        end (int): Ending result number
+        max (int): Total number of results of the race
+
+    Returns:
+        str: HTML content of the race results page
+    """
+    return await fetcher.fetch(race_results_request(race_id, begin, end, max))
+
+async def scrape_race(fetcher: Fetcher, race_id: str, max: int, year: int,
+                      checkpoint: CrawlCheckpoint) -> Tuple[ResultBatch, bool]:
+    """
+    Fetch the outstanding result ranges of one race concurrently and parse them in order.
+
+    Completed ranges are appended to the checkpoint as they arrive, so an
+    interrupted crawl resumes where it stopped instead of starting over.
+    A range that still fails after the fetcher's retries stays outstanding,
+    and the crawl is reported as incomplete. So does a range that comes back
+    empty: every range lies before the announced `max`, so an empty page is
+    a failed fetch, not the end of the race. Only a short page, with fewer
+    than 100 results, confirms where the race ends.
+
+    Args:
+        fetcher (Fetcher): Shared fetcher
+        race_id (str): Race identifier from Marathon Guide
+        max (int): Total number of results of the race
+        year (int): Year of the race
+        checkpoint (CrawlCheckpoint): Progress of this race's crawl
+
+    Returns:
+        Tuple[ResultBatch, bool]: Parsed results of the race, and whether every range was fetched
+    """
+    # Fetch results in batches of 100; the fetcher limits how many are in flight
+    begins = [begin for begin in range(1, max, 100) if not checkpoint.is_done(begin)]
+    tasks = [asyncio.ensure_future(fetch_race_results(fetcher, race_id, begin, begin + 99, max)) for begin in begins]
+    failed = []
+
+    try:
+        for begin, task in zip(begins, tasks):
+            end = begin + 99
+            html_content = await task
+
+            if not html_content:
+                # Leave this range outstanding so the next run retries it
+                failed.append(begin)
+                continue
+
+            page_results = REGISTRY.parse('marathonguide', parse_race_results, html_content, year)
+
+            if not page_results:
+                # Results were announced up to max, so retry this range next run
+                print(f"Results {begin} to {end} came back empty")
+                failed.append(begin)
+                continue
+
+            checkpoint.record(begin, page_results)
+            print(f"Fetched results {begin} to {end}")
+
+            if len(page_results) < 100:
+                # The site has no results after a short page
+                checkpoint.mark_end(begin + 100)
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Ranges past a short page are not missing results
+    missing = [begin for begin in failed if not checkpoint.is_done(begin)]
+    if missing:
+        print(f"Race {race_id} ({year}): {len(missing)} result ranges could not be fetched, run again to resume")
+
+    all_results = ResultBatch(MARATHONGUIDE)
+    for row in checkpoint.rows():
+        all_results.append(row)
+    return all_results, not missing
+
+def parse_archived_page(html_content: str, tags: Dict[str, Any], year: int) -> ResultBatch:
+    """
+    Parse an archived results range of a race.
+
+    Args:
+        html_content (str): HTML content of the archived page
+        tags (Dict[str, Any]): Tags of the archive entry
+        year (int): Year of the race
+
+    Returns:
+        ResultBatch: Parsed results from the page
+    """
+    return parse_race_results(html_content, year)
+
+def replay_race(archive: PageArchive, race_id: str, year: int) -> ResultBatch:
+    """
+    Re-parse the archived ranges of one race offline, in result order.
+
+    Args:
+        archive (PageArchive): Archive of previously fetched pages
+        race_id (str): Race identifier from Marathon Guide
+        year (int): Year of the race
+
+    Returns:
+        ResultBatch: Parsed results of the race
+    """
+    all_results = ResultBatch(MARATHONGUIDE)
+    parse = partial(parse_archived_page, year=year)
+    for tags, page_results in replay(archive, parse, order_by=('begin',), source='marathonguide', race_id=str(race_id)):
+        if not page_results:
+            break
+        all_results.extend(page_results)
+    return all_results
+
+def save_to_csv(results, output_file):
+    """
+    Save results to a CSV file.
+
+    Args:
+        results (Iterable[Sequence[Any]]): Race results to save, e.g. a ResultBatch
+        output_file (str): Path to output CSV file
+    """
+    # Write to CSV
+    start = time.perf_counter()
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(headers(MARATHONGUIDE))
+        csvwriter.writerows(results)
+    REGISTRY.record_write('csv', time.perf_counter() - start, len(results))
+
+    print(f"Results saved to {output_file}")
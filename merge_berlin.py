@@ -1,42 +1,122 @@
+import csv
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
 # Directory containing the CSV files
 directory = "./external_data/Berlin/"
 
-# Initialize an empty list to store dataframes
-dataframes = []
+# Specify the output path
+output_path = "results/merged_marathon_results.csv"
+
+# Rows read at a time per worker
+CHUNK_SIZE = 200_000
+
 
-try:
-    # Iterate through all files in the directory
+def yearly_files(directory):
+    """
+    List the results-YYYY.csv files of a directory as (year, path), oldest first.
+    """
+    files = []
     for filename in os.listdir(directory):
         if filename.endswith(".csv") and filename.startswith("results-"):
-            print(f"Processing {filename}")
-            file_path = os.path.join(directory, filename)
-
             # Extract year from the filename (e.g., "results-2018.csv")
-            year = filename.split("-")[1].split(".")[0]
-
-            # Read the CSV file
             try:
-                df = pd.read_csv(file_path)
-                df["year"] = int(year)  # Add the year column
-                dataframes.append(df)
-            except Exception as e:
+                year = int(filename.split("-")[1].split(".")[0])
+            except ValueError as e:
                 print(f"Error reading {filename}: {e}")
+                continue
+            files.append((year, os.path.join(directory, filename)))
+    return sorted(files)
+
+
+def read_columns(file_path):
+    """
+    Header of one yearly file as (columns, None), or (None, error) if it cannot be read.
+    """
+    try:
+        return list(pd.read_csv(file_path, nrows=0).columns), None
+    except Exception as e:
+        return None, str(e)
+
+
+def union_schema(column_lists):
+    """
+    Union of all files' columns plus "year", in order of first appearance (as pd.concat would align them).
+    """
+    columns = {}
+    for file_columns in column_lists:
+        for column in file_columns + ["year"]:
+            columns.setdefault(column, None)
+    return list(columns)
+
+
+def write_part(file_path, year, columns, part_path, chunk_size=CHUNK_SIZE):
+    """
+    Stream one yearly file into a headerless part file aligned to the union schema.
+
+    Values are copied as text, so nothing is re-formatted on the way through.
+    """
+    try:
+        with open(part_path, "w", newline="", encoding="utf-8") as part:
+            for chunk in pd.read_csv(file_path, dtype=str, chunksize=chunk_size):
+                chunk["year"] = str(year)  # Add the year column
+                chunk.reindex(columns=columns).to_csv(part, index=False, header=False)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def merge(directory, output_path, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Merge all yearly files into one CSV, reading them in parallel and streaming the rows.
+
+    Returns:
+        int: Number of yearly files merged
+    """
+    files = yearly_files(directory)
+    merged = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        headers = list(executor.map(read_columns, [path for _, path in files]))
+        for (year, file_path), (_, error) in zip(files, headers):
+            if error is not None:
+                print(f"Error reading {os.path.basename(file_path)}: {error}")
+        files = [file for file, (file_columns, _) in zip(files, headers) if file_columns is not None]
+        if not files:
+            return 0
+
+        columns = union_schema([file_columns for file_columns, _ in headers if file_columns is not None])
+        # Several files can hold the same year ("results-2018.csv", "results-2018-fix.csv"), so parts are
+        # named by position
+        part_paths = [f"{output_path}.part-{index}" for index in range(len(files))]
+        errors = executor.map(write_part, [path for _, path in files], [year for year, _ in files],
+                              [columns] * len(files), part_paths, [chunk_size] * len(files))
+
+        with open(output_path, "w", newline="", encoding="utf-8") as output:
+            csv.writer(output).writerow(columns)
+            # Parts arrive in year order; each is appended as soon as its worker is done
+            for (year, file_path), part_path, error in zip(files, part_paths, errors):
+                print(f"Processing {os.path.basename(file_path)}")
+                if error is None:
+                    with open(part_path, "r", newline="", encoding="utf-8") as part:
+                        shutil.copyfileobj(part, output)
+                    merged += 1
+                else:
+                    print(f"Error reading {os.path.basename(file_path)}: {error}")
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    return merged
+
 
-    # Merge all dataframes, aligning columns dynamically
-    if dataframes:
-        merged_df = pd.concat(dataframes, ignore_index=True, sort=False)
-
-        # Specify the output path
-        output_path = "results/merged_marathon_results.csv"
-
-        # Save the merged DataFrame
-        merged_df.to_csv(output_path, index=False)
-        print(merged_df.values)
-        print(f"File saved at: {output_path}")
-    else:
-        print("No dataframes to merge. Check if the directory contains valid CSV files.")
-except Exception as e:
-    print(f"An error occurred: {e}")
+if __name__ == "__main__":
+    try:
+        # Merge all dataframes, aligning columns dynamically
+        if merge(directory, output_path):
+            print(f"File saved at: {output_path}")
+        else:
+            print("No dataframes to merge. Check if the directory contains valid CSV files.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
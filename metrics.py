@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from records import ResultBatch
+
+# Upper bounds of the histogram buckets, by unit
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(8))
+
+# Metrics recorded by the scrapers: name -> (help, buckets for histograms or None for counters)
+METRICS: Dict[str, Tuple[str, Optional[Sequence[float]]]] = {
+    'scrape_fetch_requests_total': ("HTTP requests sent, by host and status ('error' without a response)", None),
+    'scrape_fetch_retries_total': ("Requests repeated after a retryable failure", None),
+    'scrape_fetch_failures_total': ("Requests given up on", None),
+    'scrape_fetch_bytes_total': ("Response bytes received", None),
+    'scrape_fetch_seconds': ("Time from sending a request to having its whole response", SECONDS_BUCKETS),
+    'scrape_fetch_wait_seconds': ("Time a request waited for a connection slot and the rate limiter", SECONDS_BUCKETS),
+    'scrape_fetch_response_bytes': ("Size of each response body", BYTES_BUCKETS),
+    'scrape_requeued_total': ("Failed jobs put back in the queue to be tried again", None),
+    'scrape_parse_pages_total': ("Pages parsed", None),
+    'scrape_parse_rows_total': ("Rows parsed out of pages", None),
+    'scrape_parse_seconds': ("Time to parse one page", SECONDS_BUCKETS),
+    'scrape_write_rows_total': ("Rows written to output files", None),
+    'scrape_write_seconds': ("Time of each write to an output file, including flushing", SECONDS_BUCKETS),
+}
+
+# Values that go up and down: name -> help
+GAUGES: Dict[str, str] = {
+    'scrape_fetch_concurrency_limit': "Requests allowed in flight to a host",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Counts of observations per bucket, with their sum, as in Prometheus.
+    """
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        # One count per bound, plus the observations above the last one
+        self.counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[np.searchsorted(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+
+class Registry:
+    """
+    Counters, gauges and histograms of a crawl, labelled e.g. by host or parser.
+
+    Updating a metric is a dict lookup and an addition under a lock, cheap
+    next to the request or parse it measures. The lock lets a background
+    thread export snapshots while the crawl keeps recording.
+    """
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(METRICS[name][1] or SECONDS_BUCKETS)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """
+        Observe the wall time of the block, in seconds, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record_parse(self, parser: str, seconds: float, rows: Optional[int] = None):
+        """
+        Record one parsed page: its parse time and, if known, how many rows it held.
+        """
+        self.observe('scrape_parse_seconds', seconds, parser=parser)
+        self.inc('scrape_parse_pages_total', parser=parser)
+        if rows is not None:
+            self.inc('scrape_parse_rows_total', rows, parser=parser)
+
+    def parse(self, parser: str, parse: Callable[..., Any], *args: Any) -> Any:
+        """
+        Call parse(*args) in this process and record it with record_parse().
+        """
+        start = time.perf_counter()
+        result = parse(*args)
+        self.record_parse(parser, time.perf_counter() - start, rows_of(result))
+        return result
+
+    def record_write(self, writer: str, seconds: float, rows: int):
+        self.observe('scrape_write_seconds', seconds, writer=writer)
+        self.inc('scrape_write_rows_total', rows, writer=writer)
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Snapshot of every metric; histograms carry their bucket bounds, counts, sum and mean.
+        """
+        with self.lock:
+            counters = [(name, labels, value) for (name, labels), value in
+                        list(self.counters.items()) + list(self.gauges.items())]
+            histograms = [(name, labels, h.bounds.tolist(), h.counts.tolist(), h.sum)
+                          for (name, labels), h in self.histograms.items()]
+        snapshot: Dict[str, Any] = {'started': self.started, 'elapsed_seconds': time.time() - self.started,
+                                    'metrics': {}}
+        for name, labels, value in sorted(counters):
+            snapshot['metrics'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for name, labels, bounds, counts, total in sorted(histograms):
+            count = sum(counts)
+            snapshot['metrics'].setdefault(name, []).append({
+                'labels': dict(labels), 'count': count, 'sum': total, 'mean': total / count if count else None,
+                'buckets': {format_bound(bound): n for bound, n in zip(bounds + [float('inf')], counts)},
+            })
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        Snapshot of every metric in the Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+        """
+        snapshot = self.to_json()
+        lines = ['# HELP scrape_elapsed_seconds Time since the crawl started',
+                 '# TYPE scrape_elapsed_seconds gauge',
+                 f"scrape_elapsed_seconds {snapshot['elapsed_seconds']:.3f}"]
+        for name, series in snapshot['metrics'].items():
+            if name in GAUGES:
+                help_text, kind = GAUGES[name], 'gauge'
+            else:
+                help_text, kind = METRICS[name][0], 'histogram' if METRICS[name][1] is not None else 'counter'
+            is_histogram = kind == 'histogram'
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for entry in series:
+                labels = entry['labels']
+                if not is_histogram:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(entry['value'])}")
+                    continue
+                cumulative = 0
+                for bound, n in entry['buckets'].items():
+                    cumulative += n
+                    lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(entry['sum'])}")
+                lines.append(f"{name}_count{format_labels(labels)} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """
+        Atomically write a snapshot: JSON if the path ends in .json, a Prometheus textfile otherwise.
+        """
+        text = json.dumps(self.to_json(), indent=1) if path.endswith('.json') else self.to_prometheus()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def reporting(self, path: Optional[str], interval: Optional[float] = None) -> Iterator[None]:
+        """
+        Write a snapshot to `path` every `interval` seconds while the block runs, and once when it ends.
+
+        Does nothing without a path, so scrapers can wrap their run in it unconditionally.
+        """
+        if not path:
+            yield
+            return
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(interval):
+                self.write(path)
+
+        thread = threading.Thread(target=report, daemon=True) if interval else None
+        if thread:
+            thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            if thread:
+                thread.join()
+            self.write(path)
+            print(f"Metrics written to {path}")
+
+
+def rows_of(result: Any) -> Optional[int]:
+    """
+    Rows of a parse result: the length of a list or ResultBatch, unknown for anything else.
+    """
+    return len(result) if isinstance(result, (list, ResultBatch)) else None
+
+
+def label_key(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else format_value(bound)
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# Registry every scraper records into
+REGISTRY = Registry()
@@ -0,0 +1,360 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from records import BOSTON, MARATHONGUIDE, ResultBatch
+
+# Matches the name cell of a Marathon Guide row, e.g. "Doe, Jane (F)" or "Doe, Jane (F32)"
+NAME_SEX_PATTERN = re.compile(r'^(.+?)\s*\(([MF])[^)]*\)')
+
+BOSTON_ENTRY_CLASSES = ('list-active list-group-item row', 'list-group-item row')
+BOSTON_NAME_CLASS = 'list-field type-fullname'
+BOSTON_OVERALL_PLACE_CLASS = 'list-field type-place place-secondary hidden-xs numeric'
+BOSTON_GENDER_PLACE_CLASS = 'list-field type-place place-primary numeric'
+BOSTON_BIB_CLASS = 'list-field type-field'
+BOSTON_BIB_STYLE = 'width: 45px'
+BOSTON_BIB_LABEL_CLASS = 'visible-xs-block visible-sm-block list-label'
+BOSTON_TIME_CLASS = 'split list-field type-time'
+
+# Opening tag of a Marathon Guide results table, and any table tag after it
+MARATHONGUIDE_TABLE_START = re.compile(r'<table\b[^>]*\bclass\s*=\s*["\']?[^"\'>]*\bcolordataTable\b', re.IGNORECASE)
+TABLE_TAG = re.compile(r'<(/?)table\b', re.IGNORECASE)
+
+
+class ParserBackend(ABC):
+    """
+    Interface of an HTML parsing backend for the results scrapers.
+
+    Every backend must return exactly the same rows for the same page; they
+    only differ in how fast they get there. Rows are appended to a
+    ResultBatch, which converts places and times to integers as they arrive.
+    """
+
+    name = None
+
+    @abstractmethod
+    def boston(self, html_content: str, year: int) -> ResultBatch:
+        """
+        Parse a results.baa.org results page.
+
+        Args:
+            html_content (str): HTML content of the race results page
+            year (int): Year of the race
+
+        Returns:
+            ResultBatch: Parsed results from the page
+        """
+
+    @abstractmethod
+    def marathonguide(self, html_content: str, year: int) -> ResultBatch:
+        """
+        Parse a Marathon Guide results page.
+
+        Args:
+            html_content (str): HTML content of the race results page
+            year (int): Year of the race
+
+        Returns:
+            ResultBatch: Parsed results from the page
+        """
+
+
+class SoupBackend(ParserBackend):
+    """
+    Reference backend on BeautifulSoup's pure-Python 'html.parser'.
+    """
+
+    name = 'html.parser'
+
+    def boston(self, html_content: str, year: int) -> ResultBatch:
+        # Parse the HTML
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        # Find all list items with the specified class
+        race_entries = soup.find_all('li', class_=list(BOSTON_ENTRY_CLASSES))
+
+        # Prepare results batch
+        results = ResultBatch(BOSTON)
+
+        # Extract information from each entry
+        for entry in race_entries:
+            # Extract full name and location
+            name_elem = entry.find('h4', class_=BOSTON_NAME_CLASS)
+            full_name = name_elem.get_text(strip=True) if name_elem else 'N/A'
+
+            # Extract overall place
+            overall_place_elem = entry.find('div', class_=BOSTON_OVERALL_PLACE_CLASS)
+            overall_place = overall_place_elem.get_text(strip=True) if overall_place_elem else 'N/A'
+
+            # Extract gender place
+            gender_place_elem = entry.find('div', class_=BOSTON_GENDER_PLACE_CLASS)
+            gender_place = gender_place_elem.get_text(strip=True) if gender_place_elem else 'N/A'
+
+            # Extract BIB number with more robust method
+            bib_elem = entry.find('div', class_=BOSTON_BIB_CLASS, style=BOSTON_BIB_STYLE)
+            bib_number = 'N/A'
+            if bib_elem:
+                bib_label = bib_elem.find('div', class_=BOSTON_BIB_LABEL_CLASS)
+                if bib_label:
+                    # Try different methods to extract BIB number
+                    bib_text = bib_label.find_next_sibling()
+                    if bib_text:
+                        bib_number = bib_text.get_text(strip=True)
+                    elif bib_label.next_sibling:
+                        bib_number = bib_label.next_sibling.strip()
+
+            # Extract finish times
+            finish_times = entry.find_all('div', class_=BOSTON_TIME_CLASS)
+
+            # Remove 'HALF', 'Finish Net', 'Finish Gun' prefixes and clean up times
+            half_time = finish_times[0].get_text(strip=True).replace('HALF', '').strip() if finish_times else 'N/A'
+            finish_net_time = finish_times[1].get_text(strip=True).replace('Finish Net', '').strip() if len(finish_times) > 1 else 'N/A'
+            finish_gun_time = finish_times[2].get_text(strip=True).replace('Finish Gun', '').strip() if len(finish_times) > 2 else 'N/A'
+
+            # Append to results with year
+            results.append([
+                year,
+                full_name,
+                overall_place,
+                gender_place,
+                bib_number,
+                half_time,
+                finish_net_time,
+                finish_gun_time
+            ])
+
+        return results
+
+    def marathonguide(self, html_content: str, year: int) -> ResultBatch:
+        # Parse the HTML
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        # Find the results table
+        results_table = soup.find('table', class_='colordataTable')
+
+        # Prepare results batch
+        results = ResultBatch(MARATHONGUIDE)
+
+        # Skip the header row and iterate through data rows
+        if results_table:
+            data_rows = results_table.find_all('tr', recursive=False)[1:]
+
+            for row in data_rows:
+                # Skip rows that don't have the expected number of columns
+                cols = row.find_all('td')
+                if len(cols) < 6:
+                    continue
+
+                results.append(marathonguide_row([col.get_text(strip=True) for col in cols[:7]], year))
+
+        return results
+
+
+class LxmlBackend(ParserBackend):
+    """
+    Fast backend on libxml2 via lxml.
+
+    The page is parsed in C, the results container is located with a single
+    XPath query, and each row is walked exactly once, dispatching every
+    element on its tag and class instead of issuing one search per field.
+    Of a Marathon Guide page only the results table is parsed; the site
+    chrome around it is cut off with a regular expression first.
+    """
+
+    name = 'lxml'
+
+    parser = etree.HTMLParser(encoding='utf-8')
+
+    boston_entries = etree.XPath(
+        '//li[' + ' or '.join(f'normalize-space(@class)="{cls}"' for cls in BOSTON_ENTRY_CLASSES) + ']'
+    )
+    marathonguide_table = etree.XPath(
+        '(//table[contains(concat(" ", normalize-space(@class), " "), " colordataTable ")])[1]'
+    )
+
+    def parse(self, html_content: str) -> Optional[etree._Element]:
+        return etree.fromstring(html_content.encode('utf-8'), self.parser)
+
+    def boston(self, html_content: str, year: int) -> ResultBatch:
+        results = ResultBatch(BOSTON)
+        root = self.parse(html_content)
+        if root is None:
+            return results
+
+        for entry in self.boston_entries(root):
+            fields: Dict[str, etree._Element] = {}
+            finish_times = []
+
+            # One pass over the entry; the first match wins, as with find()
+            for elem in entry.iter('h4', 'div'):
+                cls = ' '.join(elem.get('class', '').split())
+                if elem.tag == 'h4':
+                    if cls == BOSTON_NAME_CLASS:
+                        fields.setdefault('name', elem)
+                elif cls == BOSTON_TIME_CLASS:
+                    finish_times.append(elem)
+                elif cls == BOSTON_OVERALL_PLACE_CLASS:
+                    fields.setdefault('overall', elem)
+                elif cls == BOSTON_GENDER_PLACE_CLASS:
+                    fields.setdefault('gender', elem)
+                elif cls == BOSTON_BIB_CLASS and elem.get('style') == BOSTON_BIB_STYLE:
+                    fields.setdefault('bib', elem)
+
+            name_elem = fields.get('name')
+            overall_place_elem = fields.get('overall')
+            gender_place_elem = fields.get('gender')
+
+            results.append([
+                year,
+                text(name_elem) if name_elem is not None else 'N/A',
+                text(overall_place_elem) if overall_place_elem is not None else 'N/A',
+                text(gender_place_elem) if gender_place_elem is not None else 'N/A',
+                boston_bib(fields.get('bib')),
+                text(finish_times[0]).replace('HALF', '').strip() if finish_times else 'N/A',
+                text(finish_times[1]).replace('Finish Net', '').strip() if len(finish_times) > 1 else 'N/A',
+                text(finish_times[2]).replace('Finish Gun', '').strip() if len(finish_times) > 2 else 'N/A',
+            ])
+
+        return results
+
+    def marathonguide(self, html_content: str, year: int) -> ResultBatch:
+        results = ResultBatch(MARATHONGUIDE)
+        root = self.parse(marathonguide_container(html_content))
+        if root is None:
+            return results
+
+        tables = self.marathonguide_table(root)
+        if not tables:
+            return results
+
+        for row in [child for child in tables[0] if child.tag == 'tr'][1:]:
+            # Most cells hold plain text, which needs no walk over descendants
+            cols = [(col.text or '').strip() if not len(col) else text(col) for col in row.iter('td')]
+            if len(cols) < 6:
+                continue
+            results.append(marathonguide_row(cols, year))
+
+        return results
+
+
+def marathonguide_container(html_content: str) -> str:
+    """
+    Cut a Marathon Guide page down to its first results table, with any tables nested in it.
+
+    Returns:
+        str: HTML of the table, or the whole page if it has none or the table is not closed
+    """
+    start = MARATHONGUIDE_TABLE_START.search(html_content)
+    if start is None:
+        return html_content
+    depth = 0
+    for tag in TABLE_TAG.finditer(html_content, start.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = html_content.find('>', tag.end())
+            return html_content[start.start():end + 1] if end >= 0 else html_content
+    return html_content
+
+
+def text(elem: etree._Element) -> str:
+    """
+    Equivalent of BeautifulSoup's get_text(strip=True) for an lxml element.
+    """
+    return ''.join(part.strip() for part in elem.itertext())
+
+
+def boston_bib(bib_elem: Optional[etree._Element]) -> str:
+    """
+    Extract the BIB number from a Boston bib field, mirroring SoupBackend.
+    """
+    if bib_elem is None:
+        return 'N/A'
+    for elem in bib_elem.iter('div'):
+        if ' '.join(elem.get('class', '').split()) == BOSTON_BIB_LABEL_CLASS:
+            bib_label = elem
+            break
+    else:
+        return 'N/A'
+
+    for sibling in bib_label.itersiblings():
+        if isinstance(sibling.tag, str):
+            return text(sibling)
+    if bib_label.tail:
+        return bib_label.tail.strip()
+    sibling = bib_label.getnext()
+    if sibling is not None and sibling.text:
+        # A comment directly after the label
+        return sibling.text.strip()
+    return 'N/A'
+
+
+def marathonguide_row(cols: List[str], year: int) -> List[str]:
+    """
+    Build a Marathon Guide result row from the stripped text of its cells.
+
+    Args:
+        cols (List[str]): Text of the row's cells, at least six
+        year (int): Year of the race
+
+    Returns:
+        List[str]: Result row
+    """
+    # Extract name and sex/age
+    name_col = cols[0]
+
+    # Use regex to extract name and sex
+    name_match = NAME_SEX_PATTERN.match(name_col)
+    if name_match:
+        full_name = name_match.group(1).strip()
+        sex = name_match.group(2)
+    else:
+        full_name = name_col
+        sex = 'N/A'
+
+    # Extract times and places
+    finish_time = cols[1]
+    overall_place = cols[2]
+
+    # Parse sex/div place
+    sex_div_place = cols[3]
+    sex_place, div_place = sex_div_place.split('/') if '/' in sex_div_place else (sex_div_place, 'N/A')
+
+    # Extract other details
+    division = cols[4]
+    country = cols[5]
+    # Tables without a BQ column have six cells per row
+    bq_status = cols[6] if len(cols) > 6 else 'N/A'
+
+    return [
+        year,
+        full_name,
+        sex,
+        finish_time,
+        overall_place,
+        sex_place.strip(),
+        div_place.strip(),
+        division,
+        country,
+        bq_status
+    ]
+
+
+BACKENDS: Dict[str, ParserBackend] = {backend.name: backend for backend in (SoupBackend(), LxmlBackend())}
+
+DEFAULT_BACKEND = 'lxml'
+
+
+def get_backend(name: Optional[str] = None) -> ParserBackend:
+    """
+    Look up a parser backend by name.
+
+    Args:
+        name (str, optional): 'lxml' or 'html.parser'. Defaults to DEFAULT_BACKEND.
+
+    Returns:
+        ParserBackend: The backend
+    """
+    return BACKENDS[name or DEFAULT_BACKEND]
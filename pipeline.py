@@ -0,0 +1,186 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from metrics import REGISTRY, rows_of
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _timed_parse(parse: Callable[[Any, str], Any], job: Any, page: str) -> Tuple[Any, float]:
+    # Runs in the parser process, whose metrics would be lost: the parent records the time
+    start = time.perf_counter()
+    result = parse(job, page)
+    return result, time.perf_counter() - start
+
+
+async def run_pipeline(jobs: Union[Iterable[Any], AsyncIterable[Any]],
+                       fetch: Callable[[Any], Awaitable[str]],
+                       parse: Callable[[Any, str], Any],
+                       io_workers: int = 10,
+                       queue_size: Optional[int] = None,
+                       parse_workers: Optional[int] = None) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    Overlap fetching and parsing: fetch jobs on the event loop, parse pages in a process pool.
+
+    `io_workers` coroutines take jobs and await `fetch(job)`; the raw pages
+    pass through a bounded queue to a pool of `parse_workers` processes that
+    run `parse(job, page)`. Every queue is bounded, so when parsing falls
+    behind the fetchers simply wait instead of piling up pages in memory.
+    Parse times and rows are recorded in metrics.REGISTRY under the name
+    of the parse function.
+
+    Args:
+        jobs (Iterable or AsyncIterable): Jobs to process; may keep producing while the pipeline runs
+        fetch (Callable): Coroutine function returning the page of a job, or "" if it failed
+        parse (Callable): Picklable module-level function called as parse(job, page)
+        io_workers (int, optional): Number of concurrent fetches. Defaults to 10.
+        queue_size (int, optional): Capacity of the page and result queues. Defaults to twice parse_workers.
+        parse_workers (int, optional): Number of parser processes. Defaults to the core count.
+
+    Returns:
+        AsyncIterator[Tuple[Any, Any]]: (job, parse result) in completion order;
+            the result is None for jobs whose fetch failed
+    """
+    parse_workers = parse_workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * parse_workers
+
+    job_queue = asyncio.Queue(maxsize=io_workers)
+    page_queue = asyncio.Queue(maxsize=queue_size)
+    result_queue = asyncio.Queue(maxsize=queue_size)
+    loop = asyncio.get_running_loop()
+
+    async def feed():
+        if hasattr(jobs, '__aiter__'):
+            async for job in jobs:
+                await job_queue.put(job)
+        else:
+            for job in jobs:
+                await job_queue.put(job)
+        for _ in range(io_workers):
+            await job_queue.put(_DONE)
+
+    async def fetch_worker():
+        while (job := await job_queue.get()) is not _DONE:
+            page = await fetch(job)
+            await page_queue.put((job, page))
+
+    async def parse_worker(executor):
+        while (item := await page_queue.get()) is not _DONE:
+            job, page = item
+            result = None
+            if page:
+                result, seconds = await loop.run_in_executor(executor, _timed_parse, parse, job, page)
+                REGISTRY.record_parse(parse.__name__, seconds, rows_of(result))
+            await result_queue.put((job, result))
+
+    async def stage(coroutines, downstream, count):
+        # Run the workers of a stage, then tell the next stage no more input is coming
+        try:
+            await asyncio.gather(*coroutines)
+        except Exception as e:
+            await result_queue.put(_StageError(e))
+            return
+        for _ in range(count):
+            await downstream.put(_DONE)
+
+    # Spawned workers do not inherit the event loop, sockets or held locks
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        tasks = [
+            asyncio.ensure_future(stage([feed()], job_queue, 0)),
+            asyncio.ensure_future(stage([fetch_worker() for _ in range(io_workers)], page_queue, parse_workers)),
+            asyncio.ensure_future(stage([parse_worker(executor) for _ in range(parse_workers)], result_queue, 1)),
+        ]
+        try:
+            while (item := await result_queue.get()) is not _DONE:
+                if isinstance(item, _StageError):
+                    raise item.error
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def backoff_delay(attempt: int, backoff: float = 2.0, max_backoff: float = 60.0) -> float:
+    """
+    Seconds to wait before retry number `attempt` (from 0): backoff * 2 ** attempt, capped at
+    `max_backoff` and scaled by a random factor between 0.5 and 1.5.
+    """
+    return min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class RequeuingJobs:
+    """
+    Job source for run_pipeline() that puts failed jobs back in the queue after a jittered backoff.
+
+    Pass it as the pipeline's jobs and report the outcome of every result
+    with resolve(). A failed job is scheduled to come back after
+    backoff * 2 ** attempt seconds, scaled by a random factor between 0.5
+    and 1.5 so that pages failing together do not all return at the same
+    moment. The delay is a timer, so no fetch worker is held up waiting. The
+    source only ends once every job has succeeded or used up its retries.
+    """
+
+    def __init__(self, jobs: Union[Iterable[Any], AsyncIterable[Any]], retries: int = 3,
+                 backoff: float = 2.0, max_backoff: float = 60.0):
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempts: Dict[Any, int] = {}
+        self.pending: Set[Any] = set()
+        self.exhausted = False
+        self.finished = False
+        self.requeued: asyncio.Queue = asyncio.Queue()
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        if hasattr(self.jobs, '__aiter__'):
+            async for job in self.jobs:
+                self.pending.add(job)
+                yield job
+        else:
+            for job in self.jobs:
+                self.pending.add(job)
+                yield job
+        self.exhausted = True
+        self.finish_if_done()
+        while (job := await self.requeued.get()) is not _DONE:
+            yield job
+
+    def resolve(self, job: Any, ok: bool) -> bool:
+        """
+        Report how a job went.
+
+        Args:
+            job (Any): Job of a pipeline result
+            ok (bool): Whether it succeeded
+
+        Returns:
+            bool: True if the job was requeued, so its result is to be ignored
+        """
+        attempt = self.attempts.get(job, 0)
+        if not ok and attempt < self.retries:
+            self.attempts[job] = attempt + 1
+            delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+            asyncio.get_running_loop().call_later(delay, self.requeued.put_nowait, job)
+            REGISTRY.inc('scrape_requeued_total')
+            return True
+        self.pending.discard(job)
+        self.finish_if_done()
+        return False
+
+    def finish_if_done(self):
+        if self.exhausted and not self.pending and not self.finished:
+            self.finished = True
+            self.requeued.put_nowait(_DONE)
@@ -1,26 +1,52 @@
 import pandas as pd
 
+import storage
+from timeconv import hms_to_seconds
 
-def time_to_seconds(time_str):
-    if pd.isnull(time_str) or time_str == "00:00:00":
-        return None  # Keep null for missing or invalid times
-    h, m, s = map(int, time_str.split(":"))
-    return h * 3600 + m * 60 + s
+# List of time columns to process
+time_columns = storage.TIME_COLUMNS
 
+# Rows converted at a time; only one chunk is ever held in memory
+CHUNK_SIZE = 500_000
+
+
+def times_to_seconds(column):
+    """
+    Convert a whole column of "HH:MM:SS" strings (or unpadded ones such as "1:2:3") to nullable integer seconds.
+
+    "00:00:00", empty and malformed values become <NA>.
+    """
+    seconds = hms_to_seconds(column.to_numpy())
+    return pd.Series(pd.arrays.IntegerArray(seconds, seconds <= 0), index=column.index)
+
+
+def prepare_chunk(df):
+    # Apply the time conversion to each relevant column
+    for col in time_columns:
+        if col in df.columns:
+            df[col] = times_to_seconds(df[col])
+    return df
+
+
+def prepare(file_path, output_path, chunk_size=CHUNK_SIZE):
+    """
+    Convert the prepared merge to the typed, year-partitioned Parquet dataset at output_path.
+    """
+    storage.clear(output_path)
+    rows = 0
+    # Every column is read as text and typed by storage, so a column gets the same type in every chunk
+    chunks = pd.read_csv(file_path, sep=';', dtype=str, chunksize=chunk_size)
+    for i, chunk in enumerate(chunks):
+        storage.write(prepare_chunk(chunk), output_path, part=i)
+        rows += len(chunk)
+    return rows
 
-file_path = 'results/merged_marathon_results_prepared.csv'
-df = pd.read_csv(file_path, sep=';')
-# List of time columns to process
-time_columns = ['time_full', 'split_5k', 'split_10k', 'split_15k', 'split_20k',
-                'time_half', 'split_25k', 'split_30k', 'split_35k', 'split_40k']
 
-# Apply the time conversion to each relevant column
-for col in time_columns:
-    if col in df.columns:
-        df[col] = df[col].apply(time_to_seconds)
+if __name__ == "__main__":
+    file_path = 'results/merged_marathon_results_prepared.csv'
 
-# Save the cleaned DataFrame to a new CSV file
-output_path = "results/cleaned_marathon_data.csv"
-df.to_csv(output_path, index=False, sep=';')
+    # Save the cleaned data as a Parquet dataset partitioned by year
+    output_path = "results/cleaned_marathon_data"
+    prepare(file_path, output_path)
 
-print(f"Processed file saved as: {output_path}")
+    print(f"Processed file saved as: {output_path}")
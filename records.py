@@ -0,0 +1,321 @@
+import sys
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from timeconv import MISSING, format_hms, parse_hms
+
+# Storage of each field kind: typecode of its array, or None for a list of strings
+INT, TIME, CATEGORY, TEXT = 'int', 'time', 'category', 'text'
+TYPECODES = {INT: 'i', TIME: 'i', CATEGORY: 'I', TEXT: None}
+
+
+class Field(NamedTuple):
+    """
+    One column of a result record.
+
+    Args:
+        name (str): Name the field is read by, e.g. record['finish_net']
+        header (str): CSV column header
+        kind (str): INT (whole numbers such as places), TIME ("H:MM:SS" kept as seconds),
+            CATEGORY (few distinct strings, stored as codes) or TEXT
+    """
+    name: str
+    header: str
+    kind: str
+
+
+def headers(fields: Sequence[Field]) -> List[str]:
+    return [field.header for field in fields]
+
+
+# results.baa.org result pages (boston.py)
+BOSTON = (
+    Field('year', 'Year', INT),
+    Field('name', 'Full Name', TEXT),
+    Field('place_overall', 'Overall Place', INT),
+    Field('place_gender', 'Gender Place', INT),
+    Field('bib', 'BIB Number', TEXT),
+    Field('half', 'Half Marathon Time', TIME),
+    Field('finish_net', 'Finish Net Time', TIME),
+    Field('finish_gun', 'Finish Gun Time', TIME),
+)
+
+# Marathon Guide result pages (marathonguide.py, for chicago.py and berlin2.py)
+MARATHONGUIDE = (
+    Field('year', 'Year', INT),
+    Field('name', 'Full Name', TEXT),
+    Field('sex', 'Sex', CATEGORY),
+    Field('finish', 'Finish Time', TIME),
+    Field('place_overall', 'Overall Place', INT),
+    Field('place_sex', 'Sex Place', INT),
+    Field('place_division', 'Division Place', INT),
+    Field('division', 'Division', CATEGORY),
+    Field('country', 'Country', CATEGORY),
+    Field('bq_status', 'BQ Status', CATEGORY),
+)
+
+# results.chicagomarathon.com list pages (githubChicago.py); bib and city_state come from the detail pages
+CHICAGO = (
+    Field('name', 'Full Name', TEXT),
+    Field('gender', 'Gender', CATEGORY),
+    Field('country', 'Country', CATEGORY),
+    Field('age_class', 'Age Class', CATEGORY),
+    Field('half_time', 'Half Marathon Time', TIME),
+    Field('finish_time', 'Finish Time', TIME),
+    Field('details_url', 'Details URL', TEXT),
+    Field('bib', 'BIB Number', TEXT),
+    Field('city_state', 'City, State', TEXT),
+)
+
+
+def parse_int(value: Any) -> int:
+    """
+    Convert a place or year cell to an int; anything that is not a whole number counts as missing.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    value = str(value).strip()
+    return int(value) if value.isdigit() else MISSING
+
+
+class Categories:
+    """
+    Distinct values of a categorical field and the code of each.
+
+    Values are interned, so every batch refers to the same string objects.
+    """
+    __slots__ = ('codes', 'values')
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(sys.intern(str(value)))
+        return code
+
+
+class ResultBatch:
+    """
+    Column-oriented results of a page, a race or a whole scrape.
+
+    Parsers append one row of cell strings per runner; each cell is
+    converted on the way in, so places are stored as int32, times as int32
+    seconds (MISSING when absent or malformed), categorical fields as uint32
+    codes into a table of interned strings, and only free text stays a
+    Python string. A runner then takes a few bytes per numeric field
+    instead of a str object per cell. Times are read with
+    timeconv.parse_hms, the same parser hms_to_seconds() applies to a
+    column, so a time reads the same in a batch and in a CSV read back later.
+
+    column() and to_frame() hand the integers to code in the same process.
+    The CSV output is still text: readers of the files, such as sketch.py
+    and identity.py, convert the times again with timeconv.
+
+    Iterating yields a ResultRecord per runner, which reads as the CSV cells
+    of its row, so a batch can be passed to csv.writer.writerows() as it is.
+    The cells are the text the parser appended: a place or time is written
+    from its integer, zero-padded to "HH:MM:SS" if the column's times came
+    padded, and the few cells that would not come out the same that way
+    ("N/A", "-", "02:10:00" among unpadded times) keep their source text.
+    """
+    __slots__ = ('fields', 'positions', 'columns', 'categories', 'converters', 'sources', 'padded')
+
+    def __init__(self, fields: Sequence[Field]):
+        self.fields = tuple(fields)
+        self.positions = {field.name: i for i, field in enumerate(self.fields)}
+        self.columns: List[Any] = [array(TYPECODES[field.kind]) if TYPECODES[field.kind] else []
+                                   for field in self.fields]
+        self.categories: List[Optional[Categories]] = [Categories() if field.kind == CATEGORY else None
+                                                       for field in self.fields]
+        self.converters: List[Callable[[Any], Any]] = [self.converter(field, categories)
+                                                       for field, categories in zip(self.fields, self.categories)]
+        # Source text of the INT and TIME cells their integer does not reproduce, by row
+        self.sources: List[Optional[Dict[int, str]]] = [{} if field.kind in (INT, TIME) else None
+                                                        for field in self.fields]
+        # Whether a TIME column writes zero-padded hours; None until its first valid time
+        self.padded: List[Optional[bool]] = [None] * len(self.fields)
+
+    @staticmethod
+    def converter(field: Field, categories: Optional[Categories]) -> Callable[[Any], Any]:
+        if field.kind == INT:
+            return parse_int
+        if field.kind == TIME:
+            return parse_hms
+        if field.kind == CATEGORY:
+            return categories.code
+        return str
+
+    def append(self, row: Sequence[Any]):
+        """
+        Add one runner from the cells of its row, in field order.
+        """
+        index = len(self)
+        for position, (column, convert, value) in enumerate(zip(self.columns, self.converters, row)):
+            converted = convert(value)
+            column.append(converted)
+            if self.sources[position] is not None:
+                self.keep_source(index, position, value, converted)
+
+    def keep_source(self, index: int, position: int, value: Any, converted: int):
+        """
+        Remember the source text of an INT or TIME cell if its integer does not format back to it.
+        """
+        if isinstance(value, (int, np.integer)):
+            self.sources[position].pop(index, None)
+            return
+        source = '' if value is None else str(value)
+        if self.fields[position].kind == TIME and 0 <= converted < 36000 and self.padded[position] is None \
+                and source in (format_hms(converted), format_hms(converted, padded=True)):
+            # Only a well-formed single-digit hour shows whether the column pads
+            self.padded[position] = len(source) == 8
+        if source == self.format(position, converted):
+            self.sources[position].pop(index, None)
+        else:
+            self.sources[position][index] = source
+
+    def format(self, position: int, value: int) -> str:
+        """
+        Default CSV text of an INT or TIME value.
+        """
+        if self.fields[position].kind == TIME:
+            return format_hms(value, padded=bool(self.padded[position]))
+        return str(value) if value != MISSING else ''
+
+    def extend(self, other: "ResultBatch"):
+        """
+        Add all runners of a batch with the same fields, e.g. to collect the pages of a race.
+        """
+        if other.fields != self.fields:
+            raise ValueError("Cannot combine result batches with different fields")
+        offset = len(self)
+        for position, (column, categories, other_column, other_categories) in enumerate(
+                zip(self.columns, self.categories, other.columns, other.categories)):
+            if categories is not None:
+                recode = np.array([categories.code(value) for value in other_categories.values], dtype=np.uint32)
+                column.frombytes(recode[np.frombuffer(other_column, dtype=np.uint32)].tobytes())
+                continue
+            column.extend(other_column)
+            if self.sources[position] is None:
+                continue
+            if self.padded[position] is None:
+                self.padded[position] = other.padded[position]
+            if self.padded[position] == other.padded[position] or other.padded[position] is None:
+                self.sources[position].update((offset + index, source)
+                                              for index, source in other.sources[position].items())
+            else:
+                # Written with the other padding, so every cell of the other batch is checked again
+                for index, value in enumerate(other_column):
+                    self.keep_source(offset + index, position, other.cell(index, position), value)
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index: int) -> "ResultRecord":
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return ResultRecord(self, index % len(self))
+
+    def __iter__(self) -> Iterator["ResultRecord"]:
+        return (ResultRecord(self, index) for index in range(len(self)))
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ResultBatch):
+            return NotImplemented
+        return self.fields == other.fields and self.rows() == other.rows()
+
+    def value(self, index: int, position: int) -> Any:
+        """
+        Typed value of one field: int for INT and TIME, str otherwise.
+        """
+        value = self.columns[position][index]
+        categories = self.categories[position]
+        return categories.values[value] if categories is not None else value
+
+    def cell(self, index: int, position: int) -> str:
+        """
+        CSV text of one field, as the parser appended it.
+        """
+        value = self.value(index, position)
+        sources = self.sources[position]
+        if sources is None:
+            return value
+        source = sources.get(index)
+        return source if source is not None else self.format(position, value)
+
+    def set(self, index: int, name: str, value: Any):
+        position = self.positions[name]
+        converted = self.columns[position][index] = self.converters[position](value)
+        if self.sources[position] is not None:
+            self.keep_source(index, position, value, converted)
+
+    def rows(self) -> List[List[str]]:
+        """
+        CSV cells of every runner.
+        """
+        return [list(record) for record in self]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        One field of every runner: int32 for INT and TIME fields, strings (object) otherwise.
+        """
+        position = self.positions[name]
+        column, categories = self.columns[position], self.categories[position]
+        if categories is not None:
+            return np.asarray(categories.values, dtype=object)[np.frombuffer(column, dtype=np.uint32)]
+        if isinstance(column, list):
+            return np.asarray(column, dtype=object)
+        return np.frombuffer(column, dtype=np.int32).copy()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        The batch as a typed DataFrame: nullable Int32 places and seconds, categorical and string columns.
+        """
+        data = {}
+        for position, field in enumerate(self.fields):
+            column, categories = self.columns[position], self.categories[position]
+            if categories is not None:
+                codes = np.frombuffer(column, dtype=np.uint32).astype(np.int32)
+                data[field.name] = pd.Categorical.from_codes(codes, categories=pd.Index(categories.values))
+            elif isinstance(column, list):
+                data[field.name] = pd.array(column, dtype='string')
+            else:
+                values = np.frombuffer(column, dtype=np.int32)
+                data[field.name] = pd.arrays.IntegerArray(values.copy(), values == MISSING)
+        return pd.DataFrame(data)
+
+
+class ResultRecord:
+    """
+    One runner of a ResultBatch.
+
+    record['name'] reads a field as a typed value and update() sets fields;
+    iterating yields the CSV cells of the row.
+    """
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch: ResultBatch, index: int):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, name: str) -> Any:
+        return self.batch.value(self.index, self.batch.positions[name])
+
+    def update(self, **values: Any):
+        for name, value in values.items():
+            self.batch.set(self.index, name, value)
+
+    def __len__(self) -> int:
+        return len(self.batch.fields)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.batch.cell(self.index, position) for position in range(len(self.batch.fields)))
+
+    def __repr__(self) -> str:
+        return f"ResultRecord({ {field.name: self[field.name] for field in self.batch.fields} })"
@@ -0,0 +1,259 @@
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import storage
+from splits import SplitTable
+
+# Split times the finish time is predicted from, and the finish time itself, in seconds
+FEATURES = ['split_5k', 'split_10k', 'split_15k', 'split_20k']
+TARGET = 'time_full'
+
+# Same checkpoints in a Chicago SplitTable
+SPLIT_TABLE_FEATURES = ['5km', '10km', '15km', '20km']
+
+# Default location of a model saved by linear_regression.py --save-model
+MODEL_PATH = "results/finish_time_model.json"
+
+# A batch of finishers: (year of each row, (n, 4) split times, finish times)
+Batch = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class GramMatrix:
+    """
+    Sufficient statistics of a least squares fit, accumulated batch by batch.
+
+    For rows z = [1, x_1 .. x_p, y] the matrix holds sum(z z^T): the count,
+    the sums, and all cross products of the features and the target. That
+    (p + 2) x (p + 2) matrix is all the normal equations and the error
+    metrics need, so any number of rows fits in constant memory, and the
+    matrices of separate batches, years or cities simply add up.
+    """
+
+    def __init__(self, n_features: int = len(FEATURES)):
+        self.gram = np.zeros((n_features + 2, n_features + 2))
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        Z = np.column_stack([np.ones(len(y)), X, y])
+        self.gram += Z.T @ Z
+
+    def __iadd__(self, other: "GramMatrix") -> "GramMatrix":
+        self.gram += other.gram
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(self.gram[0, 0])
+
+    def fit(self) -> "LinearModel":
+        """
+        Least squares coefficients from the normal equations.
+        """
+        xx, xy = self.gram[:-1, :-1], self.gram[:-1, -1]
+        coef = np.linalg.lstsq(xx, xy, rcond=None)[0]
+        return LinearModel(float(coef[0]), coef[1:])
+
+    def metrics(self, model: "LinearModel") -> Tuple[float, float]:
+        """
+        Mean squared error and R2 of a model on the rows of this matrix, without revisiting them.
+
+        Returns:
+            Tuple[float, float]: (MSE, R2); NaN without rows
+        """
+        n = self.gram[0, 0]
+        if not n:
+            return np.nan, np.nan
+        b = np.concatenate([[model.intercept], model.coef])
+        xx, xy, yy = self.gram[:-1, :-1], self.gram[:-1, -1], self.gram[-1, -1]
+        sse = yy - 2 * b @ xy + b @ xx @ b
+        sst = yy - self.gram[0, -1] ** 2 / n
+        return sse / n, 1 - sse / sst if sst > 0 else np.nan
+
+
+class LinearModel(NamedTuple):
+    """
+    Finish time as a linear function of the 5k, 10k, 15k and 20k splits, all in seconds.
+    """
+    intercept: float
+    coef: np.ndarray
+
+    def predict(self, X: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Predict finish times for a batch of runners.
+
+        One matrix-vector product over the whole batch; a runner with a
+        missing split (NaN or negative, e.g. MISSING) gets NaN.
+        Passing float64 splits saves the conversion.
+
+        Args:
+            X (np.ndarray): (n, 4) split times in FEATURES order, any numeric dtype
+            out (np.ndarray, optional): float64 array of length n to write into, to avoid an allocation per call
+
+        Returns:
+            np.ndarray: Predicted finish times in seconds
+        """
+        X = np.asarray(X, dtype=np.float64)
+        out = np.matmul(X, self.coef, out=out)
+        out += self.intercept
+        # Column by column: a row-wise any() over four columns costs several times the product itself
+        missing = X[:, 0] < 0
+        for column in range(1, X.shape[1]):
+            missing |= X[:, column] < 0
+        out[missing] = np.nan
+        return out
+
+    def save(self, path: str, **metadata: Any):
+        """
+        Write the model as JSON, with optional metadata such as training size and test metrics.
+        """
+        model = {'features': FEATURES, 'intercept': self.intercept, 'coef': self.coef.tolist(), **metadata}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(model, f, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModel":
+        """
+        Read a model written by save().
+        """
+        with open(path, encoding='utf-8') as f:
+            model = json.load(f)
+        if model['features'] != FEATURES:
+            raise ValueError(f"{path} predicts from {model['features']}, expected {FEATURES}")
+        return cls(float(model['intercept']), np.array(model['coef'], dtype=np.float64))
+
+
+class RegressionResult(NamedTuple):
+    """
+    Outcome of fit_streaming().
+
+    Args:
+        model (LinearModel): Model fitted on all training rows
+        train (GramMatrix): Statistics of all training rows
+        test (GramMatrix): Statistics of all test rows
+        years (Dict[int, Tuple[GramMatrix, GramMatrix]]): (train, test) statistics per year, if requested
+    """
+    model: LinearModel
+    train: GramMatrix
+    test: GramMatrix
+    years: Dict[int, Tuple[GramMatrix, GramMatrix]]
+
+
+def dataset_batches(dataset: str, years: Optional[Iterable[int]] = None, batch_size: int = 1 << 17) -> Iterator[Batch]:
+    """
+    Finishers with all splits and a finish time, streamed from the typed dataset one record batch at a time.
+    """
+    for batch in storage.batches(dataset, ['year', TARGET] + FEATURES, years, batch_size):
+        if not all(name in batch.schema.names for name in FEATURES + [TARGET]):
+            continue
+        X = np.column_stack([batch.column(name).to_numpy(zero_copy_only=False) for name in FEATURES]).astype(np.float64)
+        y = batch.column(TARGET).to_numpy(zero_copy_only=False).astype(np.float64)
+        year = batch.column('year').to_numpy(zero_copy_only=False)
+        complete = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+        yield year[complete], X[complete], y[complete]
+
+
+def split_table_batches(table: SplitTable, year: int) -> Iterator[Batch]:
+    """
+    Finishers of a Chicago SplitTable (githubChicago.py --splits-file) as a single batch.
+    """
+    X = np.column_stack([table.column(checkpoint) for checkpoint in SPLIT_TABLE_FEATURES]).astype(np.float64)
+    y = table.column('finish').astype(np.float64)
+    complete = (X > 0).all(axis=1) & (y > 0)
+    yield np.full(complete.sum(), year), X[complete], y[complete]
+
+
+def test_mask(rng: np.random.Generator, n: int, test_size: float) -> np.ndarray:
+    """
+    Rows of a batch held out for testing; the same generator state and batches always give the same split.
+    """
+    return rng.random(n) < test_size
+
+
+def fit_streaming(batches: Iterable[Batch], test_size: float = 0.2, seed: int = 42,
+                  by_year: bool = False) -> RegressionResult:
+    """
+    Fit the finish time on the splits in one pass over the batches.
+
+    Each row goes to the test set with probability `test_size`; only the
+    train and test Gram matrices (per year with `by_year`) are kept, so
+    memory does not grow with the number of rows.
+
+    Args:
+        batches (Iterable[Batch]): (years, splits, finish times) batches, e.g. dataset_batches()
+        test_size (float, optional): Share of rows held out. Defaults to 0.2.
+        seed (int, optional): Seed of the train/test split. Defaults to 42.
+        by_year (bool, optional): Also keep statistics per year. Defaults to False.
+
+    Returns:
+        RegressionResult: The model and its statistics
+    """
+    rng = np.random.default_rng(seed)
+    train, test = GramMatrix(), GramMatrix()
+    years: Dict[int, Tuple[GramMatrix, GramMatrix]] = {}
+    for year, X, y in batches:
+        held_out = test_mask(rng, len(y), test_size)
+        if not by_year:
+            train.add(X[~held_out], y[~held_out])
+            test.add(X[held_out], y[held_out])
+            continue
+        for value in np.unique(year):
+            rows = year == value
+            year_train, year_test = years.setdefault(int(value), (GramMatrix(), GramMatrix()))
+            year_train.add(X[rows & ~held_out], y[rows & ~held_out])
+            year_test.add(X[rows & held_out], y[rows & held_out])
+    for year_train, year_test in years.values():
+        train += year_train
+        test += year_test
+    return RegressionResult(train.fit(), train, test, years)
+
+
+def test_predictions(batches: Iterable[Batch], model: LinearModel, test_size: float = 0.2,
+                     seed: int = 42) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    (actual, predicted) finish times of the test rows, batch by batch.
+
+    Must see the same batches as the fit_streaming() call with the same
+    `test_size` and `seed` to reproduce its split.
+    """
+    rng = np.random.default_rng(seed)
+    for _, X, y in batches:
+        held_out = test_mask(rng, len(y), test_size)
+        yield y[held_out], model.predict(X[held_out])
+
+
+def report(result: RegressionResult):
+    """
+    Print the overall results and, if fitted by year, a per-year breakdown.
+    """
+    mse, r2 = result.test.metrics(result.model)
+    print("Linear Regression Results:")
+    print(f"Training rows: {result.train.count}, test rows: {result.test.count}")
+    print(f"Mean Squared Error (MSE): {mse:.2f}")
+    print(f"R-squared (R2 Score): {r2:.2f}")
+    print("Coefficients: " + ", ".join(f"{name} {value:.4f}" for name, value in zip(FEATURES, result.model.coef))
+          + f", intercept {result.model.intercept:.2f}")
+    if result.years:
+        print("Per year (overall model / model fitted on that year only):")
+        for year, (train, test) in sorted(result.years.items()):
+            mse, r2 = test.metrics(result.model)
+            year_mse, year_r2 = test.metrics(train.fit()) if train.count else (np.nan, np.nan)
+            print(f"  {year}: {test.count} test rows, MSE {mse:.2f} / {year_mse:.2f}, R2 {r2:.3f} / {year_r2:.3f}")
+
+
+def prediction_histogram(pairs: Iterable[Tuple[np.ndarray, np.ndarray]], bins: int = 200,
+                         limits: Tuple[float, float] = (3600, 9 * 3600)) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    2D histogram of (actual, predicted) pairs accumulated batch by batch, e.g. from test_predictions().
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (bins, bins) counts indexed [actual, predicted], and the shared bin edges
+    """
+    edges = np.linspace(limits[0], limits[1], bins + 1)
+    counts = np.zeros((bins, bins), dtype=np.int64)
+    for actual, predicted in pairs:
+        counts += np.histogram2d(actual, predicted, bins=[edges, edges])[0].astype(np.int64)
+    return counts, edges
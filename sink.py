@@ -0,0 +1,134 @@
+import csv
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+Key = Tuple[int, int]
+
+
+class OrderedCsvSink:
+    """
+    Streaming CSV writer that emits pages in (year, page) order as they finish.
+
+    Pages may arrive in any order. The page that is next in line is written
+    and flushed immediately; pages that arrive early wait in a small reorder
+    buffer, and once more than `max_buffered_pages` are waiting the ones
+    furthest ahead are spilled to disk. Memory therefore stays flat however
+    many years are scraped, and an interrupted run leaves an ordered prefix
+    of the results in the output file.
+
+    Page counts need not be known up front: call set_page_count() for each
+    year once discovered. Failed pages must still be added (with no rows) so
+    the writer can move past them.
+    """
+
+    def __init__(self, output_file: str, headers: List[str], years: Iterable[int], max_buffered_pages: int = 32):
+        self.output_file = output_file
+        self.years = sorted(years)
+        self.max_buffered_pages = max_buffered_pages
+        self.page_counts: Dict[int, int] = {}
+        self.buffer: Dict[Key, List[List[Any]]] = {}
+        self.spilled = set()
+        self.spill_dir = output_file + '.spill'
+        self.year_index = 0
+        self.page = 1
+        self.rows_written = 0
+
+        self.file = open(output_file, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(headers)
+        self.file.flush()
+
+    def set_page_count(self, year: int, pages: int):
+        """
+        Record how many pages a year has; 0 skips the year.
+
+        Args:
+            year (int): Year of the race
+            pages (int): Number of result pages of that year
+        """
+        self.page_counts[year] = pages
+        self.drain()
+
+    def add(self, year: int, page: int, rows: Optional[List[List[Any]]]):
+        """
+        Hand over the parsed rows of one page.
+
+        Args:
+            year (int): Year of the race
+            page (int): Page number
+            rows (List[List[Any]], optional): Parsed rows; None or empty for a failed page
+        """
+        self.buffer[(year, page)] = rows or []
+        self.drain()
+        while len(self.buffer) > self.max_buffered_pages:
+            self.spill(max(self.buffer))
+
+    def next_key(self) -> Optional[Key]:
+        """
+        The (year, page) to write next, or None if it is not known yet or everything is written.
+        """
+        while self.year_index < len(self.years):
+            year = self.years[self.year_index]
+            if year not in self.page_counts:
+                return None
+            if self.page <= self.page_counts[year]:
+                return year, self.page
+            self.year_index += 1
+            self.page = 1
+        return None
+
+    def drain(self):
+        """
+        Write every page that is next in line.
+        """
+        wrote = 0
+        start = time.perf_counter()
+        while (key := self.next_key()) is not None:
+            if key in self.buffer:
+                rows = self.buffer.pop(key)
+            elif key in self.spilled:
+                rows = self.unspill(key)
+            else:
+                break
+            self.writer.writerows(rows)
+            self.rows_written += len(rows)
+            self.page += 1
+            wrote += len(rows)
+        if wrote:
+            self.file.flush()
+            REGISTRY.record_write('csv_sink', time.perf_counter() - start, wrote)
+
+    def spill_path(self, key: Key) -> str:
+        return os.path.join(self.spill_dir, f'{key[0]}-{key[1]}.csv')
+
+    def spill(self, key: Key):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self.spill_path(key), 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(self.buffer.pop(key))
+        self.spilled.add(key)
+
+    def unspill(self, key: Key) -> List[List[str]]:
+        path = self.spill_path(key)
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        os.remove(path)
+        self.spilled.discard(key)
+        return rows
+
+    def close(self) -> int:
+        """
+        Close the output file and drop the spill directory.
+
+        Returns:
+            int: Number of rows written
+        """
+        self.drain()
+        if self.buffer or self.spilled:
+            print(f"Warning: {len(self.buffer) + len(self.spilled)} pages could not be placed in order and were not written")
+        self.file.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        return self.rows_written
@@ -0,0 +1,317 @@
+import argparse
+import csv
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from timeconv import format_hms, hms_to_seconds
+
+# Accuracy parameter: at 200, quantiles land within about 1% of their true rank and a sketch holds about 3 * K values
+K = 200
+
+# Sketches are kept per (city, year, gender, age class); unknown values are ''
+KEY_COLUMNS = ['city', 'year', 'gender', 'age_class']
+SketchKey = Tuple[str, int, str, str]
+
+
+class KLLSketch:
+    """
+    Mergeable streaming quantile sketch (Karnin, Lang and Liberty's KLL).
+
+    Values live in a stack of compactors. Level h holds values that each stand
+    for 2**h of the original ones, and its capacity shrinks geometrically with
+    its distance from the top level. When a level overflows it is sorted and
+    every other value, starting at a random offset, moves up a level. The
+    total weight always equals the number of values added, memory stays
+    around 3 * k values however many are added, and two sketches merge by
+    concatenating their levels and compacting again.
+    """
+
+    def __init__(self, k: int = K, seed: Optional[int] = 0):
+        self.k = k
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: Iterable[Any]):
+        """
+        Add a batch of values; NaN is ignored.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        """
+        Fold another sketch into this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    @classmethod
+    def merged(cls, sketches: Iterable["KLLSketch"], k: int = K) -> "KLLSketch":
+        """
+        One sketch of the union of many, concatenating all of them level by level and compacting once.
+        """
+        result = cls(k)
+        levels: List[List[np.ndarray]] = []
+        for sketch in sketches:
+            for level, items in enumerate(sketch.levels):
+                if level == len(levels):
+                    levels.append([])
+                levels[level].append(items)
+            result.count += sketch.count
+            result.min = min(result.min, sketch.min)
+            result.max = max(result.max, sketch.max)
+        if levels:
+            result.levels = [np.concatenate(items) for items in levels]
+            result._compress()
+        return result
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self.capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            # An odd value out stays behind so the weight is preserved exactly
+            held, items = items[:len(items) % 2], items[len(items) % 2:]
+            promoted = items[self._rng.integers(2)::2]
+            self.levels[level] = held
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # Adding a level lowers every capacity below it, so start over from the bottom
+            level = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def quantiles(self, q: Sequence[float]) -> np.ndarray:
+        """
+        Approximate quantiles.
+
+        Args:
+            q (Sequence[float]): Quantiles between 0 and 1
+
+        Returns:
+            np.ndarray: One value per quantile; NaN if the sketch is empty
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(len(q), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        index = np.minimum(np.searchsorted(cumulative, q * self.count, side='left'), len(items) - 1)
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, items[index]))
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            'k': self.k, 'count': self.count, 'min': float(self.min), 'max': float(self.max),
+            'level_sizes': [len(items) for items in self.levels],
+            'items': np.concatenate(self.levels).astype(np.float32),
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(int(row['k']))
+        bounds = np.cumsum([0] + list(row['level_sizes']))
+        items = np.asarray(row['items'], dtype=np.float64)
+        sketch.levels = [items[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+        sketch.count = int(row['count'])
+        sketch.min, sketch.max = float(row['min']), float(row['max'])
+        return sketch
+
+
+def matches(value: Any, wanted: Any) -> bool:
+    if wanted is None:
+        return True
+    if isinstance(wanted, (str, int, np.integer)):
+        return value == wanted
+    return value in wanted
+
+
+class SketchSet:
+    """
+    Finish time sketches keyed by (city, year, gender, age class).
+
+    Sets built from separate partitions, years or cities merge into one, and
+    query() merges the sketches of any slice on demand, so distribution
+    summaries never touch the underlying rows.
+    """
+
+    def __init__(self, k: int = K):
+        self.k = k
+        self.sketches: Dict[SketchKey, KLLSketch] = {}
+
+    def add(self, city: str, years: Sequence[Any], genders: Sequence[Any], age_classes: Sequence[Any],
+            seconds: Sequence[Any]):
+        """
+        Add a batch of finishers of one city.
+
+        Args:
+            city (str): City of the race, e.g. 'berlin'
+            years (Sequence[Any]): Year of each finisher
+            genders (Sequence[Any]): Gender of each finisher; missing values count as ''
+            age_classes (Sequence[Any]): Age class of each finisher; missing values count as ''
+            seconds (Sequence[Any]): Finish time in seconds; missing or non-positive times are skipped
+        """
+        # Positional, whatever index the inputs carry
+        frame = pd.DataFrame({
+            'year': pd.to_numeric(pd.Series(np.asarray(years, dtype=object)), errors='coerce'),
+            'gender': pd.Series(np.asarray(genders, dtype=object), dtype='string').fillna(''),
+            'age_class': pd.Series(np.asarray(age_classes, dtype=object), dtype='string').fillna(''),
+            'seconds': pd.to_numeric(pd.Series(np.asarray(seconds, dtype=object)), errors='coerce').astype('float64'),
+        })
+        frame = frame[(frame['seconds'] > 0) & frame['year'].notna()]
+        values = frame['seconds'].to_numpy()
+        for (year, gender, age_class), index in frame.groupby(['year', 'gender', 'age_class']).indices.items():
+            key = (city, int(year), gender, age_class)
+            if key not in self.sketches:
+                self.sketches[key] = KLLSketch(self.k)
+            self.sketches[key].update(values[index])
+
+    def merge(self, other: "SketchSet"):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = sketch
+
+    def query(self, city: Any = None, year: Any = None, gender: Any = None, age_class: Any = None) -> KLLSketch:
+        """
+        One sketch of a slice; each filter is a value, a collection of values, or None for all.
+        """
+        return KLLSketch.merged((sketch for key, sketch in self.sketches.items()
+                                 if matches(key[0], city) and matches(key[1], year)
+                                 and matches(key[2], gender) and matches(key[3], age_class)), self.k)
+
+    def keys(self) -> List[SketchKey]:
+        return sorted(self.sketches)
+
+    def save(self, path: str):
+        """
+        Write the set as one Parquet row per sketch.
+        """
+        rows = [dict(zip(KEY_COLUMNS, key), **sketch.to_row()) for key, sketch in sorted(self.sketches.items())]
+        schema = pa.schema([('city', pa.string()), ('year', pa.int16()), ('gender', pa.string()),
+                            ('age_class', pa.string()), ('k', pa.int32()), ('count', pa.int64()),
+                            ('min', pa.float64()), ('max', pa.float64()),
+                            ('level_sizes', pa.list_(pa.int32())), ('items', pa.list_(pa.float32()))])
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), path)
+
+    @classmethod
+    def load(cls, paths: Iterable[str]) -> "SketchSet":
+        """
+        Read and merge the sets saved in one or more files.
+        """
+        result = cls()
+        for path in paths:
+            loaded = cls()
+            for row in pq.read_table(path).to_pylist():
+                loaded.sketches[tuple(row[column] for column in KEY_COLUMNS)] = KLLSketch.from_row(row)
+            result.merge(loaded)
+        return result
+
+
+def sketch_csv(path: str, city: str, year_column: str, time_column: str, gender_column: Optional[str] = None,
+               age_column: Optional[str] = None, chunk_size: int = 200_000) -> SketchSet:
+    """
+    Sketch a scraper's results CSV in chunks, e.g. boston.py or chicago.py output.
+    """
+    sketches = SketchSet()
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    columns = [column for column in (year_column, time_column, gender_column, age_column) if column in header]
+    for chunk in pd.read_csv(path, dtype=str, usecols=columns, chunksize=chunk_size):
+        missing = pd.Series([None] * len(chunk), index=chunk.index)
+        sketches.add(city, chunk[year_column],
+                     chunk[gender_column] if gender_column in chunk.columns else missing,
+                     chunk[age_column] if age_column in chunk.columns else missing,
+                     hms_to_seconds(chunk[time_column].str.strip().to_numpy()))
+    return sketches
+
+
+def sketch_boston(path: str) -> SketchSet:
+    return sketch_csv(path, 'boston', 'Year', 'Finish Net Time')
+
+
+def sketch_marathonguide(path: str, city: str) -> SketchSet:
+    return sketch_csv(path, city, 'Year', 'Finish Time', 'Sex', 'Division')
+
+
+def sidecar_path(path: str) -> str:
+    """
+    Where the sketches of a results file are stored: next to it.
+    """
+    return path + '.sketches.parquet'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finish time quantile sketches across races")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Sketch scraper results files into <file>.sketches.parquet")
+    build.add_argument("--boston", action="append", default=[], metavar="CSV", help="boston.py results file")
+    build.add_argument("--marathonguide", nargs=2, action="append", default=[], metavar=("CSV", "CITY"),
+                       help="chicago.py / berlin2.py results file and its city, e.g. chicago")
+
+    query = sub.add_parser("query", help="Finish time quantiles of a slice")
+    query.add_argument("sketches", nargs="+", help="Sketch files, e.g. *.sketches.parquet and Berlin's sketches-YYYY.parquet")
+    query.add_argument("--city", nargs="*")
+    query.add_argument("--year", nargs="*", type=int)
+    query.add_argument("--gender", nargs="*")
+    query.add_argument("--age-class", nargs="*")
+    query.add_argument("--q", nargs="*", type=float, default=[0.1, 0.25, 0.5, 0.75, 0.9])
+
+    args = parser.parse_args()
+    if args.command == "build":
+        for path in args.boston:
+            sketch_boston(path).save(sidecar_path(path))
+            print(f"Sketched {path}")
+        for path, city in args.marathonguide:
+            sketch_marathonguide(path, city).save(sidecar_path(path))
+            print(f"Sketched {path}")
+        return
+
+    sketches = SketchSet.load(args.sketches)
+    start = time.perf_counter()
+    result = sketches.query(args.city, args.year, args.gender, args.age_class)
+    values = result.quantiles(args.q)
+    elapsed = time.perf_counter() - start
+    print(f"{result.count} finishers ({elapsed * 1000:.1f} ms)")
+    for q, value in zip(args.q, values):
+        print(f"  q{q:g}: {'-' if np.isnan(value) else format_hms(int(value))}")
+
+
+if __name__ == "__main__":
+    main()
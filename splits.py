@@ -0,0 +1,123 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from timeconv import MISSING, hms_to_seconds
+
+# Checkpoints of a Chicago detail page, in course order
+CHECKPOINTS = ["start", "5km", "10km", "15km", "20km", "half", "25km", "30km", "35km", "40km", "finish"]
+
+# Distance of each checkpoint from the start in km
+CHECKPOINT_KM = np.array([0.0, 5.0, 10.0, 15.0, 20.0, 21.0975, 25.0, 30.0, 35.0, 40.0, 42.195])
+
+
+def time_of_day_seconds(values: Iterable[Any]) -> np.ndarray:
+    """
+    Convert clock times such as "07:31:12" or "07:31:12PM" to seconds after midnight.
+
+    Args:
+        values (Iterable[Any]): Clock times; missing or malformed values become MISSING
+
+    Returns:
+        np.ndarray: int32 seconds after midnight
+    """
+    text = np.char.upper(np.char.strip(np.asarray(values, dtype='U12').ravel()))
+    pm = np.char.endswith(text, 'PM')
+    am = np.char.endswith(text, 'AM')
+    seconds = hms_to_seconds(np.char.strip(np.char.rstrip(text, 'APM')))
+    hour = seconds // 3600
+    seconds = np.where(pm & (hour < 12), seconds + 12 * 3600, seconds)
+    seconds = np.where(am & (hour == 12), seconds - 12 * 3600, seconds)
+    return np.where(seconds >= 0, seconds, MISSING).astype(np.int32)
+
+
+class SplitTable:
+    """
+    Columnar split times of a field of runners.
+
+    `elapsed` holds the race time at each checkpoint and `time_of_day` the
+    clock time the runner passed it, both as int32 seconds in an
+    (n_runners, n_checkpoints) array with one column per entry of
+    CHECKPOINTS. Missing values are MISSING (-1). Row i belongs to runner i
+    of the list the table was built from; `keys`, if given, holds an ID per
+    row (githubChicago.py uses the details URL) that is saved with the table
+    so the splits can be joined back to a saved runner file.
+    """
+
+    def __init__(self, elapsed: np.ndarray, time_of_day: np.ndarray, keys: Optional[np.ndarray] = None):
+        self.elapsed = elapsed
+        self.time_of_day = time_of_day
+        self.keys = None if keys is None else np.asarray(keys, dtype=str)
+
+    @classmethod
+    def empty(cls, n_runners: int, keys: Optional[Sequence[str]] = None) -> "SplitTable":
+        """
+        Table of `n_runners` rows with every split missing, to be filled with set_row().
+        """
+        shape = (n_runners, len(CHECKPOINTS))
+        return cls(np.full(shape, MISSING, dtype=np.int32), np.full(shape, MISSING, dtype=np.int32), keys)
+
+    @classmethod
+    def from_strings(cls, elapsed: Sequence[Sequence[str]], time_of_day: Sequence[Sequence[str]]) -> "SplitTable":
+        """
+        Build a table from per-runner lists of "H:MM:SS" elapsed and clock time strings.
+
+        Args:
+            elapsed (Sequence[Sequence[str]]): One list of elapsed times per runner, in CHECKPOINTS order
+            time_of_day (Sequence[Sequence[str]]): One list of clock times per runner, in CHECKPOINTS order
+
+        Returns:
+            SplitTable: The table
+        """
+        shape = (len(elapsed), len(CHECKPOINTS))
+        return cls(hms_to_seconds(elapsed).reshape(shape), time_of_day_seconds(time_of_day).reshape(shape))
+
+    @classmethod
+    def from_details(cls, details: List[Optional[Dict[str, Any]]]) -> "SplitTable":
+        """
+        Build a table from get_details() results; None stands for a runner without details.
+        """
+        missing = [""] * len(CHECKPOINTS)
+        elapsed = [[d["splits"][cp]["time"] for cp in CHECKPOINTS] if d else missing for d in details]
+        time_of_day = [[d["splits"][cp]["time_of_day"] for cp in CHECKPOINTS] if d else missing for d in details]
+        return cls.from_strings(elapsed, time_of_day)
+
+    def __len__(self) -> int:
+        return len(self.elapsed)
+
+    def set_row(self, index: int, elapsed: Sequence[int], time_of_day: Sequence[int]):
+        self.elapsed[index] = elapsed
+        self.time_of_day[index] = time_of_day
+
+    def column(self, checkpoint: str) -> np.ndarray:
+        """
+        Elapsed seconds of every runner at one checkpoint.
+        """
+        return self.elapsed[:, CHECKPOINTS.index(checkpoint)]
+
+    def segment_pace(self) -> np.ndarray:
+        """
+        Pace in seconds per km over each segment between consecutive checkpoints.
+
+        Returns:
+            np.ndarray: float (n_runners, n_checkpoints - 1) array, NaN where either end is missing
+        """
+        elapsed = np.where(self.elapsed >= 0, self.elapsed, np.nan)
+        return np.diff(elapsed, axis=1) / np.diff(CHECKPOINT_KM)
+
+    def save(self, path: str):
+        """
+        Save the table, and its keys if it has any, as an uncompressed .npz file.
+        """
+        keys = {} if self.keys is None else {"keys": self.keys}
+        np.savez(path, elapsed=self.elapsed, time_of_day=self.time_of_day, checkpoints=np.array(CHECKPOINTS), **keys)
+
+    @classmethod
+    def load(cls, path: str) -> "SplitTable":
+        """
+        Load a table written by save().
+        """
+        with np.load(path) as data:
+            if list(data["checkpoints"]) != CHECKPOINTS:
+                raise ValueError(f"{path} has checkpoints {list(data['checkpoints'])}, expected {CHECKPOINTS}")
+            return cls(data["elapsed"], data["time_of_day"], data["keys"] if "keys" in data else None)
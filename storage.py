@@ -0,0 +1,171 @@
+import os
+import shutil
+from typing import Iterable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Split and finish times, stored as int32 seconds
+TIME_COLUMNS = ['time_full', 'split_5k', 'split_10k', 'split_15k', 'split_20k',
+                'time_half', 'split_25k', 'split_30k', 'split_35k', 'split_40k']
+
+# Places, stored as int32
+PLACE_COLUMNS = ['place_overall', 'place_gender', 'place_age']
+
+# Low-cardinality text, stored dictionary-encoded and loaded as pandas categoricals
+CATEGORY_COLUMNS = ['nationality', 'gender', 'age_class']
+
+# Results are partitioned on disk as <root>/year=YYYY/part-NNNNN.parquet
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+
+# Arrow type of each stored column; columns not listed here are stored as text
+_TIME = pa.int32()
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Arrow -> pandas types that keep missing values without falling back to float
+_PANDAS_TYPES = {pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype()}
+
+
+def typed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast a results frame to the storage schema.
+
+    Times and places become nullable Int32 (anything non-numeric is missing),
+    nationality, gender and age class become categoricals, year becomes Int16
+    and every other column is kept as text.
+
+    Args:
+        df (pd.DataFrame): Results, e.g. a chunk of prepare_berliin.py output
+
+    Returns:
+        pd.DataFrame: The same columns with the storage dtypes
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in TIME_COLUMNS or column in PLACE_COLUMNS:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype('Int32')
+        elif column in CATEGORY_COLUMNS:
+            columns[column] = values.astype('string').astype('category')
+        elif column == 'year':
+            columns[column] = values.astype('Int16')
+        else:
+            columns[column] = values.astype('string')
+    return pd.DataFrame(columns, index=df.index)
+
+
+def arrow_type(column: str) -> pa.DataType:
+    """
+    Arrow type a column is stored as, fixed so that partitions written separately share one schema.
+    """
+    if column in TIME_COLUMNS or column in PLACE_COLUMNS:
+        return _TIME
+    if column in CATEGORY_COLUMNS:
+        return _CATEGORY
+    return pa.string()
+
+
+def partition_dir(root: str, year: int) -> str:
+    return os.path.join(root, f'year={year}')
+
+
+def write(df: pd.DataFrame, root: str, part: int = 0) -> List[int]:
+    """
+    Write a results frame into the dataset, one Parquet file per year it contains.
+
+    Files are named after `part`, so a stream of chunks written with
+    increasing part numbers adds files to the year partitions instead of
+    replacing them. The year column is stored in the directory name only.
+
+    Args:
+        df (pd.DataFrame): Results with a 'year' column
+        root (str): Dataset directory
+        part (int, optional): Number of this chunk. Defaults to 0.
+
+    Returns:
+        List[int]: Years written
+    """
+    df = typed(df)
+    years = []
+    for year, rows in df.groupby('year', sort=True):
+        directory = partition_dir(root, int(year))
+        os.makedirs(directory, exist_ok=True)
+        rows = rows.drop(columns='year')
+        schema = pa.schema([(column, arrow_type(column)) for column in rows.columns])
+        table = pa.Table.from_pandas(rows, preserve_index=False).cast(schema)
+        pq.write_table(table, os.path.join(directory, f'part-{part:05d}.parquet'))
+        years.append(int(year))
+    return years
+
+
+def clear(root: str, years: Optional[Iterable[int]] = None):
+    """
+    Remove the whole dataset, or only the partitions of the given years.
+    """
+    if years is None:
+        shutil.rmtree(root, ignore_errors=True)
+        return
+    for year in years:
+        shutil.rmtree(partition_dir(root, year), ignore_errors=True)
+
+
+def stored_years(root: str) -> List[int]:
+    """
+    Years that have a partition in the dataset, oldest first.
+    """
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name.split('=', 1)[1]) for name in os.listdir(root) if name.startswith('year='))
+
+
+def open_dataset(root: str, years: Optional[Iterable[int]] = None):
+    """
+    Open the dataset with the schema of its selected partitions unified.
+
+    Returns:
+        Tuple[ds.Dataset, Optional[ds.Expression]]: The dataset and the filter selecting the years
+    """
+    row_filter = None if years is None else ds.field('year').isin(list(years))
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+    fragments = dataset.get_fragments(filter=row_filter)
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [PARTITIONING.schema])
+    return ds.dataset(root, schema=schema, format='parquet', partitioning=PARTITIONING), row_filter
+
+
+def load(root: str, columns: Optional[List[str]] = None, years: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Load results from the dataset.
+
+    Only the requested columns are read from disk, and only the partitions of
+    the requested years are opened at all. Years may have different columns;
+    a column missing from a year loads as missing values.
+
+    Args:
+        root (str): Dataset directory
+        columns (List[str], optional): Columns to load; 'year' may be among them. Defaults to all.
+        years (Iterable[int], optional): Years to load. Defaults to all.
+
+    Returns:
+        pd.DataFrame: Results in year order with the storage dtypes
+    """
+    dataset, row_filter = open_dataset(root, years)
+    if columns is not None:
+        columns = [column for column in columns if column in dataset.schema.names]
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get)
+
+
+def batches(root: str, columns: List[str], years: Optional[Iterable[int]] = None,
+            batch_size: int = 1 << 17) -> Iterator[pa.RecordBatch]:
+    """
+    Stream columns of the dataset as Arrow record batches of at most `batch_size` rows.
+
+    Like load(), but only one batch is in memory at a time, so a whole
+    history can be scanned in constant memory. Columns missing from the
+    dataset are left out.
+    """
+    dataset, row_filter = open_dataset(root, years)
+    columns = [column for column in columns if column in dataset.schema.names]
+    yield from dataset.to_batches(columns=columns, filter=row_filter, batch_size=batch_size)
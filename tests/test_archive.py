@@ -0,0 +1,70 @@
+import gzip
+import os
+
+from archive import PageArchive
+from fetcher import FetchRequest
+
+
+def objects(root):
+    return sorted(name for _, _, names in os.walk(os.path.join(root, "objects")) for name in names)
+
+
+def test_replaced_bodies_are_deleted(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = PageArchive(root)
+    request = FetchRequest("https://example.com/results", params={"page": 1})
+    for i in range(50):
+        archive.put(request, f"<html>version {i}</html>", {"source": "test", "page": 1})
+
+    assert archive.get(request) == "<html>version 49</html>"
+    assert len(objects(root)) == 1
+    assert archive.db.execute("SELECT COUNT(*) FROM objects").fetchone()[0] == 1
+
+
+def test_shared_bodies_outlive_one_replacement(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = PageArchive(root)
+    first, second = FetchRequest("https://example.com/a"), FetchRequest("https://example.com/b")
+    archive.put(first, "same")
+    archive.put(second, "same")
+    archive.put(first, "new")
+
+    assert archive.get(second) == "same"
+    assert archive.get(first) == "new"
+    assert len(objects(root)) == 2
+
+
+def compressed_size(body):
+    return len(gzip.compress(body.encode("utf-8"), compresslevel=6))
+
+
+def test_eviction_keeps_the_newest_entries(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = PageArchive(root)
+    request = FetchRequest("https://example.com/results")
+    for i in range(10):
+        archive.put(request, f"<html>version {i}</html>" + "x" * i)
+    archive.max_bytes = compressed_size("other")
+    archive.put(FetchRequest("https://example.com/other"), "other")
+
+    # Only the page just stored fits; the replaced versions no longer count against the budget
+    assert archive.get(request) is None
+    assert archive.get(FetchRequest("https://example.com/other")) == "other"
+    assert len(objects(root)) == 1
+
+
+def test_orphans_of_older_archives_are_evicted_first(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = PageArchive(root)
+    request = FetchRequest("https://example.com/results")
+    archive.put(request, "kept")
+    # A body no entry refers to, as older versions left behind
+    archive.put(FetchRequest("https://example.com/old"), "orphan")
+    with archive.db:
+        archive.db.execute("DELETE FROM entries WHERE url = ?", ("https://example.com/old",))
+    archive.max_bytes = compressed_size("kept") + compressed_size("new")
+    archive.put(FetchRequest("https://example.com/new"), "new")
+
+    assert archive.get(request) == "kept"
+    assert archive.get(FetchRequest("https://example.com/new")) == "new"
+    assert len(objects(root)) == 2
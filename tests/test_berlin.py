@@ -0,0 +1,50 @@
+import asyncio
+import csv
+import json
+
+import berlin
+
+
+def entry(place, surname, net_time):
+    return {'cell': ['1', place, '5', surname, 'John', None, 'GER', '1980', 'M', 'M40', None, net_time, None]}
+
+
+def test_clean_batch_reads_null_place_as_missing(monkeypatch):
+    monkeypatch.setattr(berlin, 'loadAbbreviations', lambda: {'GER': 'DEU'})
+    batch = berlin.cleanBatch({'rows': [entry('2', 'Roe', '2:20:00'), entry(None, 'Doe', '2:10:00')]})
+
+    assert batch['place'].tolist() == [-1, 2]
+    assert batch['netTime'].tolist() == [7800, 8400]
+    assert batch['clockTime'].tolist() == [-1, -1]
+    assert batch['nationality'].tolist() == ['DEU', 'DEU']
+
+
+class StubFetcher:
+    """
+    Answers Berlin result pages from a dict of page -> rows; other pages fail as the Fetcher does, with ''.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def fetch(self, request):
+        page = request.tags['page']
+        if page not in self.pages:
+            return ''
+        return json.dumps({'page': page, 'total': 3, 'records': 3, 'rows': self.pages[page]})
+
+
+def test_collect_year_skips_failed_pages(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(berlin, 'loadAbbreviations', lambda: {})
+    pages = {1: [entry('1', 'Doe', '2:10:00')], 3: [entry('3', 'Roe', '2:30:00')]}
+
+    assert asyncio.run(berlin.collectYear(StubFetcher(pages), 2010)) == [2]
+    with open(tmp_path / '2010.csv', newline='') as f:
+        assert [row['place'] for row in csv.DictReader(f)] == ['1', '3']
+
+
+def test_collect_year_without_first_page(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    assert asyncio.run(berlin.collectYear(StubFetcher({}), 2010)) is None
@@ -0,0 +1,33 @@
+import csv
+
+import berlin_pipeline
+import storage
+
+
+def write(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+
+def test_files_of_the_same_year_share_a_partition(tmp_path):
+    source = tmp_path / "berlin"
+    source.mkdir()
+    write(source / "results-2017.csv", [["place_overall", "name", "time_full"], ["1", "a", "2:10:00"]])
+    write(source / "results-2018.csv", [["place_overall", "name", "time_full"], ["1", "b", "2:05:00"],
+                                        ["2", "c", "2:06:00"]])
+    write(source / "results-2018-fix.csv", [["place_overall", "name", "time_full"], ["3", "d", "2:07:00"]])
+    dataset, manifest = str(tmp_path / "dataset"), str(tmp_path / "manifest.json")
+
+    assert berlin_pipeline.run(str(source), dataset, manifest) == [2017, 2018]
+    rows = storage.load(dataset, ["year", "name", "time_full"])
+    assert sorted(zip(rows["year"], rows["name"], rows["time_full"])) == [
+        (2017, "a", 7800), (2018, "b", 7500), (2018, "c", 7560), (2018, "d", 7620)]
+
+    # Nothing changed, so nothing is rebuilt
+    assert berlin_pipeline.run(str(source), dataset, manifest) == []
+
+    # Editing one of the year's files rebuilds that year from all of its files
+    write(source / "results-2018-fix.csv", [["place_overall", "name", "time_full"], ["3", "ee", "2:08:00"]])
+    assert berlin_pipeline.run(str(source), dataset, manifest) == [2018]
+    rows = storage.load(dataset, ["name"], years=[2018])
+    assert sorted(rows["name"]) == ["b", "c", "ee"]
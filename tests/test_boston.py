@@ -0,0 +1,20 @@
+from boston import parse_max_pages
+
+
+def page(body: str) -> str:
+    return f'<html><body>{body}</body></html>'
+
+
+ENTRY = '<li class="list-group-item row"><h4 class="list-field type-fullname">Doe, Jane</h4></li>'
+
+
+def test_max_pages_is_the_link_before_next():
+    pagination = ('<ul class="pagination nav"><li><a>1</a></li><li><a>2</a></li><li><a>17</a></li>'
+                  '<li><a>&gt;</a></li></ul>')
+    assert parse_max_pages(page(f'<ul class="nav"><li><a>Home</a></li></ul>{pagination}{ENTRY}')) == 17
+
+
+def test_max_pages_without_pagination():
+    assert parse_max_pages(page(ENTRY)) == 1
+    assert parse_max_pages(page('<p>No results</p>')) == 0
+    assert parse_max_pages('') == 0
@@ -0,0 +1,15 @@
+import pytest
+
+import chicago
+
+
+def test_main_fails_when_the_crawl_raises(monkeypatch, tmp_path):
+    async def broken(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(chicago, 'scrape_races', broken)
+    monkeypatch.setattr('sys.argv', ['chicago.py', '--archive', str(tmp_path / 'archive')])
+
+    with pytest.raises(SystemExit) as exit_info:
+        chicago.main()
+    assert exit_info.value.code == 'An error occurred: disk full'
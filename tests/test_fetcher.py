@@ -0,0 +1,174 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from fetcher import ConcurrencyLimit, Fetcher, FetchRequest, TokenBucket
+
+
+@asynccontextmanager
+async def serve(handler):
+    """
+    Run a local stand-in server for the duration of the block and yield its base URL.
+    """
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        await runner.cleanup()
+
+
+def test_per_host_limit_caps_requests_in_flight():
+    state = {'in_flight': 0, 'peak': 0}
+
+    async def handler(request):
+        state['in_flight'] += 1
+        state['peak'] = max(state['peak'], state['in_flight'])
+        await asyncio.sleep(0.05)
+        state['in_flight'] -= 1
+        return web.Response(text=request.query['page'])
+
+    async def run():
+        async with serve(handler) as base:
+            async with Fetcher(per_host=2, rate=1000.0, burst=100) as fetcher:
+                return await fetcher.fetch_many(FetchRequest(f'{base}/results', params={'page': page})
+                                                for page in range(8))
+
+    assert asyncio.run(run()) == [str(page) for page in range(8)]
+    assert state['peak'] == 2
+
+
+def test_token_bucket_limits_rate_after_burst():
+    async def run():
+        bucket = TokenBucket(rate=20.0, capacity=2)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two tokens are free, the other four refill at 20 per second
+    assert asyncio.run(run()) >= 4 / 20 * 0.9
+
+
+def test_fetcher_respects_rate():
+    async def handler(request):
+        return web.Response(text='ok')
+
+    async def run():
+        async with serve(handler) as base:
+            async with Fetcher(per_host=10, rate=20.0, burst=1) as fetcher:
+                start = time.monotonic()
+                bodies = await fetcher.fetch_many(FetchRequest(base) for _ in range(5))
+                return bodies, time.monotonic() - start
+
+    bodies, elapsed = asyncio.run(run())
+    assert bodies == ['ok'] * 5
+    assert elapsed >= 4 / 20 * 0.9
+
+
+def fail_first(times: int, status: int):
+    """
+    Handler that answers `status` to the first `times` requests and 'ok' afterwards, counting requests.
+    """
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        if len(hits) <= times:
+            return web.Response(status=status)
+        return web.Response(text='ok')
+
+    return handler, hits
+
+
+def fetch_once(handler, **options) -> str:
+    async def run():
+        async with serve(handler) as base:
+            async with Fetcher(rate=1000.0, burst=100, backoff=0.01, **options) as fetcher:
+                return await fetcher.fetch(FetchRequest(f'{base}/page'))
+
+    return asyncio.run(run())
+
+
+def test_server_errors_are_retried():
+    handler, hits = fail_first(2, 503)
+    assert fetch_once(handler, retries=2) == 'ok'
+    assert len(hits) == 3
+
+
+def test_too_many_requests_is_retried():
+    handler, hits = fail_first(1, 429)
+    assert fetch_once(handler, retries=1) == 'ok'
+    assert len(hits) == 2
+
+
+def test_gives_up_after_retries():
+    handler, hits = fail_first(5, 500)
+    assert fetch_once(handler, retries=2) == ''
+    assert len(hits) == 3
+
+
+def test_client_errors_are_not_retried():
+    handler, hits = fail_first(5, 404)
+    assert fetch_once(handler, retries=3) == ''
+    assert len(hits) == 1
+
+
+def test_connection_errors_are_retried():
+    async def run():
+        # Nothing listens on the port of a server that has been shut down
+        async with serve(fail_first(0, 200)[0]) as base:
+            pass
+        async with Fetcher(rate=1000.0, burst=100, retries=2, backoff=0.01) as fetcher:
+            start = time.monotonic()
+            body = await fetcher.fetch(FetchRequest(base))
+            return body, time.monotonic() - start
+
+    body, elapsed = asyncio.run(run())
+    assert body == ''
+    # Two backoffs of at least 0.005 and 0.01 seconds
+    assert elapsed >= 0.015
+
+
+def test_adaptive_limit_grows_with_healthy_responses_up_to_maximum():
+    async def run():
+        limit = ConcurrencyLimit(2, maximum=4, adaptive=True)
+        for _ in range(20):
+            await limit.release(await limit.acquire(), 0.1, overloaded=False)
+        return limit.limit
+
+    assert asyncio.run(run()) == 4
+
+
+def test_adaptive_limit_is_cut_once_per_burst_of_failures():
+    async def run():
+        limit = ConcurrencyLimit(8, adaptive=True)
+        slots = [await limit.acquire() for _ in range(3)]
+        for slot in slots:
+            await limit.release(slot, 0.1, overloaded=True)
+        cut = limit.limit
+        await limit.release(await limit.acquire(), 0.1, overloaded=True)
+        return cut, limit.limit
+
+    assert asyncio.run(run()) == (4, 2)
+
+
+def test_client_errors_leave_adaptive_limit_alone():
+    handler, hits = fail_first(20, 404)
+
+    async def run():
+        async with serve(handler) as base:
+            async with Fetcher(per_host=8, min_per_host=2, rate=1000.0, burst=100, adaptive=True) as fetcher:
+                bodies = [await fetcher.fetch(FetchRequest(f'{base}/page')) for _ in range(10)]
+                return bodies, [limit.limit for limit in fetcher.limits.values()]
+
+    bodies, limits = asyncio.run(run())
+    assert bodies == [''] * 10
+    assert limits == [2]
@@ -0,0 +1,30 @@
+import githubChicago
+from archive import PageArchive
+from fetcher import FetchRequest
+from records import CHICAGO, ResultBatch
+
+DETAIL = ('<html><body><div class="f-start_no_text last">1234</div><div class="f-__city_state last">Chicago, IL</div>'
+          '<div class="f-time_finish_netto"><span class="time_day">10:30:00</span>'
+          '<span class="time">03:00:00</span></div></body></html>')
+
+
+def runner(details_url):
+    return ('Doe, Jane', 'woman', 'USA', '30-34', '01:30:00', '03:00:00', details_url, '', '')
+
+
+def test_replay_details_reads_the_archive_without_fetching(monkeypatch, tmp_path):
+    def no_fetcher(*args, **kwargs):
+        raise AssertionError('replay must not fetch')
+
+    monkeypatch.setattr(githubChicago, 'Fetcher', no_fetcher)
+    archived_url = githubChicago.BASE_URL + '?content=detail&idp=A1'
+    archive = PageArchive(str(tmp_path / 'archive'))
+    archive.put(FetchRequest(archived_url), DETAIL, {'source': 'chicago-detail', 'url': archived_url})
+
+    all_runners = ResultBatch(CHICAGO)
+    all_runners.append(runner(githubChicago.BASE_URL + '?content=detail&idp=B2'))
+    all_runners.append(runner(archived_url))
+    splits = githubChicago.replay_details(all_runners, archive)
+
+    assert [(record['bib'], record['city_state']) for record in all_runners] == [('', ''), ('1234', 'Chicago, IL')]
+    assert splits.column('finish').tolist() == [-1, 3 * 3600]
@@ -0,0 +1,36 @@
+from identity import Appearance, IdentityIndex, full_name_hash, name_hash
+
+
+def appearance(source, year, name, yob=None):
+    return Appearance(source, year, name_hash(*name), yob, yob, None, None)
+
+
+def runners(index, name):
+    return sorted((runner_id, [race[:2] for race in index.races(runner_id)])
+                  for runner_id, _, _ in index.find(f"{name[1]}, {name[0]}"))
+
+
+def test_name_hash_ignores_sex_and_country_suffixes():
+    assert full_name_hash("García, Kofi (M)") == full_name_hash("García, Kofi (USA)") == name_hash("Kofi", "García")
+
+
+def test_namesakes_are_told_apart_by_birth_year(tmp_path):
+    index = IdentityIndex(str(tmp_path / 'runners.sqlite'))
+    john = ('John', 'Smith')
+    index.link([appearance('berlin', 2010, john, 1970), appearance('berlin', 2010, john, 1985),
+                appearance('berlin', 2011, john, 1985)])
+
+    assert [len(races) for _, races in runners(index, john)] == [1, 2]
+
+
+def test_ageless_appearance_joins_only_a_unique_namesake(tmp_path):
+    index = IdentityIndex(str(tmp_path / 'runners.sqlite'))
+    jane, john = ('Jane', 'Doe'), ('John', 'Smith')
+    index.link([appearance('berlin', 2010, jane, 1980),
+                appearance('berlin', 2010, john, 1970), appearance('berlin', 2010, john, 1985)])
+    index.link([appearance('boston', 2011, jane), appearance('boston', 2011, john)])
+
+    # The only Jane Doe gets the Boston finish; which John Smith ran Boston is unknown
+    assert [races for _, races in runners(index, jane)] == [[('berlin', 2010), ('boston', 2011)]]
+    assert [races for _, races in runners(index, john)] == [[('berlin', 2010)], [('berlin', 2010)],
+                                                           [('boston', 2011)]]
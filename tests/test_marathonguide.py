@@ -0,0 +1,79 @@
+import asyncio
+
+from checkpoint import CrawlCheckpoint
+from marathonguide import scrape_race
+from records import MARATHONGUIDE, ResultBatch
+
+
+def results_page(begin: int, rows: int) -> str:
+    cells = ''.join(f'<tr><td>Runner {begin + i} (M)</td><td>3:00:00</td><td>{begin + i}</td><td>{begin + i}/1</td>'
+                    f'<td>M30-34</td><td>USA</td><td>Y</td></tr>' for i in range(rows))
+    return f'<html><body><table class="colordataTable"><tr><th>Name</th></tr>{cells}</table></body></html>'
+
+
+class StubFetcher:
+    """
+    Answers each range from a dict of begin -> HTML; ranges listed in `failing` fail as the Fetcher does, with ''.
+    """
+
+    def __init__(self, pages, failing=()):
+        self.pages = pages
+        self.failing = set(failing)
+
+    async def fetch(self, request):
+        begin = request.params['Begin']
+        return '' if begin in self.failing else self.pages.get(begin, results_page(begin, 0))
+
+
+def scrape(fetcher, checkpoint, max=300):
+    return asyncio.run(scrape_race(fetcher, '123', max, 2024, checkpoint))
+
+
+def test_complete_crawl_returns_batch(tmp_path):
+    pages = {1: results_page(1, 100), 101: results_page(101, 100), 201: results_page(201, 50)}
+    results, complete = scrape(StubFetcher(pages), CrawlCheckpoint(str(tmp_path), '123', 2024))
+
+    assert complete
+    assert isinstance(results, ResultBatch) and results.fields == MARATHONGUIDE
+    assert len(results) == 250
+    assert [record['place_overall'] for record in results] == list(range(1, 251))
+
+
+def test_failed_range_is_incomplete_and_resumes(tmp_path):
+    pages = {1: results_page(1, 100), 101: results_page(101, 100), 201: results_page(201, 50)}
+    results, complete = scrape(StubFetcher(pages, failing={101}), CrawlCheckpoint(str(tmp_path), '123', 2024))
+
+    assert not complete
+    assert len(results) == 150
+
+    # The next run fetches only the outstanding range
+    fetcher = StubFetcher({101: pages[101]}, failing={1, 201})
+    results, complete = scrape(fetcher, CrawlCheckpoint(str(tmp_path), '123', 2024))
+
+    assert complete
+    assert [record['place_overall'] for record in results] == list(range(1, 251))
+
+
+def test_failure_past_a_short_page_is_complete(tmp_path):
+    pages = {1: results_page(1, 100), 101: results_page(101, 20)}
+    results, complete = scrape(StubFetcher(pages, failing={201}), CrawlCheckpoint(str(tmp_path), '123', 2024))
+
+    assert complete
+    assert len(results) == 120
+
+
+def test_empty_page_before_max_is_retried(tmp_path):
+    pages = {1: results_page(1, 100), 101: results_page(101, 0), 201: results_page(201, 50)}
+    checkpoint = CrawlCheckpoint(str(tmp_path), '123', 2024)
+    results, complete = scrape(StubFetcher(pages), checkpoint)
+
+    # The race is not cut short at the empty page
+    assert not complete
+    assert len(results) == 150
+    assert not checkpoint.is_done(101)
+
+    fetcher = StubFetcher({101: results_page(101, 100)}, failing={1, 201})
+    results, complete = scrape(fetcher, CrawlCheckpoint(str(tmp_path), '123', 2024))
+
+    assert complete
+    assert [record['place_overall'] for record in results] == list(range(1, 251))
@@ -0,0 +1,26 @@
+import csv
+
+from merge_berlin import merge
+
+
+def write(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+
+def test_files_of_the_same_year_are_all_merged(tmp_path):
+    source = tmp_path / "berlin"
+    source.mkdir()
+    write(source / "results-2017.csv", [["place", "name"], ["1", "a"]])
+    write(source / "results-2018.csv", [["place", "name"], ["1", "b"]])
+    write(source / "results-2018-fix.csv", [["place", "time"], ["2", "2:10:00"]])
+    write(source / "results-2018.v2.csv", [["place", "name"], ["3", "c"]])
+    output = tmp_path / "merged.csv"
+
+    assert merge(str(source), str(output), workers=2) == 4
+    with open(output, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["place", "name", "year", "time"]
+    assert sorted(rows[1:]) == [["1", "a", "2017", ""], ["1", "b", "2018", ""],
+                                ["2", "", "2018", "2:10:00"], ["3", "c", "2018", ""]]
+    assert not list(tmp_path.glob("merged.csv.part-*"))
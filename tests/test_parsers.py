@@ -0,0 +1,47 @@
+import pytest
+
+from parsers import BACKENDS, ParserBackend, marathonguide_container, marathonguide_row
+from records import MARATHONGUIDE, ResultBatch
+
+
+def test_marathonguide_name_cell_splits_into_name_and_sex():
+    results = ResultBatch(MARATHONGUIDE)
+    for name in ('Doe, Jane (F)', 'Roe, Rick (M45)', 'Poe, Pat'):
+        results.append(marathonguide_row([name, '3:00:00', '1', '1/1', 'F30-34', 'USA', 'Y'], 2024))
+
+    assert [(record['name'], record['sex']) for record in results] == [
+        ('Doe, Jane', 'F'), ('Roe, Rick', 'M'), ('Poe, Pat', 'N/A')]
+
+
+def test_marathonguide_rows_without_bq_column():
+    html = ('<table class="colordataTable"><tr><th>Name</th></tr>'
+            '<tr><td>Doe, Jane (F)</td><td>3:00:00</td><td>1</td><td>1/1</td><td>F30-34</td><td>USA</td></tr>'
+            '<tr><td>Roe, Rick (M)</td><td>3:01:00</td><td>2</td><td>1/1</td><td>M30-34</td><td>USA</td>'
+            '<td>BQ</td></tr>'
+            '<tr><td>Too short</td><td>3:02:00</td></tr></table>')
+    for backend in BACKENDS.values():
+        assert [list(record) for record in backend.marathonguide(html, 2024)] == [
+            ['2024', 'Doe, Jane', 'F', '3:00:00', '1', '1', '1', 'F30-34', 'USA', 'N/A'],
+            ['2024', 'Roe, Rick', 'M', '3:01:00', '2', '1', '1', 'M30-34', 'USA', 'BQ'],
+        ], backend.name
+
+
+def test_backend_must_implement_every_parser():
+    class BostonOnly(ParserBackend):
+        def boston(self, html_content, year):
+            return ResultBatch([])
+
+    with pytest.raises(TypeError):
+        BostonOnly()
+
+
+def test_marathonguide_container_keeps_nested_tables():
+    table = ('<TABLE border=1 class=colordataTable><tr><th>Name</th></tr>'
+             '<tr><td>Doe, Jane (F)</td><td>3:00:00</td><td>1</td><td>1/1</td><td>F30-34</td>'
+             '<td><table><tr><td>USA</td></tr></table></td><td>Y</td></tr></TABLE>')
+    html = f'<html><body><table><tr><td>Menu</td></tr></table>{table}<table><tr><td>Ads</td></tr></table></body></html>'
+
+    assert marathonguide_container(html) == table
+    assert marathonguide_container('<table><tr><td>Menu</td></tr></table>') == '<table><tr><td>Menu</td></tr></table>'
+    rows = [[list(record) for record in backend.marathonguide(html, 2024)] for backend in BACKENDS.values()]
+    assert rows[0] == rows[1] and len(rows[0]) == 1
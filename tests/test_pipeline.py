@@ -0,0 +1,32 @@
+import asyncio
+
+from pipeline import RequeuingJobs
+
+
+def test_failed_jobs_are_requeued_until_retries_run_out():
+    async def run():
+        jobs = RequeuingJobs(['a', 'b'], retries=2, backoff=0.001)
+        seen, requeued = [], []
+        async for job in jobs:
+            seen.append(job)
+            # 'a' keeps failing, 'b' fails once
+            ok = job == 'b' and 'b' in seen[:-1]
+            if jobs.resolve(job, ok):
+                requeued.append(job)
+        return seen, requeued
+
+    seen, requeued = asyncio.run(run())
+    assert sorted(seen) == ['a', 'a', 'a', 'b', 'b']
+    assert sorted(requeued) == ['a', 'a', 'b']
+
+
+def test_successful_jobs_end_the_source():
+    async def run():
+        jobs = RequeuingJobs(range(3), retries=2, backoff=0.001)
+        seen = []
+        async for job in jobs:
+            seen.append(job)
+            assert not jobs.resolve(job, True)
+        return seen
+
+    assert asyncio.run(run()) == [0, 1, 2]
@@ -0,0 +1,41 @@
+import csv
+import os
+
+from sink import OrderedCsvSink
+
+
+def read(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_pages_arriving_out_of_order_are_written_in_order(tmp_path):
+    output_file = str(tmp_path / 'results.csv')
+    sink = OrderedCsvSink(output_file, ['year', 'page'], [2021, 2020], max_buffered_pages=1)
+
+    # Pages ahead of the next one in line pile up and are spilled to disk
+    sink.add(2021, 1, [[2021, 1]])
+    sink.add(2020, 3, [[2020, 3]])
+    sink.add(2020, 2, [[2020, 2], [2020, 2]])
+    assert os.listdir(output_file + '.spill')
+    sink.set_page_count(2021, 1)
+    sink.set_page_count(2020, 3)
+    assert read(output_file) == [['year', 'page']]
+
+    # A failed page is added without rows, which lets the rest through
+    sink.add(2020, 1, None)
+    assert sink.close() == 4
+    assert read(output_file) == [['year', 'page'], ['2020', '2'], ['2020', '2'], ['2020', '3'], ['2021', '1']]
+    assert not os.path.exists(output_file + '.spill')
+
+
+def test_pages_of_an_undiscovered_year_wait(tmp_path):
+    output_file = str(tmp_path / 'results.csv')
+    sink = OrderedCsvSink(output_file, ['year', 'page'], [2020, 2021])
+    sink.set_page_count(2021, 1)
+    sink.add(2021, 1, [[2021, 1]])
+    assert read(output_file) == [['year', 'page']]
+
+    sink.set_page_count(2020, 0)
+    assert read(output_file) == [['year', 'page'], ['2021', '1']]
+    assert sink.close() == 1
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+import storage
+from records import MARATHONGUIDE, ResultBatch
+from prepare_berliin import prepare, times_to_seconds
+from timeconv import MISSING, format_hms, hms_to_seconds, parse_hms
+
+
+def test_padded_and_unpadded_times():
+    values = ['02:10:00', '2:10:00', '1:2:3', ' 2:10:00 ', '100:05:00', '00:00:00']
+    assert hms_to_seconds(values).tolist() == [7800, 7800, 3723, 7800, 360300, 0]
+
+
+def test_missing_and_malformed_times():
+    values = np.array([None, np.nan, '', '-', 'x:y:z', '1:60:00', '1:00', '12:00:00.5', '9999999:00:00'],
+                      dtype=object)
+    assert hms_to_seconds(values).tolist() == [MISSING] * len(values)
+
+
+def test_column_matches_single_values():
+    values = ['3:59:59', '10:00:01', '0:00:00', 'N/A', '1:2:3', ' 2:10:00', '100:05:00', '1:60:00',
+              '         2:10:00', None]
+    assert hms_to_seconds(values).tolist() == [parse_hms(value) for value in values]
+    assert parse_hms('         2:10:00') == 7800
+
+
+def test_batch_reads_times_like_a_column():
+    values = ['1:2:3', ' 2:10:00', '2:10:00', '02:10:00', 'N/A']
+    batch = ResultBatch(MARATHONGUIDE)
+    for value in values:
+        batch.append([2024, 'Doe, Jane', 'F', value, '1', '1', '1', 'F30-34', 'USA', 'N/A'])
+
+    assert batch.column('finish').tolist() == hms_to_seconds(values).tolist()
+    # Odd cells do not decide the padding, and are written as they came
+    assert [record[3] for record in batch.rows()] == values
+
+
+def test_prepare_keeps_unpadded_times():
+    column = pd.Series(['1:2:3', '02:10:00', '00:00:00', None], dtype=object)
+    assert times_to_seconds(column).tolist() == [3723, 7800, pd.NA, pd.NA]
+
+
+def test_format_hms():
+    assert [format_hms(7800), format_hms(7800, padded=True), format_hms(36000, padded=True), format_hms(MISSING)] \
+        == ['2:10:00', '02:10:00', '10:00:00', '']
+
+
+def test_prepare_types_columns_the_same_in_every_chunk(tmp_path):
+    source = tmp_path / 'merged.csv'
+    source.write_text('year;bib;place_overall;time_full\n'
+                      '2018;101;1;2:01:39\n2018;;2;2:05:00\n2018;103;3;1:2:3\n2019;F7;1;2:02:00\n')
+    output = str(tmp_path / 'dataset')
+
+    assert prepare(str(source), output, chunk_size=2) == 4
+    rows = storage.load(output, ['year', 'bib', 'place_overall', 'time_full'])
+    assert rows['bib'].fillna('-').tolist() == ['101', '-', '103', 'F7']
+    assert rows['place_overall'].tolist() == [1, 2, 3, 1]
+    assert rows['time_full'].tolist() == [7299, 7500, 3723, 7320]